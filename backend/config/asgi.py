@@ -4,18 +4,23 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 from notifications.routing import websocket_urlpatterns
+from gallery.routing import websocket_urlpatterns as gallery_websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 django_asgi_app = get_asgi_application()
 
+# load the similarity index now rather than on the first search (gallery/vector_index.py)
+from gallery.vector_index import warm_index
+warm_index()
+
 # Protocol type router handles diff types of requests
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
             URLRouter(
-                websocket_urlpatterns
+                websocket_urlpatterns + gallery_websocket_urlpatterns
             )
         )
     ),
@@ -0,0 +1,62 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+# versioned cache keys: every cached response is keyed by the current version of
+# the namespaces it depends on (e.g. 'event:4', 'people'). invalidating is a single
+# atomic incr on the namespace, stale entries are simply never read again and age out.
+
+def version_key(namespace):
+    return f"cache_version:{namespace}"
+
+def get_versions(namespaces):
+    keys = [version_key(ns) for ns in namespaces]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            # seeded from the clock so a counter that got evicted can never
+            # come back at a value some stale entry was stored under
+            cache.add(key, int(time.time() * 1000), None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+def _incr_versions(namespaces):
+    for ns in namespaces:
+        try:
+            cache.incr(version_key(ns))
+        except ValueError:
+            # never read yet, so nothing can be cached under it
+            pass
+
+def bump(*namespaces):
+    # after commit, otherwise a concurrent read could cache the old rows under the new version
+    transaction.on_commit(lambda: _incr_versions(namespaces))
+
+def versioned_key(prefix, namespaces, variant):
+    versions = '.'.join(str(v) for v in get_versions(namespaces))
+    digest = hashlib.md5(variant.encode()).hexdigest()
+    return f"{prefix}:{versions}:{digest}"
+
+def cached_response(request, prefix, namespaces, build, per_user=False, timeout=None):
+    # full path covers query params / pagination, host covers absolute media urls
+    variant = f"{request.get_full_path()}|{request.get_host()}"
+    if per_user:
+        variant += f"|{request.user.id if request.user.is_authenticated else 'anon'}"
+    key = versioned_key(prefix, namespaces, variant)
+
+    data = cache.get(key)
+    if data is not None:
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout or settings.API_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
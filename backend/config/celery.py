@@ -1,10 +1,25 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_shutdown
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+# priority lanes inside a queue (redis: 0 is served first, 9 last)
+# interactive uploads outrank anything a backfill queues
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BACKFILL = 9
+
 app = Celery('config')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+def close_metrics(**kwargs):
+    # drops the exiting process' metrics file (config/metrics.py)
+    from config import metrics
+    metrics.close()
+
+worker_process_shutdown.connect(close_metrics)
+worker_shutdown.connect(close_metrics)
@@ -0,0 +1,28 @@
+import asyncio
+import os
+import threading
+from channels.layers import get_channel_layer
+
+# sync code (views, signals, celery tasks) used to call async_to_sync(group_send)
+# per message. that runs each call on a fresh event loop, and channels_redis keeps
+# its connection pools per loop, so every notification opened a new redis connection.
+# instead each process keeps one background loop and reuses its pool.
+
+_loop = None
+_loop_pid = None
+_lock = threading.Lock()
+
+def _get_loop():
+    global _loop, _loop_pid
+    with _lock:
+        # forked celery children inherit the loop object but not its thread
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='channel-layer-loop', daemon=True).start()
+            _loop_pid = os.getpid()
+        return _loop
+
+def group_send(group, message, timeout=5):
+    channel_layer = get_channel_layer()
+    future = asyncio.run_coroutine_threadsafe(channel_layer.group_send(group, message), _get_loop())
+    return future.result(timeout)
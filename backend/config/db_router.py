@@ -0,0 +1,47 @@
+import contextvars
+import random
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+
+# primary/replica routing. writes always go to 'default'; reads go to a replica
+# only inside read_from_replica(), which ReplicaRoutingMiddleware (config/middleware.py)
+# opens for safe requests on the read heavy endpoints. celery tasks, websocket
+# consumers and management commands never open it, so they stay on the primary.
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+@contextmanager
+def read_from_replica():
+    replicas = settings.DATABASE_REPLICAS
+    token = _read_alias.set(random.choice(replicas) if replicas else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+# read-your-writes: after a user writes, their reads stay on the primary for a
+# few seconds so they never see a replica that hasn't caught up yet
+def pin_key(user_id):
+    return f"db:pin:{user_id}"
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id)) is not None
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # None means no opinion -> 'default'
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,218 @@
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# tiny metrics facade with a pluggable sink (settings.METRICS_SINK)
+#
+#   metrics.incr('photo_tasks_total', outcome='success')
+#   metrics.observe('photo_stage_seconds', 0.12, stage='exif')
+#   with metrics.timer('photo_stage_seconds', stage='thumbnail'): ...
+#
+# sinks: NullSink (default), StatsdSink (udp, dogstatsd style tags) and
+# PrometheusTextSink (per process .prom files for node_exporter's textfile collector)
+
+class NullSink:
+    def __init__(self, **options):
+        pass
+
+    def incr(self, name, value, labels):
+        pass
+
+    def observe(self, name, value, labels):
+        pass
+
+    def gauge(self, name, value, labels):
+        pass
+
+    def flush(self, force=False):
+        pass
+
+    def close(self):
+        pass
+
+class StatsdSink(NullSink):
+    def __init__(self, statsd_host='127.0.0.1', statsd_port=8125, prefix='memorise.', **options):
+        self.address = (statsd_host, int(statsd_port))
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, name, value, kind, labels):
+        tags = '|#' + ','.join(f'{k}:{v}' for k, v in sorted(labels.items())) if labels else ''
+        try:
+            self.sock.sendto(f'{self.prefix}{name}:{value}|{kind}{tags}'.encode(), self.address)
+        except OSError:
+            pass # metrics must never break the task
+
+    def incr(self, name, value, labels):
+        self._send(name, value, 'c', labels)
+
+    def observe(self, name, value, labels):
+        # statsd timers are in milliseconds
+        self._send(name, round(value * 1000, 3), 'ms', labels)
+
+    def gauge(self, name, value, labels):
+        self._send(name, value, 'g', labels)
+
+class PrometheusTextSink(NullSink):
+    def __init__(self, textfile_dir='', flush_interval=10, **options):
+        self.path = os.path.join(textfile_dir or '.', f'memorise_{os.getpid()}.prom')
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.summaries = {} # (name, labels) -> [count, sum]
+        self.gauges = {}
+        self.last_flush = 0.0
+        self.write_lock = threading.Lock()
+        self.timer = None
+        self.sweep()
+
+    def incr(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            entry = self.summaries.setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += value
+
+    def gauge(self, name, value, labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self):
+        def fmt(name, labels, value):
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            return f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}'
+
+        lines, typed = [], set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} counter')
+                    typed.add(name)
+                lines.append(fmt(name, labels, value))
+            for (name, labels), (count, total) in sorted(self.summaries.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} summary')
+                    typed.add(name)
+                lines.append(fmt(f'{name}_count', labels, count))
+                lines.append(fmt(f'{name}_sum', labels, round(total, 6)))
+            for (name, labels), value in sorted(self.gauges.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} gauge')
+                    typed.add(name)
+                lines.append(fmt(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self, force=False):
+        # at most one write per flush_interval. a flush that's throttled arms a timer,
+        # so the tail of a burst is written even if no other task comes along
+        with self.write_lock:
+            remaining = self.flush_interval - (time.monotonic() - self.last_flush)
+            if remaining > 0 and not force:
+                if self.timer is None:
+                    self.timer = threading.Timer(remaining, self.timed_flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.last_flush = time.monotonic()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # write + rename so the collector never reads a half written file
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.path)
+
+    def timed_flush(self):
+        try:
+            self.flush(force=True)
+        except OSError:
+            pass # metrics must never break the worker
+
+    def close(self):
+        # the process is exiting (worker_process_shutdown), its file would otherwise
+        # keep being collected next to the replacement child's
+        with self.write_lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def sweep(self):
+        # files of processes that died without close() (a child killed by the parent)
+        directory = os.path.dirname(self.path)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            match = re.fullmatch(r'memorise_(\d+)\.prom', name)
+            if not match or int(match.group(1)) == os.getpid():
+                continue
+            try:
+                os.kill(int(match.group(1)), 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+            except PermissionError:
+                pass # alive, owned by someone else
+
+_sink = None
+_sink_pid = None
+
+def get_sink():
+    global _sink, _sink_pid
+    # celery prefork children get their own sink (and their own .prom file)
+    if _sink is None or _sink_pid != os.getpid():
+        _sink = import_string(settings.METRICS_SINK)(**settings.METRICS_OPTIONS)
+        _sink_pid = os.getpid()
+    return _sink
+
+def incr(name, value=1, **labels):
+    get_sink().incr(name, value, labels)
+
+def observe(name, value, **labels):
+    get_sink().observe(name, value, labels)
+
+def gauge(name, value, **labels):
+    get_sink().gauge(name, value, labels)
+
+def flush(force=False):
+    try:
+        get_sink().flush(force)
+    except OSError:
+        pass
+
+def close():
+    global _sink
+    # only this process' own sink, a forked child never closes its parent's
+    if _sink is not None and _sink_pid == os.getpid():
+        try:
+            _sink.close()
+        except OSError:
+            pass
+        _sink = None
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
@@ -0,0 +1,197 @@
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+from .db_router import read_from_replica, pin_to_primary, is_pinned
+
+logger = logging.getLogger('perf')
+
+# opt-in per request instrumentation, turned on with PERF_INSTRUMENTATION=true.
+# when it's off the middleware removes itself at startup, so it costs nothing.
+#
+# every /api/ response gets a Server-Timing header + one json log line with:
+#   sql query count/time, duplicate query fingerprints (N+1s), serializer time, response size
+# staff can send "X-Profile: 1" to dump a cProfile of that single request into PERF_PROFILE_DIR
+
+_serializer_time = contextvars.ContextVar('serializer_time', default=None)
+_serializer_depth = contextvars.ContextVar('serializer_depth', default=0)
+_timer_installed = False
+
+def _timed_data(prop):
+    def getter(self):
+        timings = _serializer_time.get()
+        depth = _serializer_depth.get()
+        # only the outermost .data is timed, nested serializers are part of it
+        if timings is None or depth:
+            return prop.fget(self)
+
+        token = _serializer_depth.set(depth + 1)
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            timings.append(time.perf_counter() - started)
+            _serializer_depth.reset(token)
+    return property(getter)
+
+def install_serializer_timer():
+    global _timer_installed
+    if _timer_installed:
+        return
+    serializers.Serializer.data = _timed_data(serializers.Serializer.data)
+    serializers.ListSerializer.data = _timed_data(serializers.ListSerializer.data)
+    _timer_installed = True
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# ? = a literal replaced above, %s = a placeholder as the postgres backend sends it
+_in_lists = re.compile(r"IN \((?:(?:\?|%s), )*(?:\?|%s)\)")
+
+def fingerprint(sql):
+    # same query shape with different parameters -> same fingerprint
+    return _in_lists.sub('IN (...)', _literals.sub('?', sql))
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+class RequestProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.path_prefixes = tuple(settings.PERF_INSTRUMENTATION_PATHS)
+        install_serializer_timer()
+
+    def __call__(self, request):
+        if not request.path.startswith(self.path_prefixes):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        timings = []
+        token = _serializer_time.set(timings)
+        profiler = cProfile.Profile() if self.wants_profile(request) else None
+
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # every alias, reads may be going to a replica
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(recorder))
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            _serializer_time.reset(token)
+        total = time.perf_counter() - started
+
+        serializer_time = sum(timings)
+        size = len(response.content) if not response.streaming else None
+        duplicates = {sql: n for sql, n in recorder.fingerprints.items() if n > 1}
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries, {len(duplicates)} repeated"',
+            f'ser;dur={serializer_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+        if profiler:
+            response['X-Profile-File'] = self.dump_profile(profiler, request)
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'sql_count': recorder.count,
+            'sql_ms': round(recorder.duration * 1000, 2),
+            'serializer_ms': round(serializer_time * 1000, 2),
+            'response_bytes': size,
+            # worst offenders first, these are the N+1 candidates
+            'repeated_queries': [
+                {'sql': sql[:300], 'count': n}
+                for sql, n in sorted(duplicates.items(), key=lambda item: -item[1])[:5]
+            ],
+        }))
+        return response
+
+    def wants_profile(self, request):
+        if request.headers.get('X-Profile') != '1':
+            return False
+        # drf authenticates inside the view, so check the jwt here (only when asked to profile)
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+        return bool(result and result[0].is_staff)
+
+    def dump_profile(self, profiler, request):
+        os.makedirs(settings.PERF_PROFILE_DIR, exist_ok=True)
+        name = f"{int(time.time() * 1000)}_{request.method}_{request.path.strip('/').replace('/', '_') or 'root'}.prof"
+        profiler.dump_stats(os.path.join(settings.PERF_PROFILE_DIR, name))
+        return name
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def token_user_id(request):
+    # identity straight from the jwt claims, no db hit
+    from rest_framework_simplejwt.tokens import AccessToken
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        return AccessToken(header[7:]).get(jwt_settings.USER_ID_CLAIM)
+    except Exception:
+        return None
+
+# sends safe reads on the gallery/interactions/notifications endpoints to a read
+# replica, and pins a user to the primary for REPLICA_PIN_SECONDS after they write
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.path_prefixes = tuple(settings.REPLICA_READ_PATHS)
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS:
+            if not request.path.startswith(self.path_prefixes):
+                return self.get_response(request)
+            user_id = token_user_id(request)
+            if user_id and is_pinned(user_id):
+                return self.get_response(request)
+            with read_from_replica():
+                return self.get_response(request)
+
+        response = self.get_response(request)
+        user_id = token_user_id(request)
+        if user_id and response.status_code < 400:
+            pin_to_primary(user_id)
+        return response
+
@@ -0,0 +1,21 @@
+import os
+import threading
+from redis import ConnectionPool
+
+# django's RedisCache builds a connection pool per cache instance, and cache
+# instances are per thread, so every worker thread ended up with its own pool.
+# this hands out one pool per (process, url, options); redis-py pools are
+# thread safe and reset themselves after a fork.
+
+class SharedConnectionPool(ConnectionPool):
+    _shared = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        key = (os.getpid(), url, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+        with cls._lock:
+            pool = cls._shared.get(key)
+            if pool is None:
+                pool = cls._shared[key] = super().from_url(url, **kwargs)
+            return pool
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import copy
 import os
+import sys
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,6 +66,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.middleware.RequestProfilingMiddleware',  # no-op unless PERF_INSTRUMENTATION is on
+    'config.middleware.ReplicaRoutingMiddleware',  # no-op unless read replicas are configured
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -75,10 +79,55 @@ CHANNEL_LAYERS = {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
             "hosts": [('127.0.0.1', 6379)],
+            # backpressure: a slow socket buffers at most this many messages,
+            # anything past it is dropped and recovered via last_seen replay
+            "capacity": 100,
+            "expiry": 30,
         },
     },
 }
 
+# server side heartbeat for notification sockets (seconds)
+WEBSOCKET_HEARTBEAT_INTERVAL = int(os.getenv('WEBSOCKET_HEARTBEAT_INTERVAL', '25'))
+WEBSOCKET_IDLE_TIMEOUT = int(os.getenv('WEBSOCKET_IDLE_TIMEOUT', '75'))
+
+# shared cache (redis db 1) so web, celery and daphne processes see the same
+# unread counters and recent-notification buffers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_CACHE_URL', 'redis://127.0.0.1:6379/1'),
+        'OPTIONS': {
+            # one pool per process instead of one per thread (config/redis_pool.py)
+            'pool_class': 'config.redis_pool.SharedConnectionPool',
+            'max_connections': int(os.getenv('REDIS_CACHE_MAX_CONNECTIONS', '50')),
+            'health_check_interval': 30,
+            'socket_keepalive': True,
+            'retry_on_timeout': True,
+        },
+    }
+}
+
+# the test runner (or CACHE_BACKEND=locmem) gets an in-process cache, no redis needed
+if 'test' in sys.argv or os.getenv('CACHE_BACKEND') == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'memorise',
+        }
+    }
+
+# cached api responses (config/cache_utils.py), invalidated by model signals
+# through versioned keys, the timeout only bounds how long orphaned entries linger
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', '600'))
+
+# public share pages (gallery/sharing.py): server side copy is versioned, so it can live
+# long; browsers/CDNs can't be purged when a link is made private, so keep theirs short
+SHARE_CACHE_TIMEOUT = int(os.getenv('SHARE_CACHE_TIMEOUT', '86400'))
+SHARE_MAX_AGE = int(os.getenv('SHARE_MAX_AGE', '60'))
+SHARE_S_MAXAGE = int(os.getenv('SHARE_S_MAXAGE', '300'))
+SHARE_STALE_WHILE_REVALIDATE = int(os.getenv('SHARE_STALE_WHILE_REVALIDATE', '60'))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -128,6 +177,40 @@ DATABASES = {
         'PORT': os.getenv('POSTGRES_PORT', '5432'),
     }
 }
+
+# connection reuse: either a psycopg pool per process (DB_POOL=true) or
+# persistent connections kept for DB_CONN_MAX_AGE seconds; django can't do both
+if os.getenv('DB_POOL', 'False').lower() == 'true':
+    from psycopg_pool import ConnectionPool  # only needed when pooling is on
+
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX', '10')),
+            'max_idle': 300,
+            'check': ConnectionPool.check_connection,  # health check on checkout
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    # ping a reused connection before handing it to a request, drops dead ones
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# read replicas: DB_REPLICA_HOSTS=10.0.0.5,10.0.0.6 adds 'replica_1', 'replica_2'
+# (same credentials as default). DB_REPLICA_HOSTS=127.0.0.1 gives a second alias
+# on the local db to try the routing out without a real replica.
+DATABASE_REPLICAS = []
+for i, host in enumerate([h.strip() for h in os.getenv('DB_REPLICA_HOSTS', '').split(',') if h.strip()], start=1):
+    alias = f'replica_{i}'
+    DATABASES[alias] = copy.deepcopy(DATABASES['default'])
+    DATABASES[alias]['HOST'] = host
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+REPLICA_READ_PATHS = ['/api/gallery/', '/api/interactions/', '/api/notifications/', '/share/']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
 # using Jwt Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -203,8 +286,123 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0' 
 CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
+CELERY_BROKER_POOL_LIMIT = 10  # broker connections are pooled and reused per worker
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'  # Must match task serializer
 CELERY_TIMEZONE = TIME_ZONE  # Use Django's timezone setting
 CELERY_ENABLE_UTC = True
+
+# separate queues so thumbnails users are waiting for never sit behind
+# re-encodes, model inference or backfills. run one worker per queue, e.g.
+#   celery -A config worker -Q thumbnails -c 4 --prefetch-multiplier 4 -n thumbs@%h
+#   celery -A config worker -Q encode -c 2 --prefetch-multiplier 1 -n encode@%h
+#   celery -A config worker -Q ml -c 1 --prefetch-multiplier 1 -n ml@%h
+#   celery -A config worker -Q backfill -c 1 --prefetch-multiplier 1 -n backfill@%h
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_ROUTES = {
+    'gallery.tasks.process_photo': {'queue': 'thumbnails'},
+    'gallery.tasks.flush_event_feed': {'queue': 'thumbnails'},
+    # deferred uploads are what users are waiting on, never behind backfills
+    'gallery.tasks.drain_deferred_photos': {'queue': 'thumbnails'},
+    'gallery.tasks.watermark_photo': {'queue': 'encode'},
+    'gallery.tasks.tag_photo': {'queue': 'ml'},
+    'gallery.tasks.cluster_event_scenes': {'queue': 'backfill'},
+    'gallery.tasks.delete_photos': {'queue': 'backfill'},
+    'gallery.tasks.train_vector_index': {'queue': 'backfill'},
+}
+# long tasks should not be hoarded by one worker while others sit idle,
+# the thumbnails worker overrides this on its command line
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BEAT_SCHEDULE = {
+    # picks up uploads deferred by admission control once there's room
+    'drain-deferred-photos': {
+        'task': 'gallery.tasks.drain_deferred_photos',
+        'schedule': 30.0,
+    },
+}
+# redis emulates priorities with sub-queues, needed for interactive vs backfill lanes.
+# with acks_late an unacked task is handed out again after visibility_timeout, it has
+# to outlast the longest task (a mass delete of a whole event, a backfill chunk)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'visibility_timeout': int(os.getenv('CELERY_VISIBILITY_TIMEOUT', str(6 * 60 * 60))),
+}
+
+# opt-in request profiling (config/middleware.py): Server-Timing headers + json log lines
+PERF_INSTRUMENTATION = os.getenv('PERF_INSTRUMENTATION', 'False').lower() == 'true'
+PERF_INSTRUMENTATION_PATHS = ['/api/']
+PERF_PROFILE_DIR = BASE_DIR / 'profiles'  # staff "X-Profile: 1" dumps land here
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'perf': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# metrics sink for the processing pipeline (config/metrics.py)
+# 'config.metrics.StatsdSink' or 'config.metrics.PrometheusTextSink' to export
+METRICS_SINK = os.getenv('METRICS_SINK', 'config.metrics.NullSink')
+METRICS_OPTIONS = {
+    'statsd_host': os.getenv('STATSD_HOST', '127.0.0.1'),
+    'statsd_port': int(os.getenv('STATSD_PORT', '8125')),
+    'textfile_dir': os.getenv('METRICS_TEXTFILE_DIR', str(BASE_DIR / 'metrics')),
+}
+
+# upload admission control (gallery/admission.py)
+# when the thumbnails queue or unprocessed uploads pass these limits, uploads are
+# either rejected with 503 + Retry-After ('reject') or accepted unprocessed ('defer')
+UPLOAD_ADMISSION_MODE = os.getenv('UPLOAD_ADMISSION_MODE', 'reject')
+UPLOAD_MAX_QUEUED = int(os.getenv('UPLOAD_MAX_QUEUED', '500'))
+UPLOAD_MAX_IN_FLIGHT = int(os.getenv('UPLOAD_MAX_IN_FLIGHT', '2000'))
+UPLOAD_RETRY_AFTER = int(os.getenv('UPLOAD_RETRY_AFTER', '30'))
+UPLOAD_BACKLOG_GAUGE_TTL = 5  # seconds the cached backlog gauge is trusted
+
+# render the watermarked copy right after processing (encode queue). off = queued by the first
+# download, photos show their thumbnail instead of a full size image until then
+WATERMARK_ON_UPLOAD = os.getenv('WATERMARK_ON_UPLOAD', 'True').lower() == 'true'
+
+# signed on demand resizes (gallery/resize.py), rendered once into an LRU disk cache
+RESIZE_CACHE_DIR = os.getenv('RESIZE_CACHE_DIR', str(BASE_DIR / 'media_cache' / 'resized'))
+RESIZE_CACHE_MAX_BYTES = int(os.getenv('RESIZE_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+RESIZE_CACHE_LOW_WATER = 0.9  # eviction trims the cache down to this fraction of the limit
+RESIZE_MAX_DIMENSION = int(os.getenv('RESIZE_MAX_DIMENSION', '2048'))
+RESIZE_RENDER_WAIT = int(os.getenv('RESIZE_RENDER_WAIT', '10'))  # seconds a request waits for another's render
+RESIZE_MAX_AGE = int(os.getenv('RESIZE_MAX_AGE', '86400'))
+
+# mass photo deletion runs as a background job (gallery/deletion.py)
+MASS_DELETE_CHUNK_SIZE = int(os.getenv('MASS_DELETE_CHUNK_SIZE', '500'))  # photos per transaction
+MASS_DELETE_FILE_WORKERS = int(os.getenv('MASS_DELETE_FILE_WORKERS', '8'))  # parallel storage deletes
+
+
+# photo tagging (gallery/ai_utils.py)
+# 'eager' = fp32 resnet50, 'optimized' = int8 quantised + frozen TorchScript + channels-last
+# compare both with: python manage.py bench_tagging --images <dir>
+AI_TAGGING_BACKEND = os.getenv('AI_TAGGING_BACKEND', 'eager')
+AI_TAGGING_THREADS = int(os.getenv('AI_TAGGING_THREADS', '0'))  # intra-op threads per worker, 0 = torch default
+# the export is saved as <name>_<version>.pt, the version hashes the weights, torch version and build steps
+AI_TAGGING_MODEL_PATH = os.getenv('AI_TAGGING_MODEL_PATH', str(BASE_DIR / 'models' / 'resnet50_int8_embed.pt'))
+
+# shared per-host model server (gallery/model_server.py, python manage.py run_model_server)
+# empty = every process tags in process with its own copy of the model
+AI_MODEL_SERVER_SOCKET = os.getenv('AI_MODEL_SERVER_SOCKET', '')
+AI_MODEL_SERVER_BATCH_SIZE = int(os.getenv('AI_MODEL_SERVER_BATCH_SIZE', '16'))
+AI_MODEL_SERVER_BATCH_WAIT = float(os.getenv('AI_MODEL_SERVER_BATCH_WAIT', '0.02'))  # seconds to wait for a batch to fill
+AI_MODEL_SERVER_TIMEOUT = int(os.getenv('AI_MODEL_SERVER_TIMEOUT', '30'))
+AI_MODEL_SERVER_RETRY = int(os.getenv('AI_MODEL_SERVER_RETRY', '10'))  # seconds before trying a down server again
+
+# visual similarity index over the tagger embeddings (gallery/vector_index.py)
+# 'exact' = brute force, 'ivf' = k-means inverted lists for large libraries
+VECTOR_INDEX_BACKEND = os.getenv('VECTOR_INDEX_BACKEND', 'exact')
+VECTOR_INDEX_IVF_LISTS = int(os.getenv('VECTOR_INDEX_IVF_LISTS', '256'))
+VECTOR_INDEX_IVF_PROBE = int(os.getenv('VECTOR_INDEX_IVF_PROBE', '8'))
+VECTOR_INDEX_SYNC_INTERVAL = int(os.getenv('VECTOR_INDEX_SYNC_INTERVAL', '10'))  # seconds between incremental syncs
@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from gallery.models import Photo
+from .db_router import pin_key, read_from_replica
+from .middleware import ReplicaRoutingMiddleware, fingerprint
+
+User = get_user_model()
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_placeholder_lists_of_any_length_match(self):
+        short = 'SELECT "gallery_photo"."id" FROM "gallery_photo" WHERE "gallery_photo"."id" IN (%s, %s)'
+        long = 'SELECT "gallery_photo"."id" FROM "gallery_photo" WHERE "gallery_photo"."id" IN (%s, %s, %s, %s, %s)'
+        single = 'SELECT "gallery_photo"."id" FROM "gallery_photo" WHERE "gallery_photo"."id" IN (%s)'
+        self.assertEqual(fingerprint(short), fingerprint(long))
+        self.assertEqual(fingerprint(short), fingerprint(single))
+        self.assertTrue(fingerprint(short).endswith('IN (...)'))
+
+    def test_inlined_literal_lists_match(self):
+        self.assertEqual(
+            fingerprint('SELECT 1 FROM t WHERE id IN (1, 2, 3)'),
+            fingerprint('SELECT 1 FROM t WHERE id IN (7)'),
+        )
+
+    def test_literals_are_replaced(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE name = 'it''s' AND id = 42"),
+            fingerprint("SELECT * FROM t WHERE name = 'other' AND id = 7"),
+        )
+
+    def test_different_shapes_stay_apart(self):
+        self.assertNotEqual(
+            fingerprint('SELECT * FROM t WHERE id = %s'),
+            fingerprint('SELECT * FROM t WHERE photo_id = %s'),
+        )
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='member@example.com', password='x', role='Member')
+        self.other = User.objects.create_user(email='guest@example.com', password='x', role='Guest')
+        self.factory = RequestFactory()
+        self.status = 200
+        self.middleware = ReplicaRoutingMiddleware(self.respond)
+
+    def respond(self, request):
+        # where the view's reads would have gone
+        self.read_alias = router.db_for_read(Photo)
+        return HttpResponse(status=self.status)
+
+    def request(self, method, path, user=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'} if user else {}
+        self.middleware(getattr(self.factory, method)(path, **headers))
+        return self.read_alias
+
+    def test_safe_reads_on_listed_paths_use_a_replica(self):
+        self.assertEqual(self.request('get', '/api/gallery/photos/', self.user), 'replica_1')
+        self.assertEqual(self.request('head', '/share/album/abc/'), 'replica_1')
+        self.assertEqual(self.request('get', '/api/auth/me/', self.user), 'default')
+        self.assertEqual(router.db_for_read(Photo), 'default') # nothing leaks past the request
+
+    def test_reads_stay_on_the_primary_after_a_write(self):
+        self.request('post', '/api/interactions/like/', self.user)
+        self.assertEqual(self.request('get', '/api/gallery/photos/', self.user), 'default')
+        self.assertEqual(self.request('get', '/api/gallery/photos/', self.other), 'replica_1')
+
+        cache.delete(pin_key(self.user.id)) # REPLICA_PIN_SECONDS later
+        self.assertEqual(self.request('get', '/api/gallery/photos/', self.user), 'replica_1')
+
+    def test_failed_writes_dont_pin(self):
+        self.status = 400
+        self.request('post', '/api/interactions/like/', self.user)
+        self.status = 200
+        self.assertEqual(self.request('get', '/api/gallery/photos/', self.user), 'replica_1')
+
+    def test_writes_go_to_the_primary(self):
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(Photo), 'replica_1')
+            self.assertEqual(router.db_for_write(Photo), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_removed_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(self.respond)
@@ -9,6 +9,7 @@ urlpatterns = [
     path('api/auth/', include('users.urls')),
     path('api/gallery/', include('gallery.urls')),
     path('api/interactions/', include('interactions.urls')),
+    path('api/notifications/', include('notifications.urls')),
     path('share/photos/<uuid:share_token>/', view_shared_photo, name='view_shared_photo'),
 ]
 
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# load the similarity index now rather than on the first search (gallery/vector_index.py)
+from gallery.vector_index import warm_index
+warm_index()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Event, Album, Photo
+from .models import Event, Album, Photo, BackfillRun, PhotoDeletionJob
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
@@ -18,3 +18,14 @@ class PhotoAdmin(admin.ModelAdmin):
     list_display = ['id', 'album', 'event', 'photographer', 'uploaded_at']
     list_filter = ('event', 'album', 'photographer')
     ordering = ['-uploaded_at']
+
+@admin.register(BackfillRun)
+class BackfillRunAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'queued', 'total', 'last_id', 'updated_at', 'finished_at']
+    ordering = ['-started_at']
+
+@admin.register(PhotoDeletionJob)
+class PhotoDeletionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'deleted', 'total', 'files_failed', 'requested_by', 'created_at', 'finished_at']
+    list_filter = ('status',)
+    ordering = ['-created_at']
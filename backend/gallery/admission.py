@@ -0,0 +1,89 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from config import metrics
+from config.celery import app
+from .models import Photo
+
+logger = logging.getLogger(__name__)
+
+# admission control for uploads: when the processing backlog is too deep we
+# either turn uploads away (503 + Retry-After) or accept them with processing
+# deferred until the backlog drains (settings.UPLOAD_ADMISSION_MODE)
+
+ACCEPT = 'accept'
+DEFER = 'defer'
+REJECT = 'reject'
+
+BACKLOG_KEY = 'gallery:upload_backlog'
+BACKLOG_LOCK_KEY = 'gallery:upload_backlog:lock'
+# queues whose depth delays the thumbnails users are waiting for
+WATCHED_QUEUES = ['thumbnails']
+
+class UploadsPaused(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Photo processing is backed up, please retry shortly.'
+    default_code = 'uploads_paused'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait # drf turns this into a Retry-After header
+
+def queue_depth(names):
+    total = 0
+    with app.connection_for_read() as conn:
+        channel = conn.default_channel
+        for name in names:
+            try:
+                # redis transport sums the priority sub-queues for us
+                total += channel.queue_declare(queue=name, passive=True).message_count
+            except Exception:
+                continue # queue not declared yet == empty
+    return total
+
+def measure_backlog():
+    try:
+        queued = queue_depth(WATCHED_QUEUES)
+    except Exception as e:
+        # broker unreachable: fail open rather than block every upload
+        logger.warning(f"Could not read queue depth: {e}")
+        queued = 0
+
+    recent = timezone.now() - timedelta(hours=1)
+    in_flight = Photo.objects.filter(
+        is_processed=False, processing_deferred=False, uploaded_at__gte=recent
+    ).count()
+
+    metrics.gauge('photo_backlog_queued', queued)
+    metrics.gauge('photo_backlog_in_flight', in_flight)
+    return {'queued': queued, 'in_flight': in_flight}
+
+def get_backlog():
+    backlog = cache.get(BACKLOG_KEY)
+    if backlog is not None:
+        return backlog
+
+    # one process refreshes the gauge, the rest keep using the stale value (or assume empty)
+    if not cache.add(BACKLOG_LOCK_KEY, 1, settings.UPLOAD_BACKLOG_GAUGE_TTL):
+        return cache.get(BACKLOG_KEY) or {'queued': 0, 'in_flight': 0}
+
+    backlog = measure_backlog()
+    cache.set(BACKLOG_KEY, backlog, settings.UPLOAD_BACKLOG_GAUGE_TTL)
+    return backlog
+
+def is_backed_up(backlog=None):
+    backlog = backlog or get_backlog()
+    return (
+        backlog['queued'] >= settings.UPLOAD_MAX_QUEUED
+        or backlog['in_flight'] >= settings.UPLOAD_MAX_IN_FLIGHT
+    )
+
+def check_upload_admission():
+    if not is_backed_up():
+        return ACCEPT
+    metrics.incr('photo_uploads_shed_total', mode=settings.UPLOAD_ADMISSION_MODE)
+    return DEFER if settings.UPLOAD_ADMISSION_MODE == DEFER else REJECT
@@ -1,56 +1,187 @@
+import os
+import threading
 import torch
+from django.conf import settings
 from torchvision.models import resnet50, ResNet50_Weights
 from PIL import Image
+from .model_server import request_prediction
+from .renditions import spec_version
 
-# Config for the topP sampling {Nucleus} process 
-TOP_P = 0.90      
-MAX_TAGS = 10     
-MIN_CONFIDENCE = 0.02 
+# Config for the topP sampling {Nucleus} process
+TOP_P = 0.90
+MAX_TAGS = 10
+MIN_CONFIDENCE = 0.02
 
 # Loading the pre-trained model and weights
 weights = ResNet50_Weights.DEFAULT
-model = resnet50(weights=weights)
-model.eval()
-
 preprocess = weights.transforms()
 
-def generate_tags(image_path):
+# inference backends, picked with settings.AI_TAGGING_BACKEND:
+#   'eager'     fp32 eager resnet50 (the original path)
+#   'optimized' int8 dynamically quantised, frozen TorchScript, channels-last input.
+#               exported once next to AI_TAGGING_MODEL_PATH and loaded from there after,
+#               so workers skip the trace on start up
+# dynamic quantisation only covers Linear layers (the fc head here), the convs get
+# their speedup from freezing (conv+bn folding) and channels-last instead
+# both return (class logits, pooled 2048-d penultimate features) from one forward pass,
+# the features are kept as the photo's embedding (gallery/vector_index.py)
+BACKENDS = ('eager', 'optimized')
+
+_models = {}
+_load_lock = threading.Lock()
+_threads_configured = False
+
+def configure_threads():
+    # each worker process sets this once, before its first inference
+    global _threads_configured
+    if _threads_configured:
+        return
+    if settings.AI_TAGGING_THREADS:
+        torch.set_num_threads(settings.AI_TAGGING_THREADS)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass # only allowed before any parallel work ran in this process
+    _threads_configured = True
+
+class TaggerModel(torch.nn.Module):
+    def __init__(self, resnet):
+        super().__init__()
+        self.resnet = resnet
+
+    def forward(self, x):
+        r = self.resnet
+        x = r.maxpool(r.relu(r.bn1(r.conv1(x))))
+        x = r.layer4(r.layer3(r.layer2(r.layer1(x))))
+        pooled = torch.flatten(r.avgpool(x), 1)
+        return r.fc(pooled), pooled
+
+def build_eager_model():
+    model = TaggerModel(resnet50(weights=weights))
+    model.eval()
+    return model
+
+def build_optimized_model():
+    model = torch.ao.quantization.quantize_dynamic(build_eager_model(), {torch.nn.Linear}, dtype=torch.qint8)
+    model = model.to(memory_format=torch.channels_last)
+    example = torch.rand(1, 3, 224, 224).contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        return torch.jit.freeze(traced)
+
+# everything the exported file depends on. a new torch or different weights/build steps
+# give a new file name, so a stale export is never loaded (same idea as renditions.spec_version)
+OPTIMIZED_SPEC = {
+    'weights': str(weights),
+    'torch': torch.__version__,
+    'quantize': ['Linear', 'qint8'],
+    'memory_format': 'channels_last',
+    'input': [1, 3, 224, 224],
+    'freeze': True,
+}
+OPTIMIZED_VERSION = spec_version(OPTIMIZED_SPEC)
+
+def optimized_model_path():
+    # AI_TAGGING_MODEL_PATH=models/resnet50_int8_embed.pt -> models/resnet50_int8_embed_<version>.pt
+    path = settings.AI_TAGGING_MODEL_PATH
+    if not path:
+        return ''
+    base, ext = os.path.splitext(path)
+    return f'{base}_{OPTIMIZED_VERSION}{ext or ".pt"}'
+
+def load_optimized_model():
+    path = optimized_model_path()
+    if path and os.path.exists(path):
+        return torch.jit.load(path)
+
+    model = build_optimized_model()
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        torch.jit.save(model, tmp_path)
+        os.replace(tmp_path, path) # several workers may export at once
+    return model
+
+def get_model(backend=None):
+    backend = backend or settings.AI_TAGGING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown AI_TAGGING_BACKEND {backend!r}, expected one of {BACKENDS}")
+
+    if backend not in _models:
+        with _load_lock:
+            if backend not in _models:
+                configure_threads()
+                _models[backend] = build_eager_model() if backend == 'eager' else load_optimized_model()
+    return _models[backend]
+
+def prepare_batch(images, backend=None):
+    # PIL images are resized to 224x224, already preprocessed tensors/arrays pass through
+    batch = torch.stack([
+        preprocess(img) if isinstance(img, Image.Image) else torch.as_tensor(img, dtype=torch.float32)
+        for img in images
+    ])
+    if (backend or settings.AI_TAGGING_BACKEND) == 'optimized':
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    return batch
+
+def select_tags(probs):
+    sorted_probs, sorted_indices = torch.sort(probs, descending=True)
+
+    cumulative_probs = torch.cumsum(sorted_probs, dim=0)
+
+    cutoff_indices = (cumulative_probs > TOP_P).nonzero()
+
+    if cutoff_indices.numel() > 0:
+        k = cutoff_indices[0].item() + 1
+    else:
+        k = len(probs)
+
+    k = min(k, MAX_TAGS)
+
+    tags = []
+    for i in range(k):
+        prob = sorted_probs[i].item()
+        idx = sorted_indices[i].item()
+
+        if prob < MIN_CONFIDENCE:
+            continue
+
+        category_name = weights.meta['categories'][idx] # in_built category names
+        clean_tag = category_name.replace('_', ' ')
+        tags.append(clean_tag)
+
+    return tags
+
+def predict(images, backend=None):
+    # [(tags, embedding as a float32 numpy array), ...]
+    model = get_model(backend)
+    batch = prepare_batch(images, backend)
+
+    with torch.inference_mode():
+        prediction, pooled = model(batch)
+        probs = torch.nn.functional.softmax(prediction, dim=1) # get probabilities for each class/tag
+        return [(select_tags(row), features.float().numpy()) for row, features in zip(probs, pooled)]
+
+def predict_tags(images, backend=None):
+    return [tags for tags, _ in predict(images, backend)]
+
+def analyze_image(image_path, backend=None):
+    # (tags, embedding), embedding is None when the image couldn't be tagged
     try:
+        # the per-host model server (gallery/model_server.py) when it's running,
+        # so this process never loads its own copy of the weights
+        if backend is None:
+            with open(image_path, 'rb') as f:
+                result = request_prediction(f.read())
+            if result is not None:
+                return result
+
         img = Image.open(image_path).convert('RGB') # resnet only accepts 3-channel images (RBG), png images have RGBA
-        batch = preprocess(img).unsqueeze(0) # resize to 224x224 and add batch dimension
-        
-        with torch.no_grad():
-            prediction = model(batch) 
-
-            probs = torch.nn.functional.softmax(prediction[0], dim=0) # get probabilities for each class/tag
-            
-            sorted_probs, sorted_indices = torch.sort(probs, descending=True)
-            
-            cumulative_probs = torch.cumsum(sorted_probs, dim=0)
-            
-            cutoff_indices = (cumulative_probs > TOP_P).nonzero() 
-            
-            if cutoff_indices.numel() > 0:
-                k = cutoff_indices[0].item() + 1
-            else:
-                k = len(probs) 
-            
-            k = min(k, MAX_TAGS) 
-            
-            tags = []
-            for i in range(k):
-                prob = sorted_probs[i].item()
-                idx = sorted_indices[i].item()
-                
-                if prob < MIN_CONFIDENCE:
-                    continue
-
-                category_name = weights.meta['categories'][idx] # in_built category names
-                clean_tag = category_name.replace('_', ' ')
-                tags.append(clean_tag)
-            
-            return tags
+        return predict([img], backend)[0]
 
     except Exception as e:
         print(f"Error generating tags: {e}")
-        return []
\ No newline at end of file
+        return [], None
+
+def generate_tags(image_path, backend=None):
+    return analyze_image(image_path, backend)[0]
@@ -0,0 +1,132 @@
+import time
+from django.core.cache import cache
+from config.channel_utils import group_send
+from .models import Photo
+from .serializers import PhotoCardSerializer
+
+# live event feed: processed photos are queued per event and flushed as one
+# batched message at most every FEED_THROTTLE seconds, so a burst of uploads
+# becomes a handful of socket messages instead of one per photo per viewer
+FEED_THROTTLE = 1
+FEED_KEY_TIMEOUT = 60 * 60
+# if a flush task gets lost the lock expires and the next photo reschedules
+FEED_LOCK_TIMEOUT = FEED_THROTTLE * 10
+# a slot claimed but still empty after this long belongs to a worker that died between
+# the incr and the set, the feed moves on without it
+FEED_GAP_GRACE = FEED_THROTTLE * 5
+
+def event_feed_group(event_id):
+    return f"event_feed_{event_id}"
+
+# photos are stored in numbered slots (atomic incr) so concurrent workers never overwrite each other
+def _seq_key(event_id):
+    return f"live:event:{event_id}:seq"
+
+def _slot_key(event_id, seq):
+    return f"live:event:{event_id}:slot:{seq}"
+
+def _flushed_key(event_id):
+    return f"live:event:{event_id}:flushed"
+
+def _lock_key(event_id):
+    return f"live:event:{event_id}:lock"
+
+def _gap_key(event_id):
+    return f"live:event:{event_id}:gap"
+
+def _schedule_flush(event_id):
+    from .tasks import flush_event_feed # tasks imports this module
+
+    # only the first photo in a window schedules the flush, the rest ride along
+    if cache.add(_lock_key(event_id), 1, FEED_LOCK_TIMEOUT):
+        flush_event_feed.apply_async((event_id,), countdown=FEED_THROTTLE)
+
+def queue_event_photo(event_id, photo_id):
+    seq_key = _seq_key(event_id)
+    cache.add(seq_key, 0, FEED_KEY_TIMEOUT)
+    try:
+        seq = cache.incr(seq_key)
+    except ValueError:
+        # expired between the add and the incr, a restarted counter is handled by the flush
+        cache.add(seq_key, 0, FEED_KEY_TIMEOUT)
+        seq = cache.incr(seq_key)
+    cache.touch(seq_key, FEED_KEY_TIMEOUT)
+    cache.set(_slot_key(event_id, seq), photo_id, FEED_KEY_TIMEOUT)
+    _schedule_flush(event_id)
+
+def publish_processed_photo(photo):
+    card = PhotoCardSerializer(photo).data
+
+    # the uploader hears about is_processed flipping right away, no throttling
+    group_send(
+        f"notifications_{photo.photographer_id}",
+        {
+            'type': 'photo_processed', # maps to NotificationConsumer.photo_processed
+            'photo': dict(card)
+        }
+    )
+
+    if photo.event_id:
+        queue_event_photo(photo.event_id, photo.id)
+
+def _slot_abandoned(event_id, seq):
+    # remembers when this empty slot was first seen, True once it's past the grace period
+    gap = cache.get(_gap_key(event_id))
+    if gap is None or gap[0] != seq:
+        cache.set(_gap_key(event_id), (seq, time.time()), FEED_KEY_TIMEOUT)
+        return False
+    return time.time() - gap[1] >= FEED_GAP_GRACE
+
+def _advance_flushed(event_id):
+    # (photo ids queued since the last flush, seq flushed up to), moving the mark past them
+    current = cache.get(_seq_key(event_id), 0)
+    last = cache.get(_flushed_key(event_id), 0)
+    if current < last:
+        last = 0 # counter expired and restarted
+    if current == last:
+        return [], current
+
+    seqs = list(range(last + 1, current + 1))
+    found = cache.get_many([_slot_key(event_id, seq) for seq in seqs])
+
+    photo_ids = []
+    flushed_to = last
+    for seq in seqs:
+        key = _slot_key(event_id, seq)
+        if key in found:
+            photo_ids.append(found[key])
+        elif _slot_abandoned(event_id, seq):
+            pass # skipped, a late write just expires
+        else:
+            break # slot claimed but not written yet, the next flush picks it up
+        flushed_to = seq
+
+    cache.set(_flushed_key(event_id), flushed_to, FEED_KEY_TIMEOUT)
+    cache.delete_many([_slot_key(event_id, seq) for seq in range(last + 1, flushed_to + 1)])
+    return photo_ids, flushed_to
+
+def flush_event_photos(event_id):
+    # the lock is held until the flushed mark has moved, a flush scheduled any
+    # earlier would read the same range and send those photos twice
+    try:
+        photo_ids, flushed_to = _advance_flushed(event_id)
+    finally:
+        cache.delete(_lock_key(event_id))
+    # photos queued while we held the lock couldn't schedule a flush themselves
+    if cache.get(_seq_key(event_id), 0) != flushed_to:
+        _schedule_flush(event_id)
+
+    if not photo_ids:
+        return 0
+    photos = Photo.objects.filter(id__in=photo_ids).select_related('photographer').order_by('uploaded_at')
+    cards = PhotoCardSerializer(photos, many=True).data
+    if cards:
+        group_send(
+            event_feed_group(event_id),
+            {
+                'type': 'event_photos', # maps to EventFeedConsumer.event_photos
+                'event': event_id,
+                'photos': [dict(card) for card in cards]
+            }
+        )
+    return len(cards)
@@ -0,0 +1,68 @@
+import hashlib
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from config.cache_utils import get_versions
+
+# ETag validators for the gallery viewsets, a 304 costs no serialization at all.
+#
+# single objects with a cache namespace (event:<id>, album:<id>) are validated on
+# its version: every change the payload can show already bumps it
+# (gallery/invalidation.py), so the validator is one cache round trip.
+# lists (and objects without one) fall back to aggregate queries: max(updated_at)
+# and count for the rows and every nested relation the serializer embeds. likes
+# and tag changes touch the photo's updated_at (gallery/signals.py), user fields
+# embedded in the payload are covered by the 'people' cache version.
+#
+# no Last-Modified: a timestamp can't see a deleted row, only the ETag can
+
+def nested_state(queryset, relations=()):
+    queryset = queryset.order_by()
+    state = queryset.aggregate(modified=Max('updated_at'), count=Count('id', distinct=True))
+    parts = [state['modified'], state['count']]
+
+    for relation in relations:
+        # one query per relation, joining them all at once multiplies the rows
+        nested = queryset.aggregate(modified=Max(f'{relation}__updated_at'), count=Count(relation, distinct=True))
+        parts += [nested['modified'], nested['count']]
+    return parts
+
+def make_etag(request, parts):
+    # payloads carry is_liked, so the validator is per user
+    user_id = request.user.id if request.user.is_authenticated else 'anon'
+    key = '|'.join(str(p) for p in [request.get_full_path(), user_id, *get_versions(['people']), *parts])
+    return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+def conditional_response(request, parts, build):
+    etag = make_etag(request, parts)
+
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is None:
+        response = build()
+    else:
+        response = not_modified
+
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache' # always revalidate
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+class ConditionalGetMixin:
+    # nested relations the serializer embeds, e.g. ['photos'] for albums
+    conditional_relations = ()
+    # cache namespaces covering one object's whole payload, e.g. ['album:{pk}']
+    conditional_namespaces = ()
+
+    def conditional_list(self, request, build):
+        queryset = self.filter_queryset(self.get_queryset())
+        return conditional_response(request, nested_state(queryset, self.conditional_relations), build)
+
+    def conditional_retrieve(self, request, build):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        pk = self.kwargs[lookup_url_kwarg]
+        if self.conditional_namespaces:
+            parts = get_versions([namespace.format(pk=pk) for namespace in self.conditional_namespaces])
+        else:
+            queryset = self.get_queryset().filter(**{self.lookup_field: pk})
+            parts = nested_state(queryset, self.conditional_relations)
+        return conditional_response(request, parts, build)
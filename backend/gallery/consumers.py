@@ -0,0 +1,22 @@
+import json
+from notifications.consumers import NotificationConsumer
+
+# live feed for an event page, replaces polling PhotoViewSet.list?event=...
+# reuses the token auth and heartbeat of the notification socket
+class EventFeedConsumer(NotificationConsumer):
+    async def connect(self):
+        self.user_id = await self.authenticate()
+        if not self.user_id:
+            await self.close()
+            return
+
+        self.event_id = int(self.scope['url_route']['kwargs']['event_id'])
+        await self.join(f'event_feed_{self.event_id}')
+
+    # batched by gallery.broadcast.flush_event_photos
+    async def event_photos(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'event_photos',
+            'event': event['event'],
+            'photos': event['photos']
+        }))
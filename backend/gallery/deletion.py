@@ -0,0 +1,140 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from config import metrics
+from interactions.models import Comment, Like
+from notifications.models import Notification
+from notifications.utils import incr_unread_count
+from .invalidation import invalidate_photos
+from .models import Album, Photo, PhotoEmbedding, PhotoDeletionJob
+
+logger = logging.getLogger(__name__)
+
+# bulk photo deletion, run by the delete_photos task for a PhotoDeletionJob.
+#
+# queryset.delete() goes through django's collector: every photo, like, comment and
+# through row is loaded into memory and deleted with signals, minutes of work for a
+# whole event. here photos go MASS_DELETE_CHUNK_SIZE at a time, one transaction per
+# chunk of plain DELETE ... WHERE statements in dependency order:
+#   notifications pointing at the photos, their comments or likes (generic fk, nothing
+#   cascades them), comment likes, comments (replies are on the same photo), likes,
+#   tag rows, embeddings and finally the photos
+# none of this fires signals, so what they'd do is done here: cache namespaces are
+# bumped once per chunk and unread badges drop by the unread notifications deleted.
+# draft albums (scene clustering suggestions) left without photos are deleted with the
+# chunk. the similarity index of every process drops the deleted embeddings on its next
+# sync (gallery/vector_index.py)
+#
+# files (original, thumbnail, watermarked copy) are removed once the chunk has
+# committed, MASS_DELETE_FILE_WORKERS at a time. a failed removal is logged and counted,
+# the rows stay deleted. resized variants age out of their own cache (gallery/resize.py).
+# running a job again is safe, photos already deleted just aren't found
+
+FILE_FIELDS = ('image', 'thumbnail', 'watermarked')
+
+def chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def raw_delete(queryset):
+    # a single DELETE statement: no collector, no signals, nothing loaded
+    return queryset._raw_delete(queryset.db)
+
+def storage_names(row):
+    # legacy rows can have the watermarked copy pointing at the image itself
+    return {row[field] for field in FILE_FIELDS if row[field]}
+
+def delete_rows(photo_ids):
+    # (photos deleted, {recipient_id: unread notifications deleted}), inside the caller's transaction
+    comment_ids = list(Comment.objects.filter(photo_id__in=photo_ids).values_list('id', flat=True))
+    like_ids = list(Like.objects.filter(photo_id__in=photo_ids).values_list('id', flat=True))
+    content_types = ContentType.objects.get_for_models(Photo, Comment, Like)
+    notifications = Notification.objects.filter(
+        Q(content_type=content_types[Photo], object_id__in=photo_ids)
+        | Q(content_type=content_types[Comment], object_id__in=comment_ids)
+        | Q(content_type=content_types[Like], object_id__in=like_ids)
+    )
+    unread = dict(
+        notifications.filter(is_read=False).order_by().values_list('recipient_id').annotate(count=Count('id'))
+    )
+
+    raw_delete(notifications)
+    raw_delete(Comment.likes.through.objects.filter(comment_id__in=comment_ids))
+    raw_delete(Comment.objects.filter(id__in=comment_ids))
+    raw_delete(Like.objects.filter(id__in=like_ids))
+    raw_delete(Photo.tagged_users.through.objects.filter(photo_id__in=photo_ids))
+    raw_delete(PhotoEmbedding.objects.filter(photo_id__in=photo_ids))
+    deleted = raw_delete(Photo.objects.filter(id__in=photo_ids))
+    return deleted, unread
+
+def delete_empty_drafts(album_ids):
+    # suggestions whose photos are all gone, a handful of rows so the signals can run
+    return Album.objects.filter(
+        id__in=album_ids, is_draft=True, photos__isnull=True, suggested_photos__isnull=True
+    ).delete()[0]
+
+def remove_file(name):
+    try:
+        default_storage.delete(name)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not delete {name}: {e}")
+        return False
+
+def delete_chunk(photo_ids, pool):
+    # (photos deleted, files removed, files left behind) for one chunk
+    rows = list(
+        Photo.objects.filter(id__in=photo_ids)
+        .values('id', 'event_id', 'album_id', 'suggested_album_id', 'latitude', 'longitude', *FILE_FIELDS)
+    )
+    if not rows:
+        return 0, 0, 0
+
+    with metrics.timer('photo_stage_seconds', stage='delete_rows'):
+        with transaction.atomic():
+            deleted, unread = delete_rows([row['id'] for row in rows])
+            invalidate_photos(rows) # bumped on commit
+            delete_empty_drafts({row['suggested_album_id'] for row in rows if row['suggested_album_id']})
+    for recipient_id, count in unread.items():
+        incr_unread_count(recipient_id, -count)
+
+    names = [name for row in rows for name in storage_names(row)]
+    with metrics.timer('photo_stage_seconds', stage='delete_files'):
+        removed = list(pool.map(remove_file, names))
+    files_deleted = removed.count(True)
+    metrics.incr('photos_deleted_total', deleted)
+    metrics.incr('photo_files_deleted_total', files_deleted, outcome='deleted')
+    metrics.incr('photo_files_deleted_total', len(removed) - files_deleted, outcome='failed')
+    return deleted, files_deleted, len(removed) - files_deleted
+
+def run_deletion_job(job_id):
+    job = PhotoDeletionJob.objects.get(id=job_id)
+    if job.status == 'done':
+        return job
+    jobs = PhotoDeletionJob.objects.filter(id=job_id)
+    jobs.update(status='running', error='', updated_at=timezone.now())
+
+    # the progress counters are bumped per chunk, so a poll sees the job move
+    with ThreadPoolExecutor(max_workers=settings.MASS_DELETE_FILE_WORKERS) as pool:
+        for chunk in chunks(sorted(set(job.photo_ids)), settings.MASS_DELETE_CHUNK_SIZE):
+            deleted, files_deleted, files_failed = delete_chunk(chunk, pool)
+            jobs.update(
+                deleted=F('deleted') + deleted,
+                files_deleted=F('files_deleted') + files_deleted,
+                files_failed=F('files_failed') + files_failed,
+                updated_at=timezone.now(),
+            )
+
+    now = timezone.now()
+    jobs.update(status='done', finished_at=now, updated_at=now)
+    job.refresh_from_db()
+    return job
+
+def fail_deletion_job(job_id, error):
+    now = timezone.now()
+    PhotoDeletionJob.objects.filter(id=job_id).update(status='failed', error=str(error)[:1000], finished_at=now, updated_at=now)
@@ -1,5 +1,18 @@
 import django_filters
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
 from .models import Photo
+from .permissions import sees_exact_location, public_bbox
+
+def parse_bbox(value):
+    # "min_lon,min_lat,max_lon,max_lat" -> floats, min_lon > max_lon crosses the antimeridian
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except (ValueError, AttributeError):
+        raise ValidationError({'bbox': 'Expected min_lon,min_lat,max_lon,max_lat'})
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValidationError({'bbox': 'Coordinates out of range'})
+    return min_lon, min_lat, max_lon, max_lat
 
 class PhotoFilter(django_filters.FilterSet):
 
@@ -12,6 +25,20 @@ class PhotoFilter(django_filters.FilterSet):
     photographer = django_filters.CharFilter(field_name='photographer__full_name', lookup_expr='icontains')
     tagged_user = django_filters.CharFilter(field_name='tagged_users__full_name', lookup_expr='icontains')
 
+    # ?bbox=min_lon,min_lat,max_lon,max_lat (GeoJSON order), served by photo_geo_idx
+    bbox = django_filters.CharFilter(method='filter_bbox')
+    has_location = django_filters.BooleanFilter(field_name='latitude', lookup_expr='isnull', exclude=True)
+
     class Meta:
         model = Photo
-        fields = ['event_name', 'album_name', 'date_min', 'date_max', 'photographer', 'tagged_user']
\ No newline at end of file
+        fields = ['event_name', 'album_name', 'date_min', 'date_max', 'photographer', 'tagged_user', 'bbox', 'has_location']
+
+    def filter_bbox(self, queryset, name, value):
+        min_lon, min_lat, max_lon, max_lat = parse_bbox(value)
+        if not sees_exact_location(self.request.user):
+            min_lon, min_lat, max_lon, max_lat = public_bbox(min_lon, min_lat, max_lon, max_lat)
+        queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+        if min_lon <= max_lon:
+            return queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+        # box crossing the antimeridian
+        return queryset.filter(Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon))
\ No newline at end of file
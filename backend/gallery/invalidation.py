@@ -0,0 +1,61 @@
+from config.cache_utils import bump
+from .map_clusters import location_namespaces
+
+# cache namespaces used by the gallery views:
+#   'events'       event list (embeds albums, photos and like state)
+#   'event:<id>'   event detail
+#   'album:<id>'   album detail and its public share payload
+#   'photo:<id>'   public share page of a photo
+#   'people'       user fields embedded in photos (email, name, profile picture)
+#   'map:<z>:<x>:<y>'  map clusters of one tile at one zoom (gallery/map_clusters.py)
+
+def invalidate_event(event_id):
+    bump('events', f'event:{event_id}')
+
+def invalidate_album(album_id, event_id=None):
+    namespaces = ['events', f'album:{album_id}']
+    if event_id:
+        namespaces.append(f'event:{event_id}')
+    bump(*namespaces)
+
+def invalidate_photo(photo_id, event_id=None, album_id=None):
+    namespaces = ['events', f'photo:{photo_id}']
+    if event_id:
+        namespaces.append(f'event:{event_id}')
+    if album_id:
+        namespaces.append(f'album:{album_id}')
+    bump(*namespaces)
+
+def invalidate_photo_likes(event_id=None, album_id=None):
+    # like state is embedded in event details and albums. the event list is shared
+    # and fills it in per request (EventViewSet.list), so 'events' is left alone
+    namespaces = []
+    if event_id:
+        namespaces.append(f'event:{event_id}')
+    if album_id:
+        namespaces.append(f'album:{album_id}')
+    if namespaces:
+        bump(*namespaces)
+
+def invalidate_people():
+    bump('people')
+
+def invalidate_location(latitude, longitude):
+    # the map tiles a geotagged photo counts towards, no-op for photos without gps
+    if latitude is None or longitude is None:
+        return
+    bump(*location_namespaces(latitude, longitude))
+
+def invalidate_photos(rows):
+    # many photos at once (bulk deletes skip the signals), every namespace bumped a single time.
+    # rows as from .values('id', 'event_id', 'album_id', 'latitude', 'longitude')
+    namespaces = {'events'}
+    for row in rows:
+        namespaces.add(f"photo:{row['id']}")
+        if row['event_id']:
+            namespaces.add(f"event:{row['event_id']}")
+        if row['album_id']:
+            namespaces.add(f"album:{row['album_id']}")
+        if row['latitude'] is not None and row['longitude'] is not None:
+            namespaces.update(location_namespaces(row['latitude'], row['longitude']))
+    bump(*namespaces)
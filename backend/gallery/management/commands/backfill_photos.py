@@ -0,0 +1,177 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from config.celery import PRIORITY_BACKFILL
+from gallery.admission import queue_depth
+from gallery.models import Photo, BackfillRun
+from gallery.renditions import THUMBNAIL_VERSION
+from gallery.tasks import process_photo, tag_photo, watermark_photo
+from gallery.vector_index import EMBEDDING_MODEL
+
+# re-runs photo processing over the existing library, e.g. after changing the
+# thumbnail size or the tagging model:
+#
+#   python manage.py backfill_photos --name retag-2026-10 --task tag --model-version resnet50-avgpool-f16
+#   python manage.py backfill_photos --name retag-2026-10 --resume      (after ctrl-c / a crash)
+#
+# photos are walked in id order a chunk at a time and queued on the 'backfill' queue at
+# PRIORITY_BACKFILL, so uploads always go first. progress is checkpointed in BackfillRun
+# after every chunk, a resumed run continues after the last queued id with the filters
+# it was started with. at most --max-queued tasks wait in the queue at any time
+
+BACKFILL_QUEUE = 'backfill'
+TASKS = {
+    'process': [process_photo], # exif, capture time, thumbnail (+ watermark with WATERMARK_ON_UPLOAD)
+    'watermark': [watermark_photo], # only renders copies that aren't current
+    'tag': [tag_photo], # auto tags + embedding
+    'all': [process_photo, tag_photo],
+}
+MISSING = {
+    'thumbnail': ~Q(thumbnail_version=THUMBNAIL_VERSION), # missing or from an older spec
+    'tags': Q(auto_tags=[]),
+    'embedding': Q(embedding__isnull=True),
+    'capture-time': Q(date_taken__isnull=True),
+    'placeholder': Q(placeholder='') | Q(width__isnull=True),
+    'location': Q(latitude__isnull=True), # includes photos that simply have no gps
+}
+REPORT_EVERY = 10 # seconds
+
+class Command(BaseCommand):
+    help = "Re-queues processing/tagging for existing photos in resumable, rate limited batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', required=True, help="checkpoint name, reuse it with --resume")
+        parser.add_argument('--resume', action='store_true', help="continue an interrupted run with its original filters")
+        parser.add_argument('--restart', action='store_true', help="drop an existing checkpoint with this name first")
+        parser.add_argument('--task', choices=sorted(TASKS), default='all')
+        parser.add_argument('--event', type=int, help="only photos of this event")
+        parser.add_argument('--uploaded-after', help="YYYY-MM-DD")
+        parser.add_argument('--uploaded-before', help="YYYY-MM-DD")
+        parser.add_argument('--missing', choices=sorted(MISSING), action='append', default=[],
+                            help="only photos missing this rendition/field (repeatable, any of them)")
+        parser.add_argument('--model-version', default='',
+                            help=f"only photos without an embedding from this model (current: {EMBEDDING_MODEL})")
+        parser.add_argument('--chunk-size', type=int, default=500, help="photos read and checkpointed per step")
+        parser.add_argument('--rate', type=float, default=0, help="max photos queued per second, 0 = unlimited")
+        parser.add_argument('--max-queued', type=int, default=1000, help="wait while the backfill queue holds more than this")
+        parser.add_argument('--dry-run', action='store_true', help="only count the matching photos")
+
+    def handle(self, *args, **options):
+        run = BackfillRun.objects.filter(name=options['name']).first()
+        if run and options['restart']:
+            run.delete()
+            run = None
+
+        if options['resume']:
+            if not run:
+                raise CommandError(f"No backfill named {options['name']} to resume")
+            if run.finished_at:
+                raise CommandError(f"Backfill {run.name} already finished at {run.finished_at:%Y-%m-%d %H:%M}")
+            filters = run.options
+            self.stdout.write(f"Resuming {run.name} after photo {run.last_id} ({run.queued}/{run.total} queued)")
+        else:
+            if run:
+                raise CommandError(f"Backfill {run.name} exists, pass --resume to continue it or --restart to start over")
+            filters = {
+                key: options[key]
+                for key in ('task', 'event', 'uploaded_after', 'uploaded_before', 'missing', 'model_version')
+            }
+
+        queryset = self.filtered(filters)
+        if options['dry_run']:
+            self.stdout.write(f"{queryset.count()} photos match")
+            return
+
+        if not run:
+            run = BackfillRun.objects.create(name=options['name'], options=filters, total=queryset.count())
+        self.walk(run, queryset, TASKS[filters['task']], options)
+
+    def filtered(self, filters):
+        queryset = Photo.objects.all()
+        if filters.get('event'):
+            queryset = queryset.filter(event_id=filters['event'])
+        if filters.get('uploaded_after'):
+            queryset = queryset.filter(uploaded_at__gte=self.parse_date(filters['uploaded_after']))
+        if filters.get('uploaded_before'):
+            queryset = queryset.filter(uploaded_at__lt=self.parse_date(filters['uploaded_before']))
+        if filters.get('missing'):
+            missing = Q()
+            for name in filters['missing']:
+                missing |= MISSING[name]
+            queryset = queryset.filter(missing)
+        if filters.get('model_version'):
+            queryset = queryset.exclude(embedding__model=filters['model_version'])
+        return queryset
+
+    def parse_date(self, value):
+        try:
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+    def walk(self, run, queryset, tasks, options):
+        started = time.monotonic()
+        queued_at_start = run.queued
+        last_report = 0.0
+        interval = 1.0 / options['rate'] if options['rate'] else 0
+
+        try:
+            while True:
+                photo_ids = list(
+                    queryset.filter(id__gt=run.last_id).order_by('id').values_list('id', flat=True)[:options['chunk_size']]
+                )
+                if not photo_ids:
+                    break
+
+                self.wait_for_room(options['max_queued'])
+                for photo_id in photo_ids:
+                    sent_at = time.monotonic()
+                    for task in tasks:
+                        task.apply_async(
+                            (photo_id,), {'enqueued_at': time.time()},
+                            queue=BACKFILL_QUEUE, priority=PRIORITY_BACKFILL,
+                        )
+                    if interval:
+                        time.sleep(max(0.0, interval - (time.monotonic() - sent_at)))
+
+                # checkpoint: a crash from here on re-queues at most one chunk
+                run.last_id = photo_ids[-1]
+                run.queued += len(photo_ids)
+                run.save(update_fields=['last_id', 'queued', 'updated_at'])
+
+                if time.monotonic() - last_report >= REPORT_EVERY:
+                    self.report(run, run.queued - queued_at_start, time.monotonic() - started)
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f"\nStopped after photo {run.last_id}, continue with: manage.py backfill_photos --name {run.name} --resume"
+            ))
+            return
+
+        run.finished_at = timezone.now()
+        run.save(update_fields=['finished_at', 'updated_at'])
+        self.report(run, run.queued - queued_at_start, time.monotonic() - started)
+        self.stdout.write(self.style.SUCCESS(f"Backfill {run.name} done, {run.queued} photos queued"))
+
+    def wait_for_room(self, max_queued):
+        # bounded: don't bury the workers (or redis) under the whole library at once
+        while True:
+            try:
+                depth = queue_depth([BACKFILL_QUEUE])
+            except Exception as e:
+                self.stderr.write(f"Could not read backfill queue depth ({e}), continuing")
+                return
+            if depth <= max_queued:
+                return
+            time.sleep(5)
+
+    def report(self, run, queued_now, elapsed):
+        rate = queued_now / elapsed if elapsed > 0 else 0.0
+        remaining = max(run.total - run.queued, 0)
+        eta = f"{remaining / rate / 60:.1f} min" if rate else "unknown"
+        percent = run.queued / run.total * 100 if run.total else 100.0
+        self.stdout.write(
+            f"{run.queued}/{run.total} queued ({percent:.1f}%)  {rate:.1f} photos/s  ETA {eta}  last id {run.last_id}"
+        )
@@ -0,0 +1,72 @@
+import json
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from config.channel_utils import group_send
+from config.perf_utils import summarize
+
+# python manage.py bench_connections --iterations 500
+# before/after numbers for connection reuse, needs the real postgres + redis running:
+#   db:       new connection per query (old behaviour) vs a reused connection
+#   channels: async_to_sync(group_send) per message (old) vs the shared loop in config.channel_utils
+#   cache:    round trips through the shared redis pool
+
+class Command(BaseCommand):
+    help = "Measures per-operation latency with fresh vs reused Postgres/Redis connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=300)
+        parser.add_argument('--json', dest='json_path', default='')
+
+    def handle(self, *args, **options):
+        n = options['iterations']
+        report = {
+            'db_fresh_connection': self.time_db(n, reuse=False),
+            'db_reused_connection': self.time_db(n, reuse=True),
+            'group_send_async_to_sync': self.time_group_send(n, shared_loop=False),
+            'group_send_shared_loop': self.time_group_send(n, shared_loop=True),
+            'cache_get_shared_pool': self.time_cache(n),
+        }
+        for name, stats in report.items():
+            self.stdout.write(f"{name:<28} p50 {stats['p50_ms']:>8.3f}ms  p95 {stats['p95_ms']:>8.3f}ms  mean {stats['mean_ms']:>8.3f}ms")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def time_db(self, n, reuse):
+        timings = []
+        for _ in range(n):
+            if not reuse:
+                connection.close() # what CONN_MAX_AGE=0 does after every request/task
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            timings.append(time.perf_counter() - started)
+        return summarize(timings)
+
+    def time_group_send(self, n, shared_loop):
+        channel_layer = get_channel_layer()
+        message = {'type': 'send_notification', 'message': {'id': 0, 'verb': 'benchmark'}}
+        timings = []
+        for _ in range(n):
+            started = time.perf_counter()
+            if shared_loop:
+                group_send('bench_connections', message)
+            else:
+                async_to_sync(channel_layer.group_send)('bench_connections', message)
+            timings.append(time.perf_counter() - started)
+        return summarize(timings)
+
+    def time_cache(self, n):
+        cache.set('bench_connections', 1, 60)
+        timings = []
+        for _ in range(n):
+            started = time.perf_counter()
+            cache.get('bench_connections')
+            timings.append(time.perf_counter() - started)
+        return summarize(timings)
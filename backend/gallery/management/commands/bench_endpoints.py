@@ -0,0 +1,183 @@
+import json
+import subprocess
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from gallery.models import Event, Album, Photo
+from interactions.models import Comment
+from notifications.models import Notification
+from config.perf_utils import summarize
+
+User = get_user_model()
+
+# python manage.py seed_dataset --photos 20000
+# python manage.py bench_endpoints --iterations 50 --json bench_before.json
+# ... change something ...
+# python manage.py bench_endpoints --iterations 50 --json bench_after.json --compare bench_before.json
+
+class Command(BaseCommand):
+    help = "Benchmarks the main API endpoints and records latency percentiles, query counts and response bytes as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--user', default='', help="email of the user to benchmark as (default: most active photographer)")
+        parser.add_argument('--only', default='', help="comma separated endpoint names to run")
+        parser.add_argument('--cold', action='store_true', help="clear the cache before every request")
+        parser.add_argument('--json', dest='json_path', default='', help="write the report to this file")
+        parser.add_argument('--compare', default='', help="previous report to diff against")
+
+    def handle(self, *args, **options):
+        user = self.pick_user(options['user'])
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        endpoints = self.endpoints(user)
+        if options['only']:
+            wanted = set(options['only'].split(','))
+            endpoints = [e for e in endpoints if e[0] in wanted]
+
+        # reads are measured first against the untouched dataset. a write bumps cache
+        # namespaces, so writes get their own pass at the end
+        endpoints.sort(key=lambda endpoint: endpoint[1] != 'get')
+
+        results = {}
+        for name, method, url in endpoints:
+            results[name] = self.run_endpoint(client, method, url, options)
+            stats = results[name]
+            self.stdout.write(
+                f"{name:<28} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  "
+                f"queries {stats['queries']:>5}  bytes {stats['bytes']:>9}  [{stats['status']}]"
+            )
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'iterations': options['iterations'],
+                'cold_cache': options['cold'],
+                'user': user.email,
+                'dataset': {
+                    'users': User.objects.count(),
+                    'events': Event.objects.count(),
+                    'albums': Album.objects.count(),
+                    'photos': Photo.objects.count(),
+                    'comments': Comment.objects.count(),
+                    'notifications': Notification.objects.count(),
+                },
+            },
+            'endpoints': results,
+        }
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['json_path']}"))
+
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def pick_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if not user:
+                raise CommandError(f"No user with email {email}")
+            return user
+        # the photographer with the most photos, the heaviest lists to render
+        busiest = (
+            Photo.objects.order_by().values('photographer_id')
+            .annotate(photos=Count('id')).order_by('-photos', 'photographer_id').first()
+        )
+        if not busiest:
+            raise CommandError("No photos found, run seed_dataset first")
+        return User.objects.get(id=busiest['photographer_id'])
+
+    def endpoints(self, user):
+        event = Event.objects.order_by('id').first()
+        album = Album.objects.order_by('id').first()
+        photo = Photo.objects.order_by('-likes_cnt').first()
+        commented = Comment.objects.order_by('photo_id').values('photo_id').first()
+        commented_id = commented['photo_id'] if commented else photo.id
+
+        endpoints = [
+            ('photos.list', 'get', '/api/gallery/photos/'),
+            ('photos.my_photos', 'get', '/api/gallery/photos/my_photos/'),
+            ('photos.liked', 'get', '/api/gallery/photos/liked/'),
+            ('photos.retrieve', 'get', f'/api/gallery/photos/{photo.id}/'),
+            ('albums.list', 'get', '/api/gallery/albums/'),
+            ('events.list', 'get', '/api/gallery/events/'),
+            ('comments.list', 'get', f'/api/interactions/photos/{commented_id}/comments/'),
+            ('like.status', 'get', f'/api/interactions/photos/{photo.id}/like/'),
+            ('like.toggle', 'post', f'/api/interactions/photos/{photo.id}/like/'),
+            ('notifications.list', 'get', '/api/notifications/'),
+            ('notifications.unread_count', 'get', '/api/notifications/unread-count/'),
+            ('users.search', 'get', '/api/gallery/search/?q=seed'),
+            ('photos.map_world', 'get', '/api/gallery/photos/map/?zoom=3'),
+            ('photos.map_city', 'get', '/api/gallery/photos/map/?bbox=77.6,29.6,78.2,30.1&zoom=12'),
+        ]
+        if event:
+            endpoints += [
+                ('photos.list_by_event', 'get', f'/api/gallery/photos/?event_name={event.name}'),
+                ('events.retrieve', 'get', f'/api/gallery/events/{event.id}/'),
+            ]
+        if album:
+            endpoints.append(('albums.retrieve', 'get', f'/api/gallery/albums/{album.id}/'))
+        return endpoints
+
+    def run_endpoint(self, client, method, url, options):
+        request = getattr(client, method)
+        # writes are toggles (like/unlike), two per iteration leave the dataset as it was
+        repeat = 1 if method == 'get' else 2
+        for _ in range(options['warmup'] * repeat):
+            request(url)
+
+        timings, queries, query_time = [], [], []
+        response = None
+        for _ in range(options['iterations'] * repeat):
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = request(url)
+                timings.append(time.perf_counter() - started)
+            queries.append(len(ctx.captured_queries))
+            query_time.append(sum(float(q['time']) for q in ctx.captured_queries))
+
+        body = getattr(response, 'content', b'') if not getattr(response, 'streaming', False) else b''
+        return {
+            **summarize(timings),
+            'queries': max(queries) if queries else 0,
+            'sql_ms': round(sum(query_time) / len(query_time) * 1000, 3) if query_time else 0.0,
+            'bytes': len(body),
+            'status': response.status_code if response else None,
+            'url': url,
+            'write': method != 'get',
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+        except Exception:
+            return ''
+
+    def compare(self, path, report):
+        with open(path) as f:
+            previous = json.load(f)
+
+        self.stdout.write(f"\nvs {path} ({previous['meta'].get('commit') or 'unknown commit'})")
+        for name, stats in report['endpoints'].items():
+            old = previous['endpoints'].get(name)
+            if not old:
+                continue
+            p50_delta = (stats['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+            p95_delta = (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+            self.stdout.write(
+                f"{name:<28} p50 {p50_delta:>+7.1f}%  p95 {p95_delta:>+7.1f}%  "
+                f"queries {old['queries']:>5} -> {stats['queries']:<5}  bytes {old['bytes']:>9} -> {stats['bytes']}"
+            )
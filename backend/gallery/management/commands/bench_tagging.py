@@ -0,0 +1,112 @@
+import json
+import os
+import time
+from PIL import Image
+from django.core.management.base import BaseCommand, CommandError
+from gallery.models import Photo
+from config.perf_utils import summarize
+
+# python manage.py bench_tagging --iterations 3
+# the committed fixtures (gallery/fixtures/tagging) by default, the same set the parity
+# test in gallery/tests.py runs on. --images <dir> or --recent for other photos
+# 1. parity: every fixture image must get exactly the same nucleus tags
+#    (TOP_P / MAX_TAGS / MIN_CONFIDENCE) from the optimized backend as from eager.
+#    exits non zero on any mismatch, so it can gate a deploy
+# 2. throughput: images/sec + per image latency for each backend, single image
+#    (what tag_photo does) and batched
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'fixtures', 'tagging')
+
+class Command(BaseCommand):
+    help = "Checks tag parity of the optimized tagging backend against eager and benchmarks images/sec for both"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', default=FIXTURE_DIR, help="folder of images (default: gallery/fixtures/tagging)")
+        parser.add_argument('--recent', action='store_true', help="use the latest uploaded photos instead of a folder")
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--iterations', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--skip-parity', action='store_true')
+        parser.add_argument('--json', dest='json_path', default='')
+
+    def handle(self, *args, **options):
+        # imported here so the other management commands don't load torch
+        from gallery.ai_utils import predict_tags, get_model, BACKENDS
+
+        images = self.load_images('' if options['recent'] else options['images'], options['limit'])
+        if not images:
+            raise CommandError("No fixture images found")
+        self.stdout.write(f"{len(images)} fixture images")
+
+        for backend in BACKENDS:
+            started = time.perf_counter()
+            get_model(backend)
+            self.stdout.write(f"{backend:<10} model ready in {time.perf_counter() - started:.2f}s")
+
+        report = {'images': len(images), 'backends': {}}
+
+        if not options['skip_parity']:
+            mismatches = []
+            for name, img in images:
+                expected = predict_tags([img], 'eager')[0]
+                actual = predict_tags([img], 'optimized')[0]
+                if expected != actual:
+                    mismatches.append({'image': name, 'eager': expected, 'optimized': actual})
+            report['parity_mismatches'] = mismatches
+            for mismatch in mismatches:
+                self.stdout.write(self.style.ERROR(f"{mismatch['image']}: {mismatch['eager']} != {mismatch['optimized']}"))
+            if not mismatches:
+                self.stdout.write(self.style.SUCCESS("Parity OK: identical tags on every fixture image"))
+
+        for backend in BACKENDS:
+            report['backends'][backend] = {
+                'single': self.throughput(predict_tags, backend, images, 1, options['iterations']),
+                'batched': self.throughput(predict_tags, backend, images, options['batch_size'], options['iterations']),
+            }
+            for mode, stats in report['backends'][backend].items():
+                self.stdout.write(
+                    f"{backend:<10} {mode:<8} {stats['images_per_sec']:>8.2f} img/s  "
+                    f"p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms per call"
+                )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if report.get('parity_mismatches'):
+            raise CommandError(f"{len(report['parity_mismatches'])} images tagged differently by the optimized backend")
+
+    def load_images(self, folder, limit):
+        if folder:
+            paths = sorted(
+                os.path.join(folder, name) for name in os.listdir(folder)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            paths = [
+                photo.image.path for photo in Photo.objects.exclude(image='').order_by('-uploaded_at')[:limit]
+                if os.path.exists(photo.image.path)
+            ]
+
+        images = []
+        for path in paths[:limit]:
+            with Image.open(path) as img:
+                images.append((os.path.basename(path), img.convert('RGB')))
+        return images
+
+    def throughput(self, predict_tags, backend, images, batch_size, iterations):
+        predict_tags([images[0][1]], backend) # warm up
+        timings = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for i in range(0, len(images), batch_size):
+                call_started = time.perf_counter()
+                predict_tags([img for _, img in images[i:i + batch_size]], backend)
+                timings.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+        return {
+            **summarize(timings),
+            'batch_size': batch_size,
+            'images_per_sec': round(len(images) * iterations / elapsed, 2),
+        }
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from gallery.model_server import ModelServer
+
+# python manage.py run_model_server
+# one per host, next to the celery workers. they find it through AI_MODEL_SERVER_SOCKET
+
+class Command(BaseCommand):
+    help = "Runs the shared per-host tagging model server on AI_MODEL_SERVER_SOCKET"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default='', help="overrides AI_MODEL_SERVER_SOCKET")
+        parser.add_argument('--batch-size', type=int, default=settings.AI_MODEL_SERVER_BATCH_SIZE)
+        parser.add_argument('--batch-wait', type=float, default=settings.AI_MODEL_SERVER_BATCH_WAIT)
+
+    def handle(self, *args, **options):
+        address = options['socket'] or settings.AI_MODEL_SERVER_SOCKET
+        if not address:
+            raise CommandError("Set AI_MODEL_SERVER_SOCKET (or pass --socket)")
+
+        self.stdout.write(f"Loading {settings.AI_TAGGING_BACKEND} model, serving on {address}")
+        ModelServer(address, batch_size=options['batch_size'], batch_wait=options['batch_wait']).serve_forever()
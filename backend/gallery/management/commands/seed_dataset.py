@@ -0,0 +1,231 @@
+import os
+import random
+from datetime import date, timedelta
+from io import BytesIO
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from gallery.models import Event, Album, Photo
+from interactions.models import Comment, Like
+from notifications.models import Notification
+
+User = get_user_model()
+
+# python manage.py seed_dataset --users 500 --events 40 --photos 20000 --seed 7
+# everything is created with bulk_create, so no signals fire and no celery work is queued
+
+SEED_EMAIL_DOMAIN = 'seed.memorise.test'
+PLACEHOLDER_COUNT = 8 # distinct tiny images shared by all photos
+ROLES = ['Photographer', 'Photographer', 'Member', 'Member', 'Guest', 'Coordinator']
+CAMERAS = [('Canon', 'EOS R5'), ('Nikon', 'Z 6II'), ('Sony', 'ILCE-7M4'), ('Fujifilm', 'X-T5')]
+BATCH_SIZE = 2000
+SEED_CENTER = (29.8649, 77.8966) # photos are spread around this (lat, lon), most events within ~20km
+GEOTAGGED_SHARE = 0.7
+
+class Command(BaseCommand):
+    help = "Generates a reproducible synthetic dataset for benchmarking (users, events, albums, photos, likes, comments, notifications)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument('--albums-per-event', type=int, default=4)
+        parser.add_argument('--photos', type=int, default=5000)
+        parser.add_argument('--likes', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--reply-ratio', type=float, default=0.3, help="share of comments that are replies")
+        parser.add_argument('--notifications', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help="delete a previously seeded dataset first")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').delete()
+            Event.objects.filter(name__startswith='Seed Event').delete()
+            self.stdout.write(f"Cleared {deleted} seeded rows")
+
+        images = self.write_placeholders()
+
+        with transaction.atomic():
+            users = self.create_users(rng, options['users'])
+            events = self.create_events(rng, options['events'], users)
+            albums = self.create_albums(rng, events, options['albums_per_event'], users)
+            photos = self.create_photos(rng, options['photos'], events, albums, users, images)
+            self.create_tags(rng, photos, users)
+            self.create_likes(rng, options['likes'], photos, users)
+            self.create_comments(rng, options['comments'], options['reply_ratio'], photos, users)
+            self.create_notifications(rng, options['notifications'], photos, users)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(events)} events, {len(albums)} albums, {len(photos)} photos"
+        ))
+
+    def write_placeholders(self):
+        # a handful of 16x16 jpegs on disk, every photo/thumbnail points at one of them
+        folder = os.path.join(settings.MEDIA_ROOT, 'event_photos', 'seed')
+        os.makedirs(folder, exist_ok=True)
+        names = []
+        for i in range(PLACEHOLDER_COUNT):
+            name = f'event_photos/seed/placeholder_{i}.jpg'
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.exists(path):
+                colour = ((i * 37) % 256, (i * 91) % 256, (i * 151) % 256)
+                buffer = BytesIO()
+                Image.new('RGB', (16, 16), colour).save(buffer, format='JPEG', quality=70)
+                with open(path, 'wb') as f:
+                    f.write(buffer.getvalue())
+            names.append(name)
+        return names
+
+    def create_users(self, rng, count):
+        # hashing is slow, every seeded user shares one password ("seed-password")
+        password = make_password('seed-password')
+        start = User.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').count()
+        users = [
+            User(
+                email=f'user{start + i}@{SEED_EMAIL_DOMAIN}',
+                full_name=f'Seed User {start + i}',
+                role=rng.choice(ROLES),
+                password=password,
+                email_otp='SEEDSEEDSEEDSEED', # bulk_create skips CustomUser.save()
+                is_verified=True,
+            )
+            for i in range(count)
+        ]
+        return User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+
+    def create_events(self, rng, count, users):
+        coordinators = [u for u in users if u.role == 'Coordinator'] or users
+        today = date.today()
+        events = [
+            Event(
+                name=f'Seed Event {i}',
+                description=f'Synthetic event number {i}',
+                date=today - timedelta(days=rng.randint(0, 720)),
+                location=rng.choice(['Main Hall', 'Sports Ground', 'Auditorium', 'Lecture Hall Complex']),
+                coordinator=rng.choice(coordinators),
+            )
+            for i in range(count)
+        ]
+        return Event.objects.bulk_create(events, batch_size=BATCH_SIZE)
+
+    def create_albums(self, rng, events, per_event, users):
+        albums = [
+            Album(event=event, owner=rng.choice(users), name=f'{event.name} / Album {i}', is_public=rng.random() < 0.2)
+            for event in events
+            for i in range(per_event)
+        ]
+        return Album.objects.bulk_create(albums, batch_size=BATCH_SIZE)
+
+    def create_photos(self, rng, count, events, albums, users, images):
+        photographers = [u for u in users if u.role == 'Photographer'] or users
+        # each event happens somewhere, its photos scatter a few hundred metres around that
+        venues = {event.id: (SEED_CENTER[0] + rng.gauss(0, 0.1), SEED_CENTER[1] + rng.gauss(0, 0.1)) for event in events}
+        photos = []
+        for i in range(count):
+            album = rng.choice(albums) if albums and rng.random() < 0.8 else None
+            event = album.event if album else (rng.choice(events) if events else None)
+            make, model = rng.choice(CAMERAS)
+            image = rng.choice(images)
+            latitude = longitude = None
+            if rng.random() < GEOTAGGED_SHARE:
+                venue = venues.get(event.id if event else None, SEED_CENTER)
+                latitude, longitude = venue[0] + rng.gauss(0, 0.003), venue[1] + rng.gauss(0, 0.003)
+            photos.append(Photo(
+                event=event,
+                album=album,
+                image=image,
+                thumbnail=image,
+                is_processed=True,
+                photographer=rng.choice(photographers),
+                title=f'Seed photo {i}',
+                exif_data={
+                    'Make': make,
+                    'Model': model,
+                    'DateTimeOriginal': f'2025:{rng.randint(1, 12):02d}:{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00',
+                    'ExposureTime': str(rng.choice(['1/60', '1/250', '1/1000', '1/4000'])),
+                    'FNumber': str(rng.choice([1.8, 2.8, 4.0, 8.0])),
+                    'ISOSpeedRatings': str(rng.choice([100, 400, 1600, 3200])),
+                    'FocalLength': str(rng.choice([24, 35, 50, 85])),
+                },
+                manual_tags=rng.sample(['Landscape', 'Portrait', 'Daylight', 'Low Light', 'Bokeh', make], 2),
+                auto_tags=rng.sample(['stage', 'crowd', 'microphone', 'suit', 'jersey', 'scoreboard'], 3),
+                is_public=rng.random() < 0.1,
+                latitude=latitude,
+                longitude=longitude,
+            ))
+        return Photo.objects.bulk_create(photos, batch_size=BATCH_SIZE)
+
+    def create_tags(self, rng, photos, users):
+        through = Photo.tagged_users.through
+        rows = []
+        for photo in photos:
+            for user in rng.sample(users, min(len(users), rng.randint(0, 3))):
+                rows.append(through(photo_id=photo.id, customuser_id=user.id))
+        through.objects.bulk_create(rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    def create_likes(self, rng, count, photos, users):
+        if not photos or not users:
+            return
+        count = min(count, len(photos) * len(users))
+        pairs = set()
+        while len(pairs) < count:
+            pairs.add((rng.randrange(len(users)), rng.randrange(len(photos))))
+
+        likes = [Like(user=users[u], photo=photos[p]) for u, p in pairs]
+        Like.objects.bulk_create(likes, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        # keep the denormalised counter consistent with the rows
+        per_photo = {}
+        for _, p in pairs:
+            per_photo[p] = per_photo.get(p, 0) + 1
+        for p, likes_cnt in per_photo.items():
+            photos[p].likes_cnt = likes_cnt
+        Photo.objects.bulk_update([photos[p] for p in per_photo], ['likes_cnt'], batch_size=BATCH_SIZE)
+
+    def create_comments(self, rng, count, reply_ratio, photos, users):
+        if not photos or not users:
+            return
+        top_level_count = max(1, int(count * (1 - reply_ratio)))
+        top_level = Comment.objects.bulk_create([
+            Comment(user=rng.choice(users), photo=rng.choice(photos), content=f'Seed comment {i}')
+            for i in range(top_level_count)
+        ], batch_size=BATCH_SIZE)
+
+        # replies hang off existing comments on the same photo, some nested a level deeper
+        parents = list(top_level)
+        replies = []
+        for i in range(count - top_level_count):
+            parent = rng.choice(parents)
+            replies.append(Comment(user=rng.choice(users), photo_id=parent.photo_id, parent=parent, content=f'Seed reply {i}'))
+        replies = Comment.objects.bulk_create(replies, batch_size=BATCH_SIZE)
+
+        through = Comment.likes.through
+        rows = []
+        for comment in rng.sample(top_level + replies, min(len(top_level) + len(replies), count // 2)):
+            for user in rng.sample(users, min(len(users), rng.randint(1, 3))):
+                rows.append(through(comment_id=comment.id, customuser_id=user.id))
+        through.objects.bulk_create(rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    def create_notifications(self, rng, count, photos, users):
+        if not photos or len(users) < 2:
+            return
+        photo_type = ContentType.objects.get_for_model(Photo)
+        verbs = ['liked your photo', 'commented on your photo', 'tagged you in a photo: Event']
+        notifications = []
+        for _ in range(count):
+            photo = rng.choice(photos)
+            notifications.append(Notification(
+                recipient_id=photo.photographer_id,
+                actor=rng.choice(users),
+                verb=rng.choice(verbs),
+                content_type=photo_type,
+                object_id=photo.id,
+                is_read=rng.random() < 0.6,
+            ))
+        Notification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
@@ -0,0 +1,176 @@
+import hashlib
+import math
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Max, Q
+from django.db.models.functions import Coalesce, Floor
+from config.cache_utils import get_versions
+from .models import Photo
+from .permissions import LOCATION_PRECISION
+
+# server side clustering for the photo map.
+#
+# at zoom z the world is cut into square tiles of 360 / 2^z degrees (the slippy map
+# tiling, in plain degrees), each tile into CELLS_PER_SIDE^2 cells. photos are grouped
+# per cell with one GROUP BY over the (latitude, longitude) index: count, centroid and
+# a representative photo (newest with a thumbnail).
+#
+# results are cached per tile and zoom, keyed by the version of the namespace
+# 'map:<z>:<x>:<y>'. saving or deleting a geotagged photo bumps the tile it sits in at
+# every zoom level (gallery/invalidation.py), so only those tiles are recomputed.
+# a viewport at zoom z is a handful of tiles: hits come straight from the cache and all
+# missing tiles are filled by a single query
+
+MAX_ZOOM = 13 # cells are ~1.2km here, no finer than LOCATION_PRECISION. deeper zooms reuse it
+MAX_TILES = 64 # per request, a wider viewport is answered at a lower zoom
+CELLS_PER_SIDE = 4
+
+def tile_size(zoom):
+    return 360.0 / (2 ** zoom)
+
+def clamp_zoom(zoom):
+    return max(0, min(int(zoom), MAX_ZOOM))
+
+def index(value, size, count):
+    # value already shifted to start at 0 (lon + 180 / lat + 90)
+    return max(0, min(int(math.floor(value / size)), count - 1))
+
+def tile_counts(zoom):
+    columns = 2 ** zoom
+    rows = max(1, math.ceil(180.0 / tile_size(zoom)))
+    return columns, rows
+
+def tile_of(latitude, longitude, zoom):
+    size = tile_size(zoom)
+    columns, rows = tile_counts(zoom)
+    return index(longitude + 180, size, columns), index(latitude + 90, size, rows)
+
+def location_namespaces(latitude, longitude):
+    # every zoom's tile containing this point
+    namespaces = []
+    for zoom in range(MAX_ZOOM + 1):
+        x, y = tile_of(latitude, longitude, zoom)
+        namespaces.append(f"map:{zoom}:{x}:{y}")
+    return namespaces
+
+def longitude_segments(min_lon, max_lon):
+    # a box crossing the antimeridian is two boxes
+    return [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+
+def viewport_ranges(bbox, zoom):
+    # (column ranges, row range) of the tiles covering the box
+    min_lon, min_lat, max_lon, max_lat = bbox
+    size = tile_size(zoom)
+    columns, rows = tile_counts(zoom)
+    ys = range(index(min_lat + 90, size, rows), index(max_lat + 90, size, rows) + 1)
+    xs = [
+        range(index(low + 180, size, columns), index(high + 180, size, columns) + 1)
+        for low, high in longitude_segments(min_lon, max_lon)
+    ]
+    if len(xs) == 2 and xs[1].stop > xs[0].start:
+        xs = [range(columns)] # both halves overlap at this zoom, that's every column
+    return xs, ys
+
+def viewport_tiles(bbox, zoom):
+    xs, ys = viewport_ranges(bbox, zoom)
+    return [(x, y) for span in xs for x in span for y in ys]
+
+def fit_zoom(bbox, zoom):
+    # largest zoom <= the requested one where the viewport stays within MAX_TILES,
+    # counted without listing the tiles (a world view at zoom 16 is billions of them)
+    zoom = clamp_zoom(zoom)
+    while zoom > 0:
+        xs, ys = viewport_ranges(bbox, zoom)
+        if sum(len(span) for span in xs) * len(ys) <= MAX_TILES:
+            break
+        zoom -= 1
+    return zoom
+
+def compute_tiles(queryset, zoom, tiles):
+    # {(x, y): [cell, ...]} for the given tiles, from one GROUP BY per row span of tiles
+    size = tile_size(zoom)
+    cell = size / CELLS_PER_SIDE
+    columns, rows = tile_counts(zoom)
+    result = {tile: [] for tile in tiles}
+    xs = sorted({x for x, _ in tiles})
+    ys = [y for _, y in tiles]
+
+    # contiguous column runs, so an antimeridian crossing stays two narrow queries
+    runs = []
+    for x in xs:
+        if runs and x == runs[-1][1] + 1:
+            runs[-1][1] = x
+        else:
+            runs.append([x, x])
+
+    # upper edges are exclusive, except for the last row/column (90 / 180 themselves)
+    latitude_range = {'latitude__gte': min(ys) * size - 90}
+    latitude_range['latitude__lte' if max(ys) == rows - 1 else 'latitude__lt'] = (max(ys) + 1) * size - 90
+
+    for first, last in runs:
+        longitude_range = {'longitude__gte': first * size - 180}
+        longitude_range['longitude__lte' if last == columns - 1 else 'longitude__lt'] = (last + 1) * size - 180
+        grouped = (
+            queryset.filter(**latitude_range, **longitude_range)
+            .order_by()
+            .annotate(
+                cell_x=Floor((F('longitude') + 180) / cell),
+                cell_y=Floor((F('latitude') + 90) / cell),
+            )
+            .values('cell_x', 'cell_y')
+            .annotate(
+                count=Count('id'),
+                latitude_avg=Avg('latitude'),
+                longitude_avg=Avg('longitude'),
+                photo_id=Coalesce(Max('id', filter=Q(thumbnail__gt='')), Max('id')),
+            )
+        )
+        for row in grouped:
+            # clamped like index(), a photo at exactly 180/90 lands in the last tile
+            tile = (
+                min(int(row['cell_x']) // CELLS_PER_SIDE, columns - 1),
+                min(int(row['cell_y']) // CELLS_PER_SIDE, rows - 1),
+            )
+            if tile in result:
+                result[tile].append({
+                    'count': row['count'],
+                    'latitude': round(row['latitude_avg'], LOCATION_PRECISION),
+                    'longitude': round(row['longitude_avg'], LOCATION_PRECISION),
+                    'photo_id': row['photo_id'],
+                })
+
+    # the representative's thumbnail is part of the cached tile, process_photo bumps it
+    photo_ids = [c['photo_id'] for cells in result.values() for c in cells]
+    photos = {
+        photo_id: (thumbnail, color)
+        for photo_id, thumbnail, color in Photo.objects.filter(id__in=photo_ids).values_list('id', 'thumbnail', 'dominant_color')
+    }
+    for cells in result.values():
+        for c in cells:
+            c['thumbnail'], c['dominant_color'] = photos.get(c['photo_id'], ('', ''))
+    return result
+
+def clusters(bbox, zoom, event_id=None):
+    # (zoom actually used, [cluster, ...]) for a viewport
+    zoom = fit_zoom(bbox, zoom)
+    tiles = viewport_tiles(bbox, zoom)
+    scope = f"event:{event_id}" if event_id else 'all'
+
+    namespaces = [f"map:{zoom}:{x}:{y}" for x, y in tiles]
+    keys = {
+        tile: f"map_tile:{version}:{hashlib.md5(f'{scope}|{zoom}|{tile[0]}|{tile[1]}'.encode()).hexdigest()}"
+        for tile, version in zip(tiles, get_versions(namespaces))
+    }
+    found = cache.get_many(list(keys.values()))
+    cells = {tile: found[key] for tile, key in keys.items() if key in found}
+
+    missing = [tile for tile in tiles if tile not in cells]
+    if missing:
+        queryset = Photo.objects.filter(latitude__isnull=False)
+        if event_id:
+            queryset = queryset.filter(event_id=event_id)
+        computed = compute_tiles(queryset, zoom, missing)
+        cache.set_many({keys[tile]: value for tile, value in computed.items()}, settings.API_CACHE_TIMEOUT)
+        cells.update(computed)
+
+    return zoom, [c for tile in tiles for c in cells[tile]]
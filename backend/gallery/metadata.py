@@ -0,0 +1,213 @@
+import logging
+import re
+from datetime import datetime
+from django.utils import timezone
+from PIL import Image, ExifTags
+
+logger = logging.getLogger(__name__)
+
+# photo metadata straight from the file header, no pixels are decoded and for jpeg
+# nothing past the start of the image data is read (the exif/xmp segments are usually
+# well under 64KB). works on any seekable file: an upload before it's saved, a storage
+# file in process_photo / backfills, a file on disk in an import.
+#
+# extract_metadata(f) -> {
+#   'fields':     every exif tag by name (IFD0 + Exif IFD), raw values
+#   'exif_data':  the INTERESTING_FIELDS as strings, what Photo.exif_data stores
+#   'date_taken': aware datetime (exif DateTimeOriginal, xmp dates as fallback) or None
+#   'latitude', 'longitude': decimal degrees or None (exif GPS IFD, xmp as fallback)
+#   'width', 'height': pixel size as displayed (exif orientation applied) or None
+# }
+
+INTERESTING_FIELDS = ['Make', 'Model', 'DateTimeOriginal', 'ExposureTime', 'FNumber', 'ISOSpeedRatings', 'FocalLength', 'LensModel']
+SKIPPED_FIELDS = ['MakerNote', 'UserComment'] # large vendor blobs
+HEADER_LIMIT = 1024 * 1024 # stop walking jpeg segments after this many bytes
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+ORIENTATION = 0x0112
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+EXIF_HEADER = b'Exif\x00\x00'
+# start of frame markers carry the pixel size (c4/c8/cc are other tables)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+XMP_DATE_FIELDS = ['exif:DateTimeOriginal', 'photoshop:DateCreated', 'xmp:CreateDate']
+
+def empty_metadata():
+    return {'fields': {}, 'exif_data': {}, 'date_taken': None, 'latitude': None, 'longitude': None, 'width': None, 'height': None}
+
+def read_jpeg_header(f):
+    # (exif bytes, xmp bytes, (width, height)) from the segments before the scan, None if not a jpeg
+    f.seek(0)
+    if f.read(2) != b'\xff\xd8':
+        return None
+    exif = xmp = size = None
+    position = 2
+    while position < HEADER_LIMIT:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        kind = marker[1]
+        if kind == 0xFF:
+            f.seek(-1, 1) # fill byte, the marker starts one byte later
+            position += 1
+            continue
+        if kind == 0x01 or 0xD0 <= kind <= 0xD8:
+            position += 2
+            continue # standalone markers, no length
+        if kind in (0xD9, 0xDA):
+            break # end of image / start of scan: pixel data from here on
+
+        length = int.from_bytes(f.read(2), 'big')
+        if length < 2:
+            break
+        if kind == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(EXIF_HEADER) and exif is None:
+                exif = data
+            elif data.startswith(XMP_HEADER) and xmp is None:
+                xmp = data[len(XMP_HEADER):]
+        elif kind in SOF_MARKERS:
+            data = f.read(length - 2)
+            if len(data) >= 5:
+                size = (int.from_bytes(data[3:5], 'big'), int.from_bytes(data[1:3], 'big'))
+        else:
+            f.seek(length - 2, 1)
+        position += length + 2
+    return exif, xmp, size
+
+def read_other_header(f):
+    # png, webp, tiff, heif (with a plugin)...: PIL's open only parses the header
+    f.seek(0)
+    with Image.open(f) as img:
+        exif = img.getexif()
+        xmp = img.info.get('xmp') or img.info.get('XML:com.adobe.xmp')
+        return exif, xmp, img.size
+
+def exif_fields(exif):
+    fields = {}
+    for ifd in (exif, exif.get_ifd(EXIF_IFD)):
+        for tag_id, value in ifd.items():
+            name = ExifTags.TAGS.get(tag_id, tag_id)
+            if name in SKIPPED_FIELDS or tag_id in (EXIF_IFD, GPS_IFD):
+                continue
+            fields[name] = value
+    return fields
+
+def parse_exif_datetime(value):
+    # "2025:03:14 18:02:11" -> aware datetime, None when missing or garbage
+    try:
+        return timezone.make_aware(datetime.strptime(str(value).strip()[:19], '%Y:%m:%d %H:%M:%S'))
+    except (ValueError, TypeError):
+        return None
+
+def parse_xmp_datetime(value):
+    # ISO 8601, with or without an offset
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except (ValueError, AttributeError):
+        return None
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+def valid_coordinates(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None, None
+    # 0,0 is what a camera without a fix writes
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (latitude == 0 and longitude == 0):
+        return None, None
+    return round(latitude, 7), round(longitude, 7)
+
+def gps_coordinate(values, ref):
+    try:
+        degrees, minutes, seconds = (float(v) for v in values)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    value = degrees + minutes / 60 + seconds / 3600
+    ref = ref.decode(errors='ignore') if isinstance(ref, bytes) else str(ref or '')
+    return -value if ref.strip().upper()[:1] in ('S', 'W') else value
+
+def exif_coordinates(exif):
+    gps = exif.get_ifd(GPS_IFD)
+    # 1/2 = latitude ref/value, 3/4 = longitude ref/value
+    if 2 not in gps or 4 not in gps:
+        return None, None
+    return valid_coordinates(gps_coordinate(gps[2], gps.get(1)), gps_coordinate(gps[4], gps.get(3)))
+
+def xmp_value(xmp, name):
+    # attribute (exif:GPSLatitude="...") or element (<exif:GPSLatitude>...</...>) form
+    match = re.search(rf'{re.escape(name)}="([^"]*)"|<{re.escape(name)}>([^<]*)</{re.escape(name)}>', xmp)
+    if not match:
+        return None
+    return match.group(1) if match.group(1) is not None else match.group(2)
+
+def xmp_coordinate(value):
+    # "51,30.4512N" or "51,30,27.07N"
+    match = re.fullmatch(r'\s*(\d+),(\d+(?:\.\d+)?)(?:,(\d+(?:\.\d+)?))?\s*([NSEWnsew])\s*', value or '')
+    if not match:
+        return None
+    degrees, minutes, seconds, ref = match.groups()
+    return gps_coordinate((degrees, minutes, seconds or 0), ref)
+
+def xmp_metadata(xmp):
+    if isinstance(xmp, bytes):
+        xmp = xmp.decode('utf-8', errors='ignore')
+    date_taken = None
+    for name in XMP_DATE_FIELDS:
+        date_taken = parse_xmp_datetime(xmp_value(xmp, name))
+        if date_taken:
+            break
+    latitude, longitude = valid_coordinates(
+        xmp_coordinate(xmp_value(xmp, 'exif:GPSLatitude')),
+        xmp_coordinate(xmp_value(xmp, 'exif:GPSLongitude')),
+    )
+    return date_taken, latitude, longitude
+
+def extract_metadata(f):
+    # never raises: a file we can't parse just has no metadata
+    metadata = empty_metadata()
+    try:
+        header = read_jpeg_header(f)
+        if header is None:
+            exif, xmp, size = read_other_header(f)
+        else:
+            exif_bytes, xmp, size = header
+            exif = Image.Exif()
+            if exif_bytes:
+                exif.load(exif_bytes)
+
+        fields = exif_fields(exif)
+        metadata['fields'] = fields
+        metadata['exif_data'] = {k: str(v) for k, v in fields.items() if k in INTERESTING_FIELDS}
+        metadata['date_taken'] = parse_exif_datetime(fields.get('DateTimeOriginal'))
+        metadata['latitude'], metadata['longitude'] = exif_coordinates(exif)
+
+        if xmp and (metadata['date_taken'] is None or metadata['latitude'] is None):
+            date_taken, latitude, longitude = xmp_metadata(xmp)
+            metadata['date_taken'] = metadata['date_taken'] or date_taken
+            if metadata['latitude'] is None:
+                metadata['latitude'], metadata['longitude'] = latitude, longitude
+
+        if size:
+            width, height = size
+            if exif.get(ORIENTATION) in (5, 6, 7, 8):
+                width, height = height, width # rotated by 90 degrees when displayed
+            metadata['width'], metadata['height'] = width, height
+    except Exception as e:
+        logger.warning(f"Could not read photo metadata: {e}")
+    finally:
+        try:
+            f.seek(0)
+        except Exception:
+            pass
+    return metadata
+
+def photo_fields(metadata):
+    # the Photo columns filled from extract_metadata()
+    width, height = metadata['width'], metadata['height']
+    return {
+        'exif_data': metadata['exif_data'],
+        'date_taken': metadata['date_taken'],
+        'latitude': metadata['latitude'],
+        'longitude': metadata['longitude'],
+        'width': width,
+        'height': height,
+        'aspect_ratio': round(width / height, 4) if width and height else None,
+    }
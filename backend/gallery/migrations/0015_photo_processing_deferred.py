@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0014_alter_photo_share_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='processing_deferred',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(condition=models.Q(('processing_deferred', True)), fields=['uploaded_at'], name='photo_deferred_idx'),
+        ),
+    ]
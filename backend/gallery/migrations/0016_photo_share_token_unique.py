@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-19 14:05
+
+import uuid
+from django.db import migrations, models
+
+
+def regenerate_duplicate_tokens(apps, schema_editor):
+    # 0010 added share_token with a callable default, which gives every existing
+    # row the same uuid, that's what kept the unique constraint from sticking
+    Photo = apps.get_model('gallery', 'Photo')
+    duplicates = (
+        Photo.objects.values('share_token')
+        .annotate(n=models.Count('id'))
+        .filter(n__gt=1)
+        .values_list('share_token', flat=True)
+    )
+    for token in list(duplicates):
+        for photo in Photo.objects.filter(share_token=token).only('id'):
+            photo.share_token = uuid.uuid4()
+            photo.save(update_fields=['share_token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0015_photo_processing_deferred'),
+    ]
+
+    operations = [
+        migrations.RunPython(regenerate_duplicate_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='photo',
+            name='share_token',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
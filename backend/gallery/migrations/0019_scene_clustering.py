@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0018_photoembedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='is_draft',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='date_taken',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='suggested_album',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suggested_photos', to='gallery.album'),
+        ),
+    ]
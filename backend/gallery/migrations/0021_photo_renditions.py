@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+def flag_watermarked_originals(apps, schema_editor):
+    # watermark_photo used to overwrite image in place, so processed photos from
+    # before this have no clean original left. they're served as is, never stamped twice
+    Photo = apps.get_model('gallery', 'Photo')
+    Photo.objects.filter(is_processed=True).update(original_watermarked=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0020_backfillrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='thumbnail_version',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='watermarked',
+            field=models.ImageField(blank=True, null=True, upload_to='photos/watermarked/'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='watermark_version',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='original_watermarked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(flag_watermarked_originals, migrations.RunPython.noop),
+    ]
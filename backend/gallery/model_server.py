@@ -0,0 +1,160 @@
+import logging
+import os
+import queue
+import threading
+import time
+from io import BytesIO
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# one resnet per host instead of one per process:
+#
+#   python manage.py run_model_server     (owns the model, listens on AI_MODEL_SERVER_SOCKET)
+#
+# clients (ai_utils.analyze_image in celery/web processes) keep a connection open and
+# send {'image': <jpeg/png bytes>} or {'tensor': <preprocessed 3x224x224 array>}. the
+# server queues requests from every connection and runs them through the model in
+# batches of up to AI_MODEL_SERVER_BATCH_SIZE, waiting at most AI_MODEL_SERVER_BATCH_WAIT
+# for a batch to fill. when the socket isn't configured or the server is down,
+# request_prediction returns None and the caller runs the model in process as before.
+#
+# this module must not import torch, clients only need the socket
+
+def authkey():
+    # connections are pickled, so only processes that know the django secret may talk to it
+    return settings.SECRET_KEY.encode()
+
+class ModelServer:
+    def __init__(self, address, batch_size=16, batch_wait=0.02, backend=None):
+        self.address = address
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.backend = backend
+        self.requests = queue.Queue()
+
+    def serve_forever(self):
+        from .ai_utils import get_model
+        get_model(self.backend) # load once up front, not on the first request
+
+        if os.path.exists(self.address):
+            os.unlink(self.address) # stale socket from a previous run
+        listener = Listener(self.address, family='AF_UNIX', authkey=authkey())
+        os.chmod(self.address, 0o660)
+        logger.info(f"Model server listening on {self.address}")
+
+        threading.Thread(target=self.batch_loop, daemon=True).start()
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    logger.warning(f"Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self.handle_client, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def handle_client(self, conn):
+        # clients reuse one connection for every request they make
+        reply = queue.Queue(maxsize=1)
+        try:
+            while True:
+                message = conn.recv()
+                self.requests.put((message, reply))
+                conn.send(reply.get())
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def batch_loop(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.run_batch(batch)
+
+    def run_batch(self, batch):
+        from PIL import Image
+        from .ai_utils import predict
+
+        inputs, replies = [], []
+        for message, reply in batch:
+            try:
+                if 'tensor' in message:
+                    inputs.append(message['tensor'])
+                else:
+                    inputs.append(Image.open(BytesIO(message['image'])).convert('RGB'))
+                replies.append(reply)
+            except Exception as e:
+                reply.put({'error': f"Unreadable input: {e}"})
+
+        if not inputs:
+            return
+        try:
+            results = predict(inputs, self.backend)
+        except Exception as e:
+            logger.error(f"Model server batch of {len(inputs)} failed: {e}", exc_info=True)
+            for reply in replies:
+                reply.put({'error': str(e)})
+            return
+        for reply, (tags, embedding) in zip(replies, results):
+            reply.put({'tags': tags, 'embedding': embedding})
+
+# client side, one connection per process (celery prefork children reconnect)
+
+_local = threading.local()
+_unavailable_until = 0.0
+
+def get_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = Client(settings.AI_MODEL_SERVER_SOCKET, family='AF_UNIX', authkey=authkey())
+    _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def drop_connection():
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+def request_prediction(image_bytes=None, tensor=None):
+    # (tags, embedding) from the model server, or None when the caller should fall back to in process inference
+    global _unavailable_until
+    address = settings.AI_MODEL_SERVER_SOCKET
+    if not address or time.monotonic() < _unavailable_until:
+        return None
+
+    message = {'tensor': tensor} if tensor is not None else {'image': image_bytes}
+    try:
+        conn = get_connection()
+        conn.send(message)
+        if not conn.poll(settings.AI_MODEL_SERVER_TIMEOUT):
+            raise TimeoutError(f"no reply within {settings.AI_MODEL_SERVER_TIMEOUT}s")
+        reply = conn.recv()
+    except (OSError, EOFError, AuthenticationError, TimeoutError) as e:
+        drop_connection()
+        # don't pay a connect attempt per photo while the server is down
+        _unavailable_until = time.monotonic() + settings.AI_MODEL_SERVER_RETRY
+        logger.warning(f"Model server unavailable, tagging in process: {e}")
+        return None
+
+    if 'error' in reply:
+        # same as a failure in process, running it again locally wouldn't help
+        logger.warning(f"Model server could not tag image: {reply['error']}")
+        return [], None
+    return reply['tags'], reply['embedding']
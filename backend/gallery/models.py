@@ -14,6 +14,7 @@ class Event(models.Model):
     date = models.DateField()
     location = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     cover_image = models.ImageField(upload_to='covers/', null=True, blank=True)
 
     # event owned by co-ordinator
@@ -48,18 +49,22 @@ class Album(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     cover_image = models.ImageField(upload_to='album_covers/', null=True, blank=True)
 
     is_public = models.BooleanField(default=False)
     share_token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)  
    # to generate shareable public link
+
+    # suggested by scene clustering (gallery/clustering.py), only the owner sees it until accepted
+    is_draft = models.BooleanField(default=False)
     def __str__(self):
         return self.name
 
 
 class Photo(models.Model):
     is_public = models.BooleanField(default=False)
-    share_token = models.UUIDField(default=uuid.uuid4, editable=False)
+    share_token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 
     event = models.ForeignKey(
         Event, 
@@ -77,10 +82,34 @@ class Photo(models.Model):
         related_name='photos'
     )
 
+    # draft album scene clustering put this photo in, moved to album once accepted
+    suggested_album = models.ForeignKey(
+        Album,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='suggested_photos'
+    )
+
+    # the upload exactly as received, never rewritten. derived files are rendered from it (gallery/renditions.py)
     image = models.ImageField(upload_to='event_photos/')
     # for celery tasks
     thumbnail = models.ImageField(upload_to='photos/thumbnails/', blank=True, null=True)
+    thumbnail_version = models.CharField(max_length=12, blank=True, default='')
+    watermarked = models.ImageField(upload_to='photos/watermarked/', blank=True, null=True)
+    watermark_version = models.CharField(max_length=12, blank=True, default='')
+    # processed before originals were kept: image already carries the watermark
+    original_watermarked = models.BooleanField(default=False)
+
+    # filled by process_photo so clients can lay out a grid before any image loads
+    width = models.PositiveIntegerField(null=True, blank=True) # as displayed, exif rotation applied
+    height = models.PositiveIntegerField(null=True, blank=True)
+    aspect_ratio = models.FloatField(null=True, blank=True) # width / height
+    dominant_color = models.CharField(max_length=7, blank=True, default='') # '#rrggbb'
+    placeholder = models.TextField(blank=True, default='') # data uri of a 16px preview
     is_processed = models.BooleanField(default=False)
+    # accepted while the processing backlog was full, picked up by drain_deferred_photos
+    processing_deferred = models.BooleanField(default=False)
 
     description = models.TextField(blank=True, null=True)
     tagged_users = models.ManyToManyField(
@@ -98,6 +127,10 @@ class Photo(models.Model):
     )
 
     exif_data = models.JSONField(default=dict, blank=True)
+    date_taken = models.DateTimeField(null=True, blank=True, db_index=True) # exif DateTimeOriginal
+    # exif/xmp gps, decimal degrees (gallery/metadata.py)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -108,6 +141,81 @@ class Photo(models.Model):
     auto_tags = models.JSONField(default=list, blank=True)
     title = models.CharField(max_length=255, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # only the handful of deferred rows are indexed
+            models.Index(fields=['uploaded_at'], condition=models.Q(processing_deferred=True), name='photo_deferred_idx'),
+            # bounding box queries, only geotagged rows are indexed
+            models.Index(fields=['latitude', 'longitude'], condition=models.Q(latitude__isnull=False), name='photo_geo_idx'),
+        ]
+
     def __str__(self):
         return f"Photo {self.id} by {self.photographer}"
 
+    @property
+    def display_image(self):
+        # file shown in the app and on share pages. the original is never exposed: the current
+        # watermarked copy once it's rendered, the thumbnail until then (empty before processing)
+        from .renditions import watermark_is_current
+
+        if self.original_watermarked:
+            return self.image
+        if watermark_is_current(self):
+            return self.watermarked
+        return self.thumbnail
+
+
+# pooled penultimate resnet features, kept in their own table so photo queries
+# don't drag 4KB blobs along. L2 normalised float16 (gallery/vector_index.py)
+class PhotoEmbedding(models.Model):
+    photo = models.OneToOneField(Photo, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    vector = models.BinaryField()
+    model = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True) # the vector index syncs on this
+
+    def __str__(self):
+        return f"Embedding of photo {self.photo_id} ({self.model})"
+
+# checkpoint of a library wide reprocessing run (manage.py backfill_photos)
+class BackfillRun(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    options = models.JSONField(default=dict) # task + filters the run was started with
+    last_id = models.BigIntegerField(default=0) # photos are walked in id order, everything <= this is queued
+    queued = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Backfill {self.name} ({self.queued}/{self.total})"
+
+# a bulk photo deletion run in the background (gallery/deletion.py), polled by the client
+class PhotoDeletionJob(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='photo_deletion_jobs'
+    )
+    photo_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    total = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    files_deleted = models.IntegerField(default=0)
+    files_failed = models.IntegerField(default=0) # left behind in storage, names are logged
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Photo deletion {self.id} ({self.deleted}/{self.total}, {self.status})"
@@ -1,5 +1,10 @@
+import math
 from rest_framework import permissions
 
+# photo gps is exact for the photographer, coordinators and admins. everyone else gets it
+# rounded to LOCATION_PRECISION decimals (~1km), the map and the bbox filter are no finer
+LOCATION_PRECISION = 2
+
 class IsEventCoordinatorOrAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and (
@@ -12,3 +17,21 @@ class CanUploadPhotoOrCreateAlbum(permissions.BasePermission):
         return request.user.is_authenticated and (
             request.user.role not in ['Member', 'Guest']
         )
+
+def sees_exact_location(user, photographer_id=None):
+    return user.is_authenticated and (
+        user.is_staff or user.role in ['Admin', 'Coordinator'] or user.id == photographer_id
+    )
+
+def public_coordinate(value):
+    return None if value is None else round(value, LOCATION_PRECISION)
+
+def public_bbox(min_lon, min_lat, max_lon, max_lat):
+    # edges moved out to the rounding grid, thin boxes can't narrow a photo down any further
+    scale = 10 ** LOCATION_PRECISION
+    return (
+        max(-180.0, math.floor(min_lon * scale) / scale),
+        max(-90.0, math.floor(min_lat * scale) / scale),
+        min(180.0, math.ceil(max_lon * scale) / scale),
+        min(90.0, math.ceil(max_lat * scale) / scale),
+    )
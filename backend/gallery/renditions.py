@@ -0,0 +1,167 @@
+import base64
+import hashlib
+import json
+import logging
+from io import BytesIO
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from config import metrics
+from .invalidation import invalidate_photo
+from .models import Photo
+
+logger = logging.getLogger(__name__)
+
+# derived files of a photo. Photo.image is the pristine upload and is never written to,
+# everything else is rendered from it:
+#   thumbnail    500px jpeg, made by process_photo
+#   placeholder  16px inline preview + dominant colour stored on the row (process_photo)
+#   watermarked  full size "© MemoRise" copy, made by watermark_photo after processing or
+#                queued by the first download. until then the app shows the thumbnail
+#
+# each rendition is named after a hash of the spec that produced it (<id>_<version>.jpg)
+# and the version is stored next to the file, so a reprocess skips whatever is already
+# current and changing a spec below re-renders only that rendition.
+# photos processed before originals were kept have the watermark baked into image
+# (Photo.original_watermarked), those are served as they are and never stamped again
+
+THUMBNAIL_SPEC = {'size': 500, 'quality': 85, 'draft': 1000, 'exif_orientation': True}
+PLACEHOLDER_SIZE = 16
+WATERMARK_SPEC = {'text': '© MemoRise', 'font_scale': 30, 'margin': 20, 'opacity': 128, 'quality': 95, 'exif_orientation': True}
+LOCK_TIMEOUT = 120 # a full resolution render shouldn't take anywhere near this
+WATERMARK_RETRY_AFTER = 5 # seconds a download is told to wait for a queued render
+
+def spec_version(spec):
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+THUMBNAIL_VERSION = spec_version(THUMBNAIL_SPEC)
+WATERMARK_VERSION = spec_version(WATERMARK_SPEC)
+
+def rendition_name(folder, photo_id, version):
+    return f"photos/{folder}/{photo_id}_{version}.jpg"
+
+def thumbnail_is_current(photo):
+    return bool(photo.thumbnail) and photo.thumbnail_version == THUMBNAIL_VERSION
+
+def watermark_is_current(photo):
+    if photo.original_watermarked:
+        return True
+    return bool(photo.watermarked) and photo.watermark_version == WATERMARK_VERSION
+
+def thumbnail_image(img):
+    spec = THUMBNAIL_SPEC
+    # jpeg only: decode at a reduced scale, a 500px thumb doesn't need every pixel
+    img.draft('RGB', (spec['draft'], spec['draft']))
+    # the jpeg we write carries no exif, so the rotation has to be baked in
+    thumb_img = ImageOps.exif_transpose(img).convert("RGBA")
+    thumb_img.thumbnail((spec['size'], spec['size']))
+    return thumb_img.convert("RGB")
+
+def render_thumbnail(thumb_img):
+    thumb_io = BytesIO()
+    thumb_img.save(thumb_io, format='JPEG', quality=THUMBNAIL_SPEC['quality'])
+    return thumb_io.getvalue()
+
+def render_placeholder(thumb_img):
+    # (data uri of a PLACEHOLDER_SIZE px preview, '#rrggbb' dominant colour) for clients
+    # to paint before the thumbnail arrives. a few hundred bytes, inlined in list responses
+    tiny = thumb_img.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    preview = BytesIO()
+    try:
+        tiny.save(preview, format='WEBP', quality=50)
+        mime = 'image/webp'
+    except (KeyError, OSError):
+        preview = BytesIO() # pillow built without webp
+        tiny.save(preview, format='PNG', optimize=True)
+        mime = 'image/png'
+    data_uri = f"data:{mime};base64,{base64.b64encode(preview.getvalue()).decode()}"
+
+    # most common colour of a 5 colour median cut, closer to what the eye picks than the mean
+    palette_img = tiny.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    _, index = max(palette_img.getcolors())
+    r, g, b = palette_img.getpalette()[index * 3:index * 3 + 3]
+    return data_uri, f"#{r:02x}{g:02x}{b:02x}"
+
+def render_watermark(img):
+    spec = WATERMARK_SPEC
+    with metrics.timer('photo_stage_seconds', stage='decode'):
+        work_img = ImageOps.exif_transpose(img).convert("RGBA")
+    width, height = work_img.size
+
+    with metrics.timer('photo_stage_seconds', stage='watermark'):
+        txt_layer = Image.new("RGBA", work_img.size, (255, 255, 255, 0))
+        draw = ImageDraw.Draw(txt_layer)
+        font_size = int(width / spec['font_scale'])
+        try:
+            font = ImageFont.truetype("arial.ttf", font_size)
+        except IOError:
+            font = ImageFont.load_default()
+
+        bbox = draw.textbbox((0, 0), spec['text'], font=font)
+        text_w, text_h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        position = (width - text_w - spec['margin'], height - text_h - spec['margin'])
+        draw.text(position, spec['text'], fill=(255, 255, 255, spec['opacity']), font=font)
+
+        final_img = Image.alpha_composite(work_img, txt_layer).convert("RGB")
+
+    with metrics.timer('photo_stage_seconds', stage='encode'):
+        final_io = BytesIO()
+        final_img.save(final_io, format='JPEG', quality=spec['quality'])
+    return final_io.getvalue()
+
+def store_rendition(field_file, name, render):
+    # same spec = same bytes, a file already under this name (another worker, a retry) is reused
+    storage = field_file.storage
+    if storage.exists(name):
+        return name, 0
+    content = render()
+    with metrics.timer('photo_stage_seconds', stage='storage_write'):
+        saved = storage.save(name, ContentFile(content))
+    return saved, len(content)
+
+def drop_previous(field_file, previous_name, current_name, original_name):
+    # the rendition of an older spec, never the original
+    if previous_name and previous_name not in (current_name, original_name):
+        try:
+            field_file.storage.delete(previous_name)
+        except Exception as e:
+            logger.warning(f"Could not delete old rendition {previous_name}: {e}")
+
+def ensure_watermarked(photo):
+    # the current watermarked copy, rendered from the original when missing or stale.
+    # returns the updated photo, or None when another process is rendering it right now
+    if watermark_is_current(photo):
+        return photo
+
+    lock = f"rendition_lock:watermark:{photo.id}"
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        return None
+    try:
+        previous = photo.watermarked.name if photo.watermarked else ''
+        name = rendition_name('watermarked', photo.id, WATERMARK_VERSION)
+
+        def render():
+            with metrics.timer('photo_stage_seconds', stage='read'):
+                with photo.image.open('rb') as f:
+                    data = f.read()
+            metrics.incr('photo_bytes_read_total', len(data))
+            with Image.open(BytesIO(data)) as img:
+                return render_watermark(img)
+
+        name, written = store_rendition(photo.watermarked, name, render)
+        if written:
+            metrics.incr('photo_bytes_written_total', written, asset='watermarked')
+
+        Photo.objects.filter(id=photo.id).update(
+            watermarked=name, watermark_version=WATERMARK_VERSION, updated_at=timezone.now()
+        )
+        drop_previous(photo.watermarked, previous, name, photo.image.name)
+        invalidate_photo(photo.id, photo.event_id, photo.album_id)
+
+        photo.watermarked.name = name
+        photo.watermark_version = WATERMARK_VERSION
+        return photo
+    finally:
+        cache.delete(lock)
@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import time
+from io import BytesIO
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import parse_etags
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config import metrics
+
+logger = logging.getLogger(__name__)
+
+# on demand resized variants of any media file (photo renditions, profile pictures):
+#
+#   /api/gallery/resize/<media name>?w=160&h=160&fit=cover&fmt=webp&s=<signature>
+#
+# urls are built server side with resize_url() and signed with the secret key, so clients
+# can't make the server render arbitrary sizes. a variant is rendered once into
+# RESIZE_CACHE_DIR and served from disk after that. the cache is bounded to
+# RESIZE_CACHE_MAX_BYTES: hits bump the file's mtime and the eviction pass drops the
+# least recently used files until it's back under RESIZE_CACHE_LOW_WATER of the limit.
+# the first requests for a variant are collapsed, one process renders it while the
+# others wait for the file to show up (RESIZE_RENDER_WAIT)
+#
+# fit: 'contain' scales down to fit inside w x h (h=0 = any height), never upscales
+#      'cover' fills w x h exactly, cropping around the centre
+
+FITS = ('contain', 'cover')
+FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+LOCK_TIMEOUT = 30
+SIZE_KEY = 'resize_cache:bytes'
+EVICT_LOCK = 'resize_cache:evicting'
+
+class InvalidResize(ValueError):
+    pass
+
+def canonical(name, width, height, fit, fmt):
+    return f"{name}|{width}|{height}|{fit}|{fmt}"
+
+def sign(value):
+    return salted_hmac('gallery.resize', value).hexdigest()[:24]
+
+def resize_url(field_file, width, height=0, fit='contain', fmt='jpeg', request=None):
+    # signed url of a resized variant, None when there's no file
+    if not field_file:
+        return None
+    if fit not in FITS or fmt not in FORMATS:
+        raise InvalidResize(f"Unsupported fit/format {fit}/{fmt}")
+    params = {'w': width, 'h': height, 'fit': fit, 'fmt': fmt, 's': sign(canonical(field_file.name, width, height, fit, fmt))}
+    url = f"{reverse('resized_image', args=[field_file.name])}?{urlencode(params)}"
+    return request.build_absolute_uri(url) if request else url
+
+def parse_request(name, params):
+    try:
+        width = int(params.get('w', 0))
+        height = int(params.get('h', 0))
+    except ValueError:
+        raise InvalidResize("Width and height must be integers")
+    fit = params.get('fit', 'contain')
+    fmt = params.get('fmt', 'jpeg')
+    if fit not in FITS or fmt not in FORMATS:
+        raise InvalidResize("Unsupported fit or format")
+    limit = settings.RESIZE_MAX_DIMENSION
+    if not 0 < width <= limit or not 0 <= height <= limit or (fit == 'cover' and not height):
+        raise InvalidResize("Size out of range")
+    if not constant_time_compare(params.get('s', ''), sign(canonical(name, width, height, fit, fmt))):
+        raise InvalidResize("Bad signature")
+    return width, height, fit, fmt
+
+def render_variant(name, width, height, fit, fmt):
+    pil_format, _, save_options = FORMATS[fmt]
+    with default_storage.open(name, 'rb') as f:
+        data = f.read()
+    metrics.incr('photo_bytes_read_total', len(data))
+
+    with Image.open(BytesIO(data)) as img:
+        # jpeg only: decode at the nearest scale above the target instead of full size
+        # (either side, exif rotation hasn't been applied yet)
+        img.draft('RGB', (max(width, height), max(width, height)))
+        img = ImageOps.exif_transpose(img)
+        if fit == 'cover':
+            img = ImageOps.fit(img, (width, height), method=Image.Resampling.LANCZOS)
+        else:
+            img = img.copy()
+            img.thumbnail((width, height or limit_height(img, width)), Image.Resampling.LANCZOS)
+
+        if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGBA')
+        out = BytesIO()
+        img.save(out, format=pil_format, **save_options)
+    return out.getvalue()
+
+def limit_height(img, width):
+    # 'contain' without a height: whatever the aspect ratio needs at this width
+    return max(1, round(img.height * width / img.width))
+
+class DiskCache:
+    def __init__(self, directory, max_bytes, low_water=0.9):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+
+    def path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        # two levels of fan out keep directories small
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path) # mtime = last use, what eviction goes by
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, content):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path) # readers never see a half written file
+
+        # shared running total, the eviction pass recounts it from disk
+        try:
+            total = cache.incr(SIZE_KEY, len(content))
+        except ValueError:
+            cache.add(SIZE_KEY, 0, None)
+            total = self.max_bytes + 1 # unknown, let the pass count it
+        if total > self.max_bytes:
+            self.evict()
+        return path
+
+    def evict(self):
+        if not cache.add(EVICT_LOCK, 1, 60):
+            return # another process is on it
+        try:
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    if filename.endswith('.tmp'):
+                        continue # still being written
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * self.low_water
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            cache.set(SIZE_KEY, int(total), None)
+            metrics.incr('resize_cache_evictions_total', removed)
+        finally:
+            cache.delete(EVICT_LOCK)
+
+_disk_cache = None
+
+def get_disk_cache():
+    global _disk_cache
+    if _disk_cache is None:
+        _disk_cache = DiskCache(settings.RESIZE_CACHE_DIR, settings.RESIZE_CACHE_MAX_BYTES, settings.RESIZE_CACHE_LOW_WATER)
+    return _disk_cache
+
+def variant_key(name, width, height, fit, fmt):
+    # the source's mtime is part of the key: a profile picture can be replaced under the same name
+    modified = default_storage.get_modified_time(name)
+    return f"{canonical(name, width, height, fit, fmt)}|{modified.timestamp():.0f}"
+
+def get_variant(key, name, width, height, fit, fmt):
+    # path of the cached variant, rendering it (once across processes) when missing
+    disk = get_disk_cache()
+    path = disk.get(key)
+    if path:
+        metrics.incr('resize_cache_requests_total', outcome='hit')
+        return path
+
+    lock = f"resize_lock:{hashlib.sha1(key.encode()).hexdigest()}"
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            path = disk.get(key) # rendered between our miss and taking the lock
+            if path:
+                return path
+            with metrics.timer('photo_stage_seconds', stage='resize'):
+                content = render_variant(name, width, height, fit, fmt)
+            metrics.incr('resize_cache_requests_total', outcome='miss')
+            return disk.put(key, content)
+        finally:
+            cache.delete(lock)
+
+    # someone else is rendering it, wait for their file instead of rendering it again
+    deadline = time.monotonic() + settings.RESIZE_RENDER_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        path = disk.get(key)
+        if path:
+            metrics.incr('resize_cache_requests_total', outcome='collapsed')
+            return path
+    # the renderer died or is very slow, don't leave this request hanging
+    metrics.incr('resize_cache_requests_total', outcome='wait_timeout')
+    return disk.put(key, render_variant(name, width, height, fit, fmt))
+
+def resized_response(request, name):
+    try:
+        width, height, fit, fmt = parse_request(name, request.GET)
+    except InvalidResize as e:
+        return HttpResponse(str(e), status=400, content_type='text/plain')
+
+    try:
+        key = variant_key(name, width, height, fit, fmt)
+    except FileNotFoundError:
+        return HttpResponse('Not Found', status=404, content_type='text/plain')
+
+    etag = f'"{sign(key)}"'
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            path = get_variant(key, name, width, height, fit, fmt)
+            variant = open(path, 'rb')
+        except FileNotFoundError:
+            return HttpResponse('Not Found', status=404, content_type='text/plain')
+        except (UnidentifiedImageError, OSError) as e:
+            logger.warning(f"Could not resize {name}: {e}")
+            return HttpResponse('Unreadable image', status=422, content_type='text/plain')
+        response = FileResponse(variant, content_type=FORMATS[fmt][1])
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.RESIZE_MAX_AGE)
+    return response
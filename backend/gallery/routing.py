@@ -0,0 +1,6 @@
+from . import consumers
+from django.urls import re_path
+
+websocket_urlpatterns = [
+    re_path(r'ws/events/(?P<event_id>\d+)/$', consumers.EventFeedConsumer.as_asgi())
+]
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from gallery.models import Event, Album, Photo
+from gallery.permissions import sees_exact_location, public_coordinate
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -20,6 +21,7 @@ class PhotoSerializer(serializers.ModelSerializer):
     updated_at = serializers.DateTimeField(read_only=True)
 
     is_processed = serializers.BooleanField(read_only=True)
+    processing_status = serializers.SerializerMethodField()
 
     # post response to frontend
     tagged_users_details = UserTagSerializer(source='tagged_users', many=True, read_only=True)
@@ -34,13 +36,22 @@ class PhotoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Photo
         fields = [
-            'id', 'event', 'album', 'image', 'thumbnail', 'is_processed', 'description',
-            'photographer', 'photographer_email', 'photographer_profile_picture', 'exif_data', 'uploaded_at', 'updated_at', 'likes_cnt',
+            'id', 'event', 'album', 'image', 'thumbnail', 'is_processed', 'processing_status', 'description',
+            'photographer', 'photographer_email', 'photographer_profile_picture', 'exif_data', 'date_taken', 'uploaded_at', 'updated_at', 'likes_cnt',
             'download_cnt', 'manual_tags', 'auto_tags', 'title', 'is_liked', 'likes_count',
-            'tagged_users_details', 'tagged_user_ids'
+            'tagged_users_details', 'tagged_user_ids',
+            'width', 'height', 'aspect_ratio', 'dominant_color', 'placeholder', 'latitude', 'longitude',
         ]
         read_only_fields = [
             'id',
+            'date_taken',
+            'latitude',
+            'longitude',
+            'width',
+            'height',
+            'aspect_ratio',
+            'dominant_color',
+            'placeholder',
             'uploaded_at',
             'updated_at',
             'likes_count',
@@ -50,6 +61,21 @@ class PhotoSerializer(serializers.ModelSerializer):
             'is_processed'  
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # image is the untouched original, clients get the watermarked copy once it exists
+        data['image'] = self.fields['image'].to_representation(instance.display_image)
+        request = self.context.get('request')
+        if not self.context.get('skip_location_privacy') and not (request and sees_exact_location(request.user, instance.photographer_id)):
+            data['latitude'], data['longitude'] = public_coordinate(data['latitude']), public_coordinate(data['longitude'])
+        return data
+
+    def get_processing_status(self, obj):
+        if obj.is_processed:
+            return 'processed'
+        # 'deferred' = accepted while the backlog was full, processed once it drains
+        return 'deferred' if obj.processing_deferred else 'queued'
+
     def get_auto_tags(self, obj):
         return obj.auto_tags if obj.auto_tags is not None else []
 
@@ -61,13 +87,18 @@ class PhotoSerializer(serializers.ModelSerializer):
             return obj.photographer.profile_picture.url
         return None
     
+    # skip_like_state: the payload is shared between users and gets both filled in per request
     def get_likes_count(self, obj):
+        if self.context.get('skip_like_state'):
+            return None
         if hasattr(obj, 'likes'):
             return obj.likes.count()
         return obj.like_set.count()
     
     def get_is_liked(self, obj):
         request = self.context.get('request')
+        if self.context.get('skip_like_state'):
+            return None
         if request and request.user.is_authenticated:
             if hasattr(obj, 'likes'):
                 return obj.likes.filter(user=request.user).exists()
@@ -85,17 +116,20 @@ class AlbumSerializer(serializers.ModelSerializer):
             'id',
             'created_at',
             'share_token',
-            'owner'
+            'owner',
+            'is_draft',
         ]
 
     def get_photos(self, obj):
+        # a draft (scene clustering suggestion) shows the photos it suggests
+        related = obj.suggested_photos if obj.is_draft else obj.photos
         # DEBUG:Always fetch the latest photos for this album, force fresh DB read
-        photos_qs = obj.photos.all().order_by('-uploaded_at').iterator()
+        photos_qs = related.all().order_by('-uploaded_at').iterator()
         return PhotoSerializer(list(photos_qs), many=True, context=self.context).data
 
 class EventSerializer(serializers.ModelSerializer):
     coordinator = serializers.ReadOnlyField(source='coordinator.email')
-    albums = AlbumSerializer(many=True, read_only=True)
+    albums = serializers.SerializerMethodField()
     photos = serializers.SerializerMethodField()
 
     class Meta:
@@ -106,10 +140,26 @@ class EventSerializer(serializers.ModelSerializer):
             'created_at',
         ]
 
+    def get_albums(self, obj):
+        # draft albums are reviewed through the albums endpoint, not shown on the event
+        albums = [album for album in obj.albums.all() if not album.is_draft]
+        return AlbumSerializer(albums, many=True, context=self.context).data
+
     def get_photos(self, obj):
         photos_qs = obj.photos.all().order_by('-uploaded_at')
         return PhotoSerializer(photos_qs, many=True, context=self.context).data
 
+# compact card pushed over the live event feed / to the uploader
+class PhotoCardSerializer(serializers.ModelSerializer):
+    photographer_name = serializers.CharField(source='photographer.full_name', read_only=True)
+
+    class Meta:
+        model = Photo
+        fields = [
+            'id', 'event', 'album', 'thumbnail', 'title', 'photographer', 'photographer_name', 'is_processed', 'uploaded_at',
+            'width', 'height', 'aspect_ratio', 'dominant_color', 'placeholder',
+        ]
+
 class PublicPhotoShareSerializer(serializers.ModelSerializer):
     photographer_name = serializers.CharField(source='photographer.full_name', read_only=True)
     
@@ -117,8 +167,14 @@ class PublicPhotoShareSerializer(serializers.ModelSerializer):
         model = Photo
         fields = [
             'id', 'image', 'thumbnail', 'manual_tags', 'auto_tags', 'exif_data', 'description', 'photographer_name', 'likes_cnt',
+            'width', 'height', 'aspect_ratio', 'dominant_color', 'placeholder',
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['image'] = self.fields['image'].to_representation(instance.display_image)
+        return data
+
 class PublicAlbumSerializer(serializers.ModelSerializer):
     owner_name = serializers.CharField(source='owner.full_name', read_only=True)
     photos = PublicPhotoShareSerializer(many=True, read_only=True)
@@ -0,0 +1,128 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+from config.cache_utils import versioned_key
+from .models import Album, Photo
+from .resize import resize_url
+from .serializers import PublicAlbumSerializer
+
+# public share links get posted around and hit hard, so both share endpoints
+# serve a pre-rendered body from the cache:
+#   token -> object id   cached for good (share tokens never change)
+#   id    -> page        versioned on album:<id> / photo:<id> + people (gallery/invalidation.py),
+#                        so toggling is_public or editing the album/photo drops it
+# 200s go out with an ETag and public Cache-Control so browsers/CDNs can revalidate
+
+SHARE_TOKEN_TIMEOUT = 60 * 60 * 24
+
+def resolve_share_token(model, share_token):
+    key = f"share_token:{model._meta.model_name}:{share_token}"
+    object_id = cache.get(key)
+    if object_id is None:
+        # 0 = no such token, cached too so random tokens don't reach the db
+        object_id = model.objects.filter(share_token=share_token).values_list('id', flat=True).first() or 0
+        cache.set(key, object_id, SHARE_TOKEN_TIMEOUT)
+    return object_id
+
+def make_page(body, status=200, content_type='application/json'):
+    if isinstance(body, str):
+        body = body.encode()
+    return {
+        'status': status,
+        'content_type': content_type,
+        'body': body,
+        'etag': f'"{hashlib.md5(body).hexdigest()}"',
+    }
+
+def cached_page(request, namespaces, build):
+    # absolute media urls depend on the host
+    key = versioned_key('share', namespaces, request.get_host())
+    page = cache.get(key)
+    if page is None:
+        page = build()
+        cache.set(key, page, settings.SHARE_CACHE_TIMEOUT)
+    return page
+
+def page_response(request, page):
+    if page['status'] != 200:
+        response = HttpResponse(page['body'], status=page['status'], content_type=page['content_type'])
+        # a private/missing link can become public, don't let anything hold on to it
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (page['etag'] in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(page['body'], content_type=page['content_type'])
+    response['ETag'] = page['etag']
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.SHARE_MAX_AGE,
+        s_maxage=settings.SHARE_S_MAXAGE,
+        stale_while_revalidate=settings.SHARE_STALE_WHILE_REVALIDATE,
+    )
+    return response
+
+def album_not_found():
+    return make_page(JSONRenderer().render({"detail": "No Album matches the given query."}), status=404)
+
+def photo_not_found():
+    return make_page('Not Found', status=404, content_type='text/plain')
+
+def build_album_page(request, album_id):
+    album = (
+        Album.objects.filter(id=album_id)
+        .select_related('owner')
+        .prefetch_related(Prefetch('photos', queryset=Photo.objects.select_related('photographer')))
+        .first()
+    )
+    if not album:
+        return album_not_found()
+    if not album.is_public:
+        return make_page(JSONRenderer().render({"error": "Album is not public"}), status=403)
+
+    serializer = PublicAlbumSerializer(album, context={'request': request})
+    return make_page(JSONRenderer().render(serializer.data))
+
+def build_photo_page(request, photo_id):
+    photo = (
+        Photo.objects.filter(id=photo_id)
+        .select_related('photographer')
+        .prefetch_related('tagged_users')
+        .first()
+    )
+    if not photo:
+        return photo_not_found()
+    if not photo.is_public:
+        html = render_to_string('shared_photo.html', {'error': 'Photo is not public'})
+        return make_page(html, status=403, content_type='text/html; charset=utf-8')
+
+    html = render_to_string('shared_photo.html', {
+        'photo': photo,
+        'avatar_url': resize_url(photo.photographer.profile_picture, 96, 96, fit='cover', request=request),
+        # link preview for chat apps / social cards
+        'preview_url': resize_url(photo.display_image, 1200, 630, fit='cover', request=request),
+    })
+    return make_page(html, content_type='text/html; charset=utf-8')
+
+def shared_album_response(request, share_token):
+    album_id = resolve_share_token(Album, share_token)
+    if not album_id:
+        return page_response(request, album_not_found())
+    page = cached_page(request, [f'album:{album_id}', 'people'], lambda: build_album_page(request, album_id))
+    return page_response(request, page)
+
+def shared_photo_response(request, share_token):
+    photo_id = resolve_share_token(Photo, share_token)
+    if not photo_id:
+        return page_response(request, photo_not_found())
+    page = cached_page(request, [f'photo:{photo_id}', 'people'], lambda: build_photo_page(request, photo_id))
+    return page_response(request, page)
@@ -1,9 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
 from notifications.signals import send_socket_message
-from .models import Photo
-from .tasks import process_photo
+from interactions.models import Like
+from .models import Photo, Album, Event
+from .tasks import queue_photo_work
+from .invalidation import invalidate_event, invalidate_album, invalidate_photo, invalidate_photo_likes, invalidate_location
 from django.db import transaction
+from django.utils import timezone
 from django.db.models.signals import m2m_changed
 from notifications.models import Notification 
 from django.contrib.auth import get_user_model
@@ -33,11 +36,88 @@ def notify_tagged_users(sender, instance, action, pk_set, **kwargs):
 
 @receiver(post_save, sender=Photo)
 def trigger_async_photo_processing(sender, instance, created, **kwargs):
-    if created and not instance.is_processed:
+    # deferred uploads are queued later by drain_deferred_photos
+    if created and not instance.is_processed and not instance.processing_deferred:
         try:
             # this ensures the task runs only after
             # the transaction is committed (in background)
             logger.info(f"Triggering async photo processing for photo_id: {instance.id}")
-            transaction.on_commit(lambda: process_photo.delay(instance.id))
+            transaction.on_commit(lambda: queue_photo_work(instance.id))
         except Exception as e:
-            logger.error(f"Error triggering async processing for photo {instance.id}: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Error triggering async processing for photo {instance.id}: {e}", exc_info=True)
+
+# cache invalidation for the cached event/album views and share pages (config/cache_utils.py)
+
+@receiver(pre_save, sender=Album)
+@receiver(pre_save, sender=Photo)
+def remember_previous_location(sender, instance, **kwargs):
+    # moving a photo/album must also drop the cache of where it used to be
+    if instance.pk:
+        fields = ['event_id', 'album_id', 'latitude', 'longitude', 'thumbnail'] if sender is Photo else ['event_id']
+        instance._previous_location = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_event_cache(sender, instance, **kwargs):
+    invalidate_event(instance.id)
+
+@receiver(pre_delete, sender=Event)
+def invalidate_event_albums(sender, instance, **kwargs):
+    # albums are SET_NULL by an UPDATE, which sends no signals
+    for album_id in instance.albums.values_list('id', flat=True):
+        invalidate_album(album_id)
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def invalidate_album_cache(sender, instance, **kwargs):
+    invalidate_album(instance.id, instance.event_id)
+    previous = getattr(instance, '_previous_location', None)
+    if previous and previous['event_id'] != instance.event_id:
+        invalidate_album(instance.id, previous['event_id'])
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def invalidate_photo_cache(sender, instance, created=False, signal=None, **kwargs):
+    invalidate_photo(instance.id, instance.event_id, instance.album_id)
+    previous = getattr(instance, '_previous_location', None)
+    if previous and (previous['event_id'], previous['album_id']) != (instance.event_id, instance.album_id):
+        invalidate_photo(instance.id, previous['event_id'], previous['album_id'])
+    # map clusters where the photo is and where it was, every zoom level. an edit that
+    # leaves the position, event and thumbnail alone doesn't change any tile
+    edited = signal is post_save and not created and previous is not None
+    position = (instance.latitude, instance.longitude)
+    tile_state = (*position, instance.event_id, instance.thumbnail.name or '')
+    if not edited or tile_state != (previous['latitude'], previous['longitude'], previous['event_id'], previous['thumbnail'] or ''):
+        invalidate_location(*position)
+    if edited and (previous['latitude'], previous['longitude']) != position:
+        invalidate_location(previous['latitude'], previous['longitude'])
+
+@receiver(m2m_changed, sender=Photo.tagged_users.through)
+def invalidate_tagged_photo_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            # m2m writes don't bump updated_at, the conditional GET validators need it
+            Photo.objects.filter(id=instance.id).update(updated_at=timezone.now())
+            invalidate_photo(instance.id, instance.event_id, instance.album_id)
+        return
+    # changed from the user side: pk_set holds photo ids, and a clear only
+    # still knows which photos it touches before it runs
+    if action in ('post_add', 'post_remove') and pk_set:
+        photos = Photo.objects.filter(id__in=pk_set)
+    elif action == 'pre_clear':
+        photos = instance.tagged_photos.all()
+    else:
+        return
+    rows = list(photos.values_list('id', 'event_id', 'album_id'))
+    Photo.objects.filter(id__in=[row[0] for row in rows]).update(updated_at=timezone.now())
+    for photo_id, event_id, album_id in rows:
+        invalidate_photo(photo_id, event_id, album_id)
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_liked_photo_cache(sender, instance, **kwargs):
+    # likes_count/is_liked are embedded in the event detail and album payloads
+    location = Photo.objects.filter(id=instance.photo_id).values('event_id', 'album_id').first()
+    if location:
+        Photo.objects.filter(id=instance.photo_id).update(updated_at=timezone.now())
+        invalidate_photo_likes(location['event_id'], location['album_id'])
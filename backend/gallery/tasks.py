@@ -1,28 +1,25 @@
 from celery import shared_task
+from celery.exceptions import Retry
 from .models import Photo
-from PIL import Image, ImageDraw, ImageFont, ExifTags
+from .broadcast import publish_processed_photo, flush_event_photos
+from .invalidation import invalidate_photo, invalidate_location
+from .metadata import extract_metadata, photo_fields
+from .renditions import (
+    THUMBNAIL_VERSION, rendition_name, thumbnail_image, render_thumbnail, render_placeholder,
+    store_rendition, drop_previous, thumbnail_is_current, watermark_is_current, ensure_watermarked,
+)
+from PIL import Image, UnidentifiedImageError
 from io import BytesIO
-from django.core.files.base import ContentFile
+from django.conf import settings
 from django.utils import timezone  
-import os
+from django.core.cache import cache
+from config import metrics
+from config.celery import PRIORITY_DEFAULT, PRIORITY_INTERACTIVE, PRIORITY_BACKFILL
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
-def get_clean_exif(img):
-    exif_data = {}
-    try:
-        raw_exif = img._getexif() 
-        if not raw_exif: return {}
-        for tag_id, value in raw_exif.items():
-            tag_name = ExifTags.TAGS.get(tag_id, tag_id)
-            if tag_name in ['MakerNote', 'UserComment']: continue
-            exif_data[tag_name] = value
-    except Exception:
-        return {}
-    return exif_data
-
 # converts 1/6 into 0.1666
 def parse_float(value):
     try:
@@ -33,108 +30,323 @@ def parse_float(value):
     except (ValueError, TypeError, IndexError):
         return 0.0
 
+def stage(name):
+    # per stage timings so we can see where processing time actually goes
+    return metrics.timer('photo_stage_seconds', stage=name)
+
+def read_photo_file(photo):
+    file_buffer = BytesIO()
+    try:
+        with stage('read'):
+            with photo.image.open('rb') as f:
+                file_buffer.write(f.read())
+    except Exception as e:
+        logger.error(f"Could not read file: {e}")
+        raise
+    metrics.incr('photo_bytes_read_total', file_buffer.tell())
+    file_buffer.seek(0)
+    return file_buffer
+
+def start_task(task, enqueued_at):
+    worker = task.request.hostname or 'unknown'
+    # retries re-send the original kwargs, so only the first attempt has a meaningful wait
+    if enqueued_at and not task.request.retries:
+        metrics.observe('photo_queue_wait_seconds', max(time.time() - enqueued_at, 0), task=task.name)
+    if task.request.retries:
+        metrics.incr('photo_task_retries_total', task=task.name, worker=worker)
+    return worker, time.time()
+
+def current_priority(task):
+    # follow-up work inherits the lane of the task that queued it (interactive vs backfill)
+    return (task.request.delivery_info or {}).get('priority', PRIORITY_DEFAULT)
+
+def queue_photo_work(photo_id, priority=PRIORITY_INTERACTIVE):
+    # fresh uploads go in the interactive lane of the thumbnail and ml queues
+    enqueued = {'enqueued_at': time.time()}
+    process_photo.apply_async((photo_id,), enqueued, priority=priority)
+    tag_photo.apply_async((photo_id,), enqueued, priority=priority)
+
+# fast lane: metadata + thumbnail, this is what flips is_processed for the user
 @shared_task(bind=True, max_retries=3)
-def process_photo(self, photo_id):
+def process_photo(self, photo_id, enqueued_at=None):
+    worker, task_started = start_task(self, enqueued_at)
+
     try:
         time.sleep(2) # to handle race conditions on very fast saves
 
         logger.info(f"Processing photo_id: {photo_id}")
-        photo = Photo.objects.get(id=photo_id)
+        with stage('load'):
+            photo = Photo.objects.get(id=photo_id)
 
-        file_buffer = BytesIO()
-        try:
+        # metadata comes from the header alone (gallery/metadata.py)
+        with stage('exif'):
             with photo.image.open('rb') as f:
-                file_buffer.write(f.read())
-        except Exception as e:
-            logger.error(f"Could not read file: {e}")
-            raise
-        
-        file_buffer.seek(0)
-        
-        with Image.open(file_buffer) as img:
-            
-            exif_raw = get_clean_exif(img)
-            interesting_fields = ['Make', 'Model', 'DateTimeOriginal', 'ExposureTime', 'FNumber', 'ISOSpeedRatings', 'FocalLength', 'LensModel']
-            saved_exif = {k: str(v) for k, v in exif_raw.items() if k in interesting_fields}
-            
-            tags = []
-
-            width, height = img.size
-            if height > width: tags.append('Portrait')
-            elif width > height: tags.append('Landscape')
-            else: tags.append('Square')
-
-            if 'Make' in exif_raw: tags.append(str(exif_raw['Make']).strip())
-            if 'Model' in exif_raw: tags.append(str(exif_raw['Model']).strip())
-
-            if 'ExposureTime' in exif_raw:
-                val = parse_float(exif_raw['ExposureTime'])
-                if val >= 1.0: tags.append('Long Exposure')
-                elif val >= 0.1: tags.append('Slow Shutter')
-                elif val > 0 and val <= 0.001: tags.append('High Speed')
-
-            if 'FNumber' in exif_raw:
-                val = parse_float(exif_raw['FNumber'])
-                if val > 0 and val <= 2.8: tags.append('Bokeh')
-                elif val >= 8.0: tags.append('Deep Depth of Field')
-
-            if 'ISOSpeedRatings' in exif_raw:
-                val = exif_raw['ISOSpeedRatings']
-                iso = int(val[0]) if isinstance(val, (list, tuple)) else int(val)
-                if iso >= 1600: tags.append('Low Light')
-                elif iso <= 200: tags.append('Daylight')
-            
-            work_img = img.convert("RGBA")
-
-            # Create Thumbnail
-            thumb_io = BytesIO()
-            thumb_img = work_img.copy() 
-            thumb_img.thumbnail((500, 500))
-            thumb_img.convert("RGB").save(thumb_io, format='JPEG', quality=85)
-            
-            # Create Watermark
-            txt_layer = Image.new("RGBA", work_img.size, (255, 255, 255, 0))
-            draw = ImageDraw.Draw(txt_layer)
-            font_size = int(width / 30)
-            try:
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except IOError:
-                font = ImageFont.load_default()
-            
-            text = "© MemoRise"
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_w, text_h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-            draw.text((width - text_w - 20, height - text_h - 20), text, fill=(255, 255, 255, 128), font=font)
-            
-            final_img = Image.alpha_composite(work_img, txt_layer).convert("RGB")
-            final_io = BytesIO()
-            final_img.save(final_io, format='JPEG', quality=95)
-
-        # use save=False to skip SQL update
-        thumb_filename = f"thumb_{os.path.basename(photo.image.name)}"
-        photo.thumbnail.save(thumb_filename, ContentFile(thumb_io.getvalue()), save=False)
-        
-        main_filename = os.path.basename(photo.image.name)
-        photo.image.save(main_filename, ContentFile(final_io.getvalue()), save=False)
+                metadata = extract_metadata(f)
+        exif_raw = metadata['fields']
+        width, height = metadata['width'], metadata['height']
+
+        # thumbnail + placeholder from the original, skipped when the current spec already made them.
+        # a reprocess with nothing to render never reads past the header
+        previous_thumbnail = photo.thumbnail.name if photo.thumbnail else ''
+        thumbnail_name = previous_thumbnail
+        placeholder, dominant_color = photo.placeholder, photo.dominant_color
+        if width is None or not thumbnail_is_current(photo) or not placeholder:
+            file_buffer = read_photo_file(photo)
+            with Image.open(file_buffer) as img:
+                if width is None:
+                    width, height = img.size # a header the extractor couldn't place
+                with stage('thumbnail'):
+                    thumb_img = thumbnail_image(img)
+                if not thumbnail_is_current(photo):
+                    thumbnail_name, written = store_rendition(
+                        photo.thumbnail, rendition_name('thumbnails', photo_id, THUMBNAIL_VERSION),
+                        lambda: render_thumbnail(thumb_img),
+                    )
+                    if written:
+                        metrics.incr('photo_bytes_written_total', written, asset='thumbnail')
+                with stage('placeholder'):
+                    placeholder, dominant_color = render_placeholder(thumb_img)
+
+        tags = []
+
+        metrics.incr('photo_pixels_total', width * height)
+        if height > width: tags.append('Portrait')
+        elif width > height: tags.append('Landscape')
+        else: tags.append('Square')
+
+        if 'Make' in exif_raw: tags.append(str(exif_raw['Make']).strip())
+        if 'Model' in exif_raw: tags.append(str(exif_raw['Model']).strip())
+
+        if 'ExposureTime' in exif_raw:
+            val = parse_float(exif_raw['ExposureTime'])
+            if val >= 1.0: tags.append('Long Exposure')
+            elif val >= 0.1: tags.append('Slow Shutter')
+            elif val > 0 and val <= 0.001: tags.append('High Speed')
+
+        if 'FNumber' in exif_raw:
+            val = parse_float(exif_raw['FNumber'])
+            if val > 0 and val <= 2.8: tags.append('Bokeh')
+            elif val >= 8.0: tags.append('Deep Depth of Field')
+
+        if 'ISOSpeedRatings' in exif_raw:
+            val = exif_raw['ISOSpeedRatings']
+            iso = int(val[0]) if isinstance(val, (list, tuple)) else int(val)
+            if iso >= 1600: tags.append('Low Light')
+            elif iso <= 200: tags.append('Daylight')
 
-        
         current_tags = set(photo.manual_tags or [])
         current_tags.update(tags)
+
+        fields = photo_fields(metadata)
+        fields.update(width=width, height=height, aspect_ratio=round(width / height, 4) if height else None)
         
-        rows_updated = Photo.objects.filter(id=photo_id).update(
-            is_processed=True,
-            exif_data=saved_exif,
-            manual_tags=list(current_tags),
-            image=photo.image.name,       
-            thumbnail=photo.thumbnail.name,
-            updated_at=timezone.now()
-        )
+        with stage('db_update'):
+            rows_updated = Photo.objects.filter(id=photo_id).update(
+                is_processed=True,
+                manual_tags=list(current_tags),
+                thumbnail=thumbnail_name,
+                thumbnail_version=THUMBNAIL_VERSION,
+                placeholder=placeholder,
+                dominant_color=dominant_color,
+                **fields,
+                updated_at=timezone.now()
+            )
+        drop_previous(photo.thumbnail, previous_thumbnail, thumbnail_name, photo.image.name)
+        # queryset updates skip post_save, so drop the cached views by hand
+        invalidate_photo(photo_id, photo.event_id, photo.album_id)
+        # map tiles show the thumbnail and its colour, and the position may have moved.
+        # a reprocess that changed none of it leaves the tiles alone
+        moved = (photo.latitude, photo.longitude) != (fields['latitude'], fields['longitude'])
+        if moved or thumbnail_name != previous_thumbnail or dominant_color != photo.dominant_color:
+            invalidate_location(fields['latitude'], fields['longitude'])
+        if moved:
+            invalidate_location(photo.latitude, photo.longitude)
         
         logger.info(f"Success: Processed photo {photo_id}. Rows updated: {rows_updated}")
+
+        # heavy full resolution re-encode goes to its own lane, or waits for the first download
+        if settings.WATERMARK_ON_UPLOAD and not watermark_is_current(photo):
+            watermark_photo.apply_async((photo_id,), {'enqueued_at': time.time()}, priority=current_priority(self))
+
+        # push to the uploader and the live event feed, a failure here must not re-run processing.
+        # a reprocess (backfill, new thumbnail spec) has nothing new to announce
+        if not photo.is_processed:
+            try:
+                with stage('publish'):
+                    photo.is_processed = True
+                    photo.thumbnail.name = thumbnail_name
+                    for name, value in fields.items():
+                        setattr(photo, name, value)
+                    photo.placeholder, photo.dominant_color = placeholder, dominant_color
+                    publish_processed_photo(photo)
+            except Exception as e:
+                logger.error(f"Could not publish processed photo {photo_id}: {e}", exc_info=True)
+
+        record_outcome(self, 'success', worker, task_started)
         return "Done"
 
     except Photo.DoesNotExist:
+        record_outcome(self, 'not_found', worker, task_started)
         return "Photo not found"
+    except UnidentifiedImageError as e:
+        # a file PIL can't decode won't get better on retry
+        logger.error(f"Unreadable image for photo {photo_id}: {e}")
+        record_outcome(self, 'invalid_image', worker, task_started)
+        return "Invalid image"
     except Exception as e:
         logger.error(f"Error processing {photo_id}: {e}", exc_info=True)
-        raise self.retry(exc=e, countdown=10)
\ No newline at end of file
+        record_outcome(self, 'failed' if self.request.retries >= self.max_retries else 'retry', worker, task_started)
+        raise self.retry(exc=e, countdown=10)
+
+# heavy lane: full resolution watermark composite + jpeg re-encode, from the original.
+# a no-op when the current watermark spec already rendered this photo
+@shared_task(bind=True, max_retries=3)
+def watermark_photo(self, photo_id, enqueued_at=None):
+    worker, task_started = start_task(self, enqueued_at)
+
+    try:
+        with stage('load'):
+            photo = Photo.objects.get(id=photo_id)
+
+        if watermark_is_current(photo):
+            record_outcome(self, 'current', worker, task_started)
+            return "Already current"
+
+        if ensure_watermarked(photo) is None:
+            # a download is rendering it right now, check again once that's done
+            raise self.retry(countdown=30)
+
+        record_outcome(self, 'success', worker, task_started)
+        return "Done"
+
+    except Retry:
+        raise
+    except Photo.DoesNotExist:
+        record_outcome(self, 'not_found', worker, task_started)
+        return "Photo not found"
+    except UnidentifiedImageError as e:
+        logger.error(f"Unreadable image for photo {photo_id}: {e}")
+        record_outcome(self, 'invalid_image', worker, task_started)
+        return "Invalid image"
+    except Exception as e:
+        logger.error(f"Error watermarking {photo_id}: {e}", exc_info=True)
+        record_outcome(self, 'failed' if self.request.retries >= self.max_retries else 'retry', worker, task_started)
+        raise self.retry(exc=e, countdown=10)
+
+# ml lane: resnet tagging, kept off the web process and away from thumbnails
+@shared_task(bind=True, max_retries=2)
+def tag_photo(self, photo_id, enqueued_at=None):
+    worker, task_started = start_task(self, enqueued_at)
+
+    try:
+        photo = Photo.objects.get(id=photo_id)
+
+        # imported lazily so only ml workers pay for loading the model
+        from .ai_utils import analyze_image
+        from .vector_index import store_embedding
+        with stage('inference'):
+            tags, embedding = analyze_image(photo.image.path)
+
+        if tags:
+            Photo.objects.filter(id=photo_id).update(auto_tags=tags, updated_at=timezone.now())
+            invalidate_photo(photo_id, photo.event_id, photo.album_id)
+        # same forward pass, kept for "more like this" (the index picks it up on its next sync)
+        if embedding is not None:
+            store_embedding(photo_id, embedding)
+            if photo.event_id and not photo.album_id:
+                schedule_scene_clustering(photo.event_id)
+
+        record_outcome(self, 'success', worker, task_started)
+        return tags
+
+    except Photo.DoesNotExist:
+        record_outcome(self, 'not_found', worker, task_started)
+        return "Photo not found"
+    except Exception as e:
+        logger.error(f"Error tagging {photo_id}: {e}", exc_info=True)
+        record_outcome(self, 'failed' if self.request.retries >= self.max_retries else 'retry', worker, task_started)
+        raise self.retry(exc=e, countdown=10)
+
+def record_outcome(task, outcome, worker, task_started):
+    metrics.incr('photo_tasks_total', task=task.name, outcome=outcome, worker=worker)
+    metrics.observe('photo_task_seconds', time.time() - task_started, task=task.name, outcome=outcome)
+    metrics.flush()
+
+@shared_task
+def flush_event_feed(event_id):
+    # sends every photo queued for this event since the last flush as one batch
+    return flush_event_photos(event_id)
+
+@shared_task
+def drain_deferred_photos(batch_size=50):
+    # runs on celery beat, queues uploads that were deferred by admission control
+    # a batch at a time, and only once the backlog has room again
+    from .admission import is_backed_up
+
+    if is_backed_up():
+        return 0
+
+    rows = list(
+        Photo.objects.filter(processing_deferred=True).order_by('uploaded_at').values_list('id', 'event_id', 'album_id')[:batch_size]
+    )
+    photo_ids = [photo_id for photo_id, _, _ in rows]
+    Photo.objects.filter(id__in=photo_ids).update(processing_deferred=False)
+    for photo_id, event_id, album_id in rows:
+        invalidate_photo(photo_id, event_id, album_id)
+    for photo_id in photo_ids:
+        queue_photo_work(photo_id, priority=PRIORITY_DEFAULT)
+
+    logger.info(f"Queued {len(photo_ids)} deferred photos")
+    return len(photo_ids)
+
+# scene clustering runs once per burst of uploads, not once per photo
+SCENE_CLUSTER_DELAY = 120
+
+def schedule_scene_clustering(event_id):
+    if cache.add(f"scene_cluster:event:{event_id}", 1, SCENE_CLUSTER_DELAY * 5):
+        cluster_event_scenes.apply_async((event_id,), countdown=SCENE_CLUSTER_DELAY, priority=PRIORITY_BACKFILL)
+
+@shared_task
+def cluster_event_scenes(event_id):
+    # suggests draft albums for an event's unsorted photos (gallery/clustering.py)
+    from .clustering import cluster_event
+
+    # released first so photos arriving while this runs schedule the next pass
+    cache.delete(f"scene_cluster:event:{event_id}")
+    with stage('scene_clustering'):
+        scenes = cluster_event(event_id)
+    metrics.flush()
+    logger.info(f"Clustered event {event_id} into {scenes} suggested albums")
+    return scenes
+
+@shared_task
+def train_vector_index():
+    # ivf centroids for the similarity index, scheduled by the web processes once the
+    # library has doubled since the last training (gallery/vector_index.py)
+    from .vector_index import train_ivf
+
+    with stage('vector_index_training'):
+        trained = train_ivf()
+    metrics.flush()
+    logger.info(f"Trained the similarity index on {trained} embeddings")
+    return trained
+
+@shared_task(bind=True, max_retries=3)
+def delete_photos(self, job_id):
+    # mass deletion job (gallery/deletion.py). a retry picks up where the last attempt
+    # stopped, photos it already deleted are simply gone
+    from .deletion import run_deletion_job, fail_deletion_job
+
+    try:
+        with stage('mass_delete'):
+            job = run_deletion_job(job_id)
+    except Exception as e:
+        logger.error(f"Error in deletion job {job_id}: {e}", exc_info=True)
+        if self.request.retries >= self.max_retries:
+            fail_deletion_job(job_id, e)
+            raise
+        raise self.retry(exc=e, countdown=30)
+    finally:
+        metrics.flush()
+    logger.info(f"Deletion job {job_id}: {job.deleted} photos, {job.files_deleted} files, {job.files_failed} files left behind")
+    return job.deleted
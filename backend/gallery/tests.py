@@ -1,3 +1,731 @@
-from django.test import TestCase
+import datetime
+import importlib.util
+import io
+import tempfile
+import threading
+import unittest
+import unittest.mock
+import uuid
+from pathlib import Path
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from interactions.models import Like
+from .models import Album, Event, Photo, PhotoDeletionJob
+from config.cache_utils import get_versions
+from . import admission, broadcast, deletion, map_clusters, metadata, tasks, vector_index, views
+from .renditions import WATERMARK_VERSION, spec_version
+from config.celery import PRIORITY_DEFAULT
 
-# Create your tests here.
+User = get_user_model()
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+HAS_TORCH = all(importlib.util.find_spec(name) for name in ('torch', 'torchvision'))
+
+
+class EventFeedTests(TestCase):
+    # processed photos reach the live event feed in batches (gallery/broadcast.py)
+    def setUp(self):
+        cache.clear()
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.photos = [
+            Photo.objects.create(event=self.event, image=f'event_photos/{i}.jpg', photographer=self.photographer, is_processed=True)
+            for i in range(20)
+        ]
+        self.send = self.enterContext(unittest.mock.patch.object(broadcast, 'group_send'))
+        self.schedule = self.enterContext(unittest.mock.patch.object(tasks.flush_event_feed, 'apply_async'))
+
+    def sent(self):
+        return [card['id'] for call in self.send.call_args_list for card in call.args[1]['photos']]
+
+    def test_a_batch_is_sent_once(self):
+        for photo in self.photos[:3]:
+            broadcast.queue_event_photo(self.event.id, photo.id)
+        self.schedule.assert_called_once() # the first photo of the window schedules the flush
+
+        self.assertEqual(broadcast.flush_event_photos(self.event.id), 3)
+        self.assertEqual(broadcast.flush_event_photos(self.event.id), 0)
+        self.assertEqual(sorted(self.sent()), sorted(p.id for p in self.photos[:3]))
+        self.send.assert_called_once()
+
+    def test_concurrent_queueing_loses_nothing(self):
+        def queue(photos):
+            for photo in photos:
+                broadcast.queue_event_photo(self.event.id, photo.id)
+
+        threads = [threading.Thread(target=queue, args=(self.photos[i::4],)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        broadcast.flush_event_photos(self.event.id) # racing the writers
+        for thread in threads:
+            thread.join()
+        broadcast.flush_event_photos(self.event.id)
+
+        self.assertEqual(sorted(self.sent()), sorted(p.id for p in self.photos))
+
+    def test_a_slot_never_written_is_skipped_after_the_grace_period(self):
+        broadcast.queue_event_photo(self.event.id, self.photos[0].id)
+        cache.incr(broadcast._seq_key(self.event.id)) # a worker died after claiming slot 2
+        broadcast.queue_event_photo(self.event.id, self.photos[1].id)
+
+        now = 1_000_000.0
+        with unittest.mock.patch.object(broadcast, 'time') as clock: # not time.time itself, locmem expires on it
+            clock.time.side_effect = lambda: now
+            self.assertEqual(broadcast.flush_event_photos(self.event.id), 1)
+            self.assertEqual(broadcast.flush_event_photos(self.event.id), 0) # still waiting for it
+            now += broadcast.FEED_GAP_GRACE
+            self.assertEqual(broadcast.flush_event_photos(self.event.id), 1)
+
+        self.assertEqual(self.sent(), [self.photos[0].id, self.photos[1].id])
+        self.assertEqual(cache.get(broadcast._flushed_key(self.event.id)), 3)
+
+
+@override_settings(UPLOAD_MAX_QUEUED=100)
+class UploadAdmissionTests(TestCase):
+    # uploads are shed or deferred while the thumbnails queue is backed up (gallery/admission.py)
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.depth = self.enterContext(unittest.mock.patch.object(admission, 'queue_depth', return_value=0))
+
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.photographer)
+
+    def upload(self):
+        data = io.BytesIO()
+        Image.new('RGB', (40, 30), 'green').save(data, 'JPEG')
+        image = SimpleUploadedFile('a.jpg', data.getvalue(), content_type='image/jpeg')
+        with unittest.mock.patch('gallery.signals.queue_photo_work') as queued:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/gallery/photos/', {'event': self.event.id, 'image': image}, format='multipart')
+        return response, queued
+
+    def test_accepted_while_there_is_room(self):
+        response, queued = self.upload()
+        self.assertEqual(response.status_code, 201)
+        queued.assert_called_once_with(response.data['id'])
+
+    @override_settings(UPLOAD_ADMISSION_MODE='reject', UPLOAD_RETRY_AFTER=30)
+    def test_rejected_when_backed_up(self):
+        self.depth.return_value = 100
+        response, queued = self.upload()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertFalse(Photo.objects.exists())
+        queued.assert_not_called()
+
+    @override_settings(UPLOAD_ADMISSION_MODE='defer')
+    def test_deferred_when_backed_up(self):
+        self.depth.return_value = 100
+        response, queued = self.upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Photo.objects.get(id=response.data['id']).processing_deferred)
+        queued.assert_not_called()
+
+    def test_drain_waits_for_the_backlog(self):
+        deferred = [
+            Photo.objects.create(event=self.event, image=f'event_photos/{i}.jpg', photographer=self.photographer, processing_deferred=True)
+            for i in range(3)
+        ]
+        with unittest.mock.patch.object(tasks, 'queue_photo_work') as queued:
+            self.depth.return_value = 100
+            self.assertEqual(tasks.drain_deferred_photos(), 0)
+            queued.assert_not_called()
+            self.assertEqual(Photo.objects.filter(processing_deferred=True).count(), 3)
+
+            cache.clear() # the backlog gauge is cached for a few seconds
+            self.depth.return_value = 0
+            self.assertEqual(tasks.drain_deferred_photos(batch_size=2), 2)
+            self.assertEqual(
+                queued.call_args_list,
+                [unittest.mock.call(photo.id, priority=PRIORITY_DEFAULT) for photo in deferred[:2]],
+            )
+            self.assertEqual(list(Photo.objects.filter(processing_deferred=True)), deferred[2:])
+
+
+class EventListLikeStateTests(TestCase):
+    # the event list is cached once for everyone, like state is filled in per request
+    def setUp(self):
+        cache.clear()
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.alice = User.objects.create_user(email='alice@example.com', password='x', role='Member')
+        self.bob = User.objects.create_user(email='bob@example.com', password='x', role='Member')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.photo = Photo.objects.create(event=self.event, image='event_photos/a.jpg', photographer=self.photographer, is_processed=True)
+
+    def list_photo(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/gallery/events/')
+        self.assertEqual(response.status_code, 200)
+        photo = response.data['results'][0]['photos'][0]
+        return response, photo
+
+    def test_like_state_is_per_user_on_a_shared_entry(self):
+        Like.objects.create(user=self.alice, photo=self.photo)
+
+        _, photo = self.list_photo(self.alice)
+        self.assertTrue(photo['is_liked'])
+        self.assertEqual(photo['likes_count'], 1)
+
+        response, photo = self.list_photo(self.bob)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertFalse(photo['is_liked'])
+        self.assertEqual(photo['likes_count'], 1)
+
+    def test_likes_show_up_without_dropping_the_list(self):
+        self.list_photo(self.alice)
+        Like.objects.create(user=self.bob, photo=self.photo)
+
+        response, photo = self.list_photo(self.alice)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(photo['likes_count'], 1)
+        self.assertFalse(photo['is_liked'])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.photo = Photo.objects.create(event=self.event, image='event_photos/a.jpg', photographer=self.photographer, is_processed=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.photographer)
+
+    def test_no_last_modified(self):
+        response = self.client.get('/api/gallery/photos/')
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_deleting_a_photo_changes_the_list_etag(self):
+        etag = self.client.get('/api/gallery/photos/')['ETag']
+        self.assertEqual(self.client.get('/api/gallery/photos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.photo.delete()
+        self.assertEqual(self.client.get('/api/gallery/photos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_event_detail_validates_on_its_cache_version(self):
+        url = f'/api/gallery/events/{self.event.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.photo.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SharePageTests(TestCase):
+    # public share links are served pre-rendered from the cache (gallery/sharing.py)
+    def setUp(self):
+        cache.clear()
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.photo = Photo.objects.create(event=event, image='event_photos/a.jpg', photographer=self.photographer, is_processed=True)
+        self.album = Album.objects.create(owner=self.photographer, name='Best of')
+        self.owner = APIClient()
+        self.owner.force_authenticate(self.photographer)
+
+    def album_url(self, album=None):
+        return f'/api/gallery/albums/{(album or self.album).share_token}/'
+
+    def photo_url(self):
+        return f'/share/photos/{self.photo.share_token}/'
+
+    def toggle(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.owner.post(url).status_code, 200)
+
+    def test_unknown_token(self):
+        for url in (self.album_url(Album(owner=self.photographer)), f'/share/photos/{uuid.uuid4()}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertNotIn('ETag', response)
+
+    def test_private_links_are_forbidden(self):
+        for url in (self.album_url(), self.photo_url()):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 403)
+                self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_public_pages_revalidate(self):
+        self.toggle(f'/api/gallery/albums/{self.album.id}/share/')
+        self.toggle(f'/api/gallery/photos/{self.photo.id}/share/')
+        for url in (self.album_url(), self.photo_url()):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age', response['Cache-Control'])
+
+                with self.assertNumQueries(0): # token and page both come from the cache
+                    repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(repeat.status_code, 304)
+                self.assertEqual(repeat['ETag'], response['ETag'])
+
+    def test_toggling_is_public_drops_the_cached_page(self):
+        for toggle_url, url in (
+            (f'/api/gallery/albums/{self.album.id}/share/', self.album_url()),
+            (f'/api/gallery/photos/{self.photo.id}/share/', self.photo_url()),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 403)
+                self.toggle(toggle_url)
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.toggle(toggle_url)
+                self.assertEqual(self.client.get(url).status_code, 403)
+
+
+@override_settings(WATERMARK_ON_UPLOAD=False)
+class ProcessPhotoPublishTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        (Path(media.name) / 'event_photos').mkdir()
+        Image.new('RGB', (64, 48), 'red').save(Path(media.name) / 'event_photos' / 'a.jpg')
+
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.publish = self.enterContext(unittest.mock.patch.object(tasks, 'publish_processed_photo'))
+        self.enterContext(unittest.mock.patch.object(tasks.time, 'sleep'))
+
+    def process(self, is_processed):
+        photo = Photo.objects.create(event=self.event, image='event_photos/a.jpg', photographer=self.photographer, is_processed=is_processed)
+        self.assertEqual(tasks.process_photo.apply((photo.id,)).get(), "Done")
+        photo.refresh_from_db()
+        self.assertTrue(photo.is_processed)
+
+    def test_first_processing_is_published(self):
+        self.process(is_processed=False)
+        self.publish.assert_called_once()
+
+    def test_reprocessing_is_not_published(self):
+        self.process(is_processed=True)
+        self.publish.assert_not_called()
+
+
+class DisplayImageTests(TestCase):
+    # the unwatermarked original never leaves the server
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        (Path(media.name) / 'event_photos').mkdir()
+        Image.new('RGB', (64, 48), 'red').save(Path(media.name) / 'event_photos' / 'a.jpg')
+
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.photo = Photo.objects.create(
+            event=self.event, image='event_photos/a.jpg', thumbnail='photos/thumbnails/a.jpg',
+            photographer=self.photographer, is_processed=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.photographer)
+
+    def image_url(self):
+        return self.client.get(f'/api/gallery/photos/{self.photo.id}/').data['image']
+
+    def test_thumbnail_until_the_watermark_is_current(self):
+        self.assertTrue(self.image_url().endswith('photos/thumbnails/a.jpg'))
+
+        Photo.objects.filter(id=self.photo.id).update(watermarked='photos/watermarked/a_old.jpg', watermark_version='old')
+        cache.clear()
+        self.assertTrue(self.image_url().endswith('photos/thumbnails/a.jpg'))
+
+        Photo.objects.filter(id=self.photo.id).update(watermarked='photos/watermarked/a.jpg', watermark_version=WATERMARK_VERSION)
+        cache.clear()
+        self.assertTrue(self.image_url().endswith('photos/watermarked/a.jpg'))
+
+    def test_download_queues_the_render_once(self):
+        url = f'/api/gallery/photos/{self.photo.id}/download/'
+        with unittest.mock.patch.object(views, 'watermark_photo') as watermark:
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 503)
+                self.assertIn('Retry-After', response)
+        watermark.apply_async.assert_called_once()
+
+
+def jpeg_bytes(size=(40, 30), gps=None, xmp=None):
+    exif = Image.Exif()
+    if gps:
+        exif.get_ifd(metadata.GPS_IFD).update(gps)
+    out = io.BytesIO()
+    Image.new('RGB', size, 'blue').save(out, 'JPEG', exif=exif, **({'xmp': xmp} if xmp else {}))
+    return out.getvalue()
+
+
+class MetadataTests(SimpleTestCase):
+    GPS = {1: 'N', 2: (51.0, 30.0, 27.07), 3: 'W', 4: (0.0, 7.0, 39.9)}
+    XMP = b'<rdf:Description exif:GPSLatitude="48,51.3N" exif:GPSLongitude="2,17,40.2E"/>'
+
+    def test_read_jpeg_header(self):
+        exif, xmp, size = metadata.read_jpeg_header(io.BytesIO(jpeg_bytes(gps=self.GPS, xmp=self.XMP)))
+        self.assertTrue(exif.startswith(metadata.EXIF_HEADER))
+        self.assertIn(b'exif:GPSLatitude', xmp)
+        self.assertEqual(size, (40, 30))
+
+    def test_read_jpeg_header_skips_fill_bytes(self):
+        data = jpeg_bytes()
+        padded = data[:2] + b'\xff\xff' + data[2:] # fill bytes before the first marker
+        self.assertEqual(metadata.read_jpeg_header(io.BytesIO(padded))[2], (40, 30))
+
+    def test_read_jpeg_header_other_files(self):
+        png = io.BytesIO()
+        Image.new('RGB', (4, 4)).save(png, 'PNG')
+        self.assertIsNone(metadata.read_jpeg_header(png))
+        self.assertEqual(metadata.read_jpeg_header(io.BytesIO(b'\xff\xd8\xff\xe1\x00')), (None, None, None)) # truncated
+
+    def test_gps_coordinate(self):
+        self.assertAlmostEqual(metadata.gps_coordinate((51, 30, 27.07), 'N'), 51.507519, places=6)
+        self.assertAlmostEqual(metadata.gps_coordinate((0, 7, 39.9), b'W'), -0.127750, places=6)
+        self.assertLess(metadata.gps_coordinate((33, 52, 0), 'S '), 0)
+        self.assertEqual(metadata.gps_coordinate((10, 0, 0), None), 10)
+        self.assertIsNone(metadata.gps_coordinate((1, 'x', 2), 'N'))
+        self.assertIsNone(metadata.gps_coordinate((1, 2), 'N'))
+        self.assertIsNone(metadata.gps_coordinate(None, 'N'))
+
+    def test_xmp_coordinate(self):
+        self.assertAlmostEqual(metadata.xmp_coordinate('51,30.4512N'), 51.50752, places=6)
+        self.assertAlmostEqual(metadata.xmp_coordinate(' 0,7,39.9w '), -0.12775, places=6)
+        self.assertAlmostEqual(metadata.xmp_coordinate('33,52S'), -33 - 52 / 60, places=6)
+        for value in (None, '', '51.5', '51,30.4512', '51,30,27,1N', 'N51,30'):
+            self.assertIsNone(metadata.xmp_coordinate(value), value)
+
+    def test_extract_metadata_position(self):
+        found = metadata.extract_metadata(io.BytesIO(jpeg_bytes(gps=self.GPS)))
+        self.assertEqual((found['latitude'], found['longitude']), (51.5075194, -0.12775))
+
+        found = metadata.extract_metadata(io.BytesIO(jpeg_bytes(xmp=self.XMP))) # xmp as the fallback
+        self.assertEqual((found['latitude'], found['longitude']), (48.855, 2.2945))
+
+        found = metadata.extract_metadata(io.BytesIO(jpeg_bytes(gps={1: 'N', 2: (0, 0, 0), 3: 'E', 4: (0, 0, 0)})))
+        self.assertIsNone(found['latitude']) # 0,0 means no fix
+
+
+class LocationPrivacyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.coordinator = User.objects.create_user(email='coordinator@example.com', password='x', role='Coordinator')
+        self.member = User.objects.create_user(email='member@example.com', password='x', role='Member')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.coordinator)
+        self.photo = Photo.objects.create(
+            event=self.event, image='event_photos/a.jpg', photographer=self.photographer, is_processed=True,
+            latitude=51.5075194, longitude=-0.12775,
+        )
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def position(self, user):
+        photo = self.get(user, f'/api/gallery/photos/{self.photo.id}/')
+        return photo['latitude'], photo['longitude']
+
+    def test_exact_for_photographer_and_coordinators_only(self):
+        self.assertEqual(self.position(self.photographer), (51.5075194, -0.12775))
+        self.assertEqual(self.position(self.coordinator), (51.5075194, -0.12775))
+        self.assertEqual(self.position(self.member), (51.51, -0.13))
+
+    def test_shared_event_list_is_rounded_per_viewer(self):
+        photo = self.get(self.photographer, '/api/gallery/events/')['results'][0]['photos'][0]
+        self.assertEqual(photo['latitude'], 51.5075194)
+        photo = self.get(self.member, '/api/gallery/events/')['results'][0]['photos'][0]
+        self.assertEqual((photo['latitude'], photo['longitude']), (51.51, -0.13))
+
+    def test_bbox_is_no_finer_than_the_rounded_position(self):
+        # a thin box just east of the photo, inside the same grid cell
+        url = '/api/gallery/photos/?bbox=-0.1277,51.5075,-0.1276,51.5076'
+        self.assertEqual(self.get(self.coordinator, url)['count'], 0)
+        self.assertEqual(self.get(self.member, url)['count'], 1)
+
+    def test_map_centroids_are_rounded(self):
+        cell = self.get(self.coordinator, '/api/gallery/photos/map/?bbox=-0.2,51.45,0,51.55&zoom=16')
+        self.assertEqual(cell['zoom'], 13)
+        self.assertEqual((cell['clusters'][0]['latitude'], cell['clusters'][0]['longitude']), (51.51, -0.13))
+
+
+class MapTileTests(SimpleTestCase):
+    def test_tile_of(self):
+        self.assertEqual(map_clusters.tile_of(0, 0, 0), (0, 0))
+        self.assertEqual(map_clusters.tile_of(0, 0, 2), (2, 1))
+        self.assertEqual(map_clusters.tile_of(51.5, -0.13, 3), (3, 3))
+
+    def test_edges_clamp_into_the_last_tile(self):
+        for zoom in (0, 1, 5, map_clusters.MAX_ZOOM):
+            columns, rows = map_clusters.tile_counts(zoom)
+            self.assertEqual(map_clusters.tile_of(90, 180, zoom), (columns - 1, rows - 1))
+            self.assertEqual(map_clusters.tile_of(-90, -180, zoom), (0, 0))
+
+    def test_viewport_ranges(self):
+        xs, ys = map_clusters.viewport_ranges((-10, -10, 10, 10), 3)
+        self.assertEqual(xs, [range(3, 5)])
+        self.assertEqual(ys, range(1, 3))
+
+    def test_viewport_ranges_split_at_the_antimeridian(self):
+        xs, ys = map_clusters.viewport_ranges((170, -10, -170, 10), 3)
+        self.assertEqual(xs, [range(7, 8), range(0, 1)])
+        self.assertEqual(ys, range(1, 3))
+        self.assertEqual(len(map_clusters.viewport_tiles((170, -10, -170, 10), 3)), 4)
+
+        # both halves overlap at zoom 0, the single column is listed once
+        self.assertEqual(map_clusters.viewport_ranges((170, -10, -170, 10), 0)[0], [range(1)])
+
+    def test_fit_zoom_falls_back_for_wide_viewports(self):
+        world = (-180, -90, 180, 90)
+        self.assertEqual(map_clusters.fit_zoom(world, 16), 3) # 8 x 4 tiles, zoom 4 would be 16 x 8
+        self.assertEqual(map_clusters.fit_zoom((-0.2, 51.45, 0, 51.55), 16), map_clusters.MAX_ZOOM)
+        self.assertEqual(map_clusters.fit_zoom((-0.2, 51.45, 0, 51.55), 5), 5)
+        self.assertEqual(map_clusters.fit_zoom(world, -3), 0)
+
+
+class MapClusterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+
+    def photo(self, latitude, longitude, **fields):
+        return Photo.objects.create(
+            event=self.event, image='event_photos/a.jpg', photographer=self.photographer, is_processed=True,
+            latitude=latitude, longitude=longitude, **fields,
+        )
+
+    def test_compute_tiles(self):
+        corner = self.photo(90, 180)
+        self.photo(-90, -180)
+        first = self.photo(1, 1, thumbnail='photos/thumbnails/1.jpg')
+        self.photo(2, 2) # same cell, newer but without a thumbnail
+
+        tiles = map_clusters.compute_tiles(Photo.objects.all(), 2, [(3, 1), (0, 0), (2, 1), (1, 1)])
+        self.assertEqual([c['photo_id'] for c in tiles[(3, 1)]], [corner.id])
+        self.assertEqual(len(tiles[(0, 0)]), 1)
+        self.assertEqual(tiles[(1, 1)], [])
+
+        [cluster] = tiles[(2, 1)]
+        self.assertEqual(cluster['count'], 2)
+        self.assertEqual((cluster['latitude'], cluster['longitude']), (1.5, 1.5))
+        self.assertEqual((cluster['photo_id'], cluster['thumbnail']), (first.id, 'photos/thumbnails/1.jpg'))
+
+    def test_edits_that_keep_the_position_leave_tiles_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = self.photo(51.5, -0.13)
+        here = map_clusters.location_namespaces(51.5, -0.13)
+        there = map_clusters.location_namespaces(48.85, 2.29)
+        versions = get_versions(here + there)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.description = 'Launch day'
+            photo.save()
+        self.assertEqual(get_versions(here + there), versions)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.latitude, photo.longitude = 48.85, 2.29
+            photo.save()
+        moved = get_versions(here + there)
+        self.assertTrue(all(old != new for old, new in zip(versions, moved)))
+
+
+class MassDeleteTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+        self.coordinator = User.objects.create_user(email='coordinator@example.com', password='x', role='Coordinator')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.coordinator)
+
+    def photo(self, **fields):
+        return Photo.objects.create(event=self.event, image='event_photos/a.jpg', photographer=self.coordinator, is_processed=True, **fields)
+
+    def test_status_is_only_visible_to_its_requester_and_admins(self):
+        job = PhotoDeletionJob.objects.create(requested_by=self.coordinator, photo_ids=[], total=0)
+        other = User.objects.create_user(email='other@example.com', password='x', role='Coordinator')
+        admin = User.objects.create_user(email='admin@example.com', password='x', role='Admin')
+
+        for user, expected in ((self.coordinator, 200), (other, 404), (admin, 200)):
+            client = APIClient()
+            client.force_authenticate(user)
+            self.assertEqual(client.get(f'/api/gallery/mass-delete-photos/{job.id}/').status_code, expected, user.email)
+
+    def test_emptied_draft_albums_are_deleted(self):
+        emptied = Album.objects.create(event=self.event, owner=self.coordinator, name='Morning', is_draft=True)
+        kept = Album.objects.create(event=self.event, owner=self.coordinator, name='Evening', is_draft=True)
+        photos = [self.photo(suggested_album=emptied), self.photo(suggested_album=emptied), self.photo(suggested_album=kept)]
+        self.photo(suggested_album=kept)
+
+        job = PhotoDeletionJob.objects.create(requested_by=self.coordinator, photo_ids=[p.id for p in photos], total=3)
+        self.assertEqual(deletion.run_deletion_job(job.id).deleted, 3)
+        self.assertFalse(Album.objects.filter(id=emptied.id).exists())
+        self.assertTrue(Album.objects.filter(id=kept.id).exists())
+
+
+class VectorIndexTests(SimpleTestCase):
+    def test_removed_rows_leave_the_rest_searchable(self):
+        index = vector_index.ExactIndex(dim=3)
+        index.upsert([1, 2, 3], np.eye(3, dtype=np.float16))
+        index.remove([1, 99])
+
+        self.assertEqual(index.size, 2)
+        self.assertIsNone(index.vector(1))
+        self.assertEqual(index.search([0, 0, 1], 1), [(3, 1.0)])
+        self.assertEqual({photo_id for photo_id, _ in index.search([1, 0, 0], 5)}, {2, 3})
+
+    def test_ivf_scans_everything_until_centroids_are_published(self):
+        index = vector_index.IVFIndex(dim=2, lists=2, probe=1)
+        index.upsert(list(range(100)), [[1, 0] if i % 2 else [0, 1] for i in range(100)])
+        self.assertIsNone(index.candidates([1, 0])) # searching never trains
+
+        index.set_centroids([[1, 0], [0, 1]], version=1)
+        self.assertEqual(set(index.ids[index.candidates([1, 0])]), set(range(1, 100, 2)))
+        index.remove([1])
+        self.assertEqual(set(index.ids[index.candidates([1, 0])]), set(range(3, 100, 2)))
+
+    def test_a_fork_leaves_the_published_index_alone(self):
+        for index in (vector_index.ExactIndex(dim=3), vector_index.IVFIndex(dim=3, lists=1, probe=1)):
+            with self.subTest(index=type(index).__name__):
+                index.upsert([1, 2], np.eye(3, dtype=np.float16)[:2])
+
+                fork = index.fork()
+                fork.upsert([1, 3], [[1, 0, 0], [0, 0, 1]]) # 1 unchanged, 3 appended
+                self.assertIs(fork.vectors, index.vectors) # nothing to copy yet
+
+                fork.upsert([2], [[1, 0, 0]])
+                fork.remove([1])
+                self.assertIsNot(fork.vectors, index.vectors)
+                self.assertEqual(index.size, 2)
+                self.assertEqual(index.search([0, 1, 0], 1), [(2, 1.0)])
+                self.assertEqual(index.search([1, 0, 0], 1), [(1, 1.0)])
+                self.assertEqual({photo_id for photo_id, _ in fork.search([1, 0, 0], 5)}, {2, 3})
+
+
+class VectorIndexSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        rng = np.random.default_rng(0)
+        self.photos = Photo.objects.bulk_create([
+            Photo(event=self.event, image=f'event_photos/{i}.jpg', photographer=self.photographer, is_processed=True)
+            for i in range(80)
+        ])
+        for photo in self.photos:
+            vector_index.store_embedding(photo.id, rng.standard_normal(vector_index.EMBEDDING_DIM))
+
+    def published(self, index=None):
+        # module state as the background sync leaves it
+        for name, value in (('_index', index), ('_synced_until', None), ('_last_sync', 0.0)):
+            self.enterContext(unittest.mock.patch.object(vector_index, name, value))
+
+    def test_searches_never_sync_inline(self):
+        self.published()
+        with unittest.mock.patch.object(vector_index, 'warm_index') as warm:
+            self.assertIsNone(vector_index.get_index())
+            with self.assertRaises(vector_index.IndexNotReady):
+                vector_index.similar_photos(self.photos[0].id, 5)
+        warm.assert_called()
+
+        client = APIClient()
+        client.force_authenticate(self.photographer)
+        with unittest.mock.patch.object(vector_index, 'warm_index'):
+            response = client.get(f'/api/gallery/photos/{self.photos[0].id}/similar/')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_refresh_swaps_in_a_synced_fork(self):
+        self.published()
+        self.assertTrue(vector_index.refresh_index())
+        first = vector_index.get_index()
+        self.assertEqual(first.size, 80)
+        matches = vector_index.similar_photos(self.photos[0].id, 5)
+        self.assertEqual(len(matches), 5)
+        self.assertNotIn(self.photos[0].id, [photo_id for photo_id, _ in matches])
+
+        self.photos[0].delete()
+        self.assertTrue(vector_index.refresh_index())
+        self.assertEqual(vector_index.get_index().size, 79)
+        self.assertEqual(first.size, 80) # a search still holding the old one is unaffected
+
+        with vector_index._sync_lock: # another thread is syncing
+            self.assertFalse(vector_index.refresh_index())
+
+    def test_sync_evicts_deleted_photos(self):
+        index = vector_index.ExactIndex()
+        synced_until = vector_index.sync_index(index, None)
+        self.assertEqual(index.size, 80)
+
+        self.photos[0].delete()
+        vector_index.sync_index(index, synced_until)
+        self.assertEqual(index.size, 79)
+        self.assertIsNone(index.vector(self.photos[0].id))
+
+    @override_settings(VECTOR_INDEX_IVF_LISTS=2)
+    def test_training_is_published_to_other_processes(self):
+        index = vector_index.IVFIndex(lists=2, probe=1)
+        vector_index.sync_index(index, None)
+        with unittest.mock.patch.object(vector_index, 'schedule_training') as schedule:
+            vector_index.sync_centroids(index)
+        schedule.assert_called_once()
+        self.assertIsNone(index.centroids)
+
+        self.assertEqual(vector_index.train_ivf(), 80)
+        vector_index.sync_centroids(index)
+        self.assertEqual(index.centroids.shape, (2, vector_index.EMBEDDING_DIM))
+        self.assertTrue((index.assignments[:index.size] >= 0).all())
+        self.assertIsNone(cache.get(vector_index.IVF_TRAINING_KEY))
+
+
+@unittest.skipUnless(HAS_TORCH, "torch is not installed")
+class OptimizedModelPathTests(SimpleTestCase):
+    def test_versioned_on_the_build(self):
+        from . import ai_utils
+
+        with override_settings(AI_TAGGING_MODEL_PATH='/models/resnet50_int8_embed.pt'):
+            path = ai_utils.optimized_model_path()
+            self.assertEqual(path, f'/models/resnet50_int8_embed_{ai_utils.OPTIMIZED_VERSION}.pt')
+
+            # another torch release must not load the old export
+            spec = {**ai_utils.OPTIMIZED_SPEC, 'torch': '0.0.1'}
+            with unittest.mock.patch.object(ai_utils, 'OPTIMIZED_VERSION', spec_version(spec)):
+                self.assertNotEqual(ai_utils.optimized_model_path(), path)
+
+        with override_settings(AI_TAGGING_MODEL_PATH=''):
+            self.assertEqual(ai_utils.optimized_model_path(), '')
+
+
+@unittest.skipUnless(HAS_TORCH, "torch is not installed")
+@override_settings(AI_TAGGING_MODEL_PATH='') # build the optimized model in memory, don't export it
+class TaggingParityTests(SimpleTestCase):
+    # the optimized backend must pick exactly the tags eager does (gallery/ai_utils.py)
+    def test_optimized_tags_match_eager(self):
+        from . import ai_utils
+
+        try:
+            ai_utils.get_model('eager')
+        except OSError as e:
+            self.skipTest(f"resnet50 weights unavailable: {e}") # first run downloads them
+
+        paths = sorted((FIXTURES / 'tagging').glob('*.jpg'))
+        self.assertTrue(paths)
+        for path in paths:
+            with self.subTest(image=path.name), Image.open(path) as img:
+                img = img.convert('RGB')
+                self.assertEqual(ai_utils.predict_tags([img], 'optimized'), ai_utils.predict_tags([img], 'eager'))
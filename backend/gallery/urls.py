@@ -1,4 +1,4 @@
-from .views import mass_delete_photos, toggle_public_photo_link
+from .views import mass_delete_photos, mass_delete_status, toggle_public_photo_link, resized_image
 from .views import PhotoViewSet, AlbumViewSet, EventViewSet, UserSearchView, toggle_public_link, view_shared_album
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
@@ -15,5 +15,7 @@ urlpatterns = [
     path('albums/<int:album_id>/share/', toggle_public_link, name='toggle_public_link'),
     path('search/', UserSearchView.as_view(), name='user_search'),
     path('mass-delete-photos/', mass_delete_photos, name='mass_delete_photos'),
+    path('mass-delete-photos/<int:job_id>/', mass_delete_status, name='mass_delete_status'),
+    path('resize/<path:name>', resized_image, name='resized_image'),
     path('', include(router.urls)),
 ]
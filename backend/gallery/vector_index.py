@@ -0,0 +1,378 @@
+import copy
+import threading
+import time
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+# visual similarity over the tagger embeddings (PhotoEmbedding rows).
+#
+# vectors are L2 normalised before they're stored as float16, so cosine similarity
+# is a plain dot product. every process keeps an in-memory index and syncs it
+# incrementally from PhotoEmbedding.updated_at at most every VECTOR_INDEX_SYNC_INTERVAL
+# seconds, so newly processed photos show up without any reload.
+#
+# settings.VECTOR_INDEX_BACKEND:
+#   'exact' brute force over every vector, fine into the low hundreds of thousands
+#   'ivf'   inverted file: k-means coarse centroids, only the VECTOR_INDEX_IVF_PROBE
+#           closest lists are scanned. the centroids are trained by the train_vector_index
+#           task and shared through the cache, a process that sees the library double
+#           since the last training schedules the next one. until centroids exist every
+#           row is scanned, as with 'exact'
+#
+# searches never wait on a sync: a published index is never written to again. a sync
+# runs on a background thread, applies the changes to a fork of the published index and
+# swaps the fork in. the first build starts with the web server (warm_index), until it's
+# done similar_photos raises IndexNotReady.
+# rows gone from PhotoEmbedding (photo deleted, re-embedded with another model) are
+# evicted on the next sync that finds fewer rows in the table than in the index
+
+EMBEDDING_DIM = 2048
+EMBEDDING_MODEL = 'resnet50-avgpool-f16'
+SEARCH_CHUNK = 8192 # rows converted to float32 at a time
+SYNC_OVERLAP = timedelta(seconds=5) # rows committed late with an older updated_at
+IVF_TRAIN_ITERATIONS = 10
+IVF_SAMPLE_PER_LIST = 64
+IVF_MIN_PER_LIST = 40 # too small to be worth it below this (faiss' rule of thumb)
+IVF_CENTROIDS_KEY = 'vector_index:ivf'
+IVF_TRAINING_KEY = 'vector_index:ivf:training'
+IVF_TRAINING_TIMEOUT = 60 * 60 # a training that died frees the slot after this
+INDEX_RETRY_AFTER = 5 # seconds a search is told to wait for the first build
+
+class IndexNotReady(Exception):
+    pass
+
+def encode_embedding(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector = vector / norm
+    return vector.astype(np.float16).tobytes()
+
+def decode_embedding(data):
+    return np.frombuffer(bytes(data), dtype=np.float16)
+
+class ExactIndex:
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float16)
+        self.positions = {}
+        self.shared_vectors = False
+
+    def fork(self):
+        # a copy to sync into while searches keep using this one. rows appended past
+        # self.size aren't seen by anything reading this index, so the vectors are
+        # shared until the fork has to rewrite or drop a row (_own_vectors)
+        other = copy.copy(self)
+        other.ids = self.ids.copy()
+        other.positions = dict(self.positions)
+        other.shared_vectors = True
+        return other
+
+    def _own_vectors(self):
+        if self.shared_vectors:
+            self.vectors = self.vectors.copy()
+            self.shared_vectors = False
+
+    def _grow(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        ids = np.zeros(capacity, dtype=np.int64)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float16)
+        ids[:self.size] = self.ids[:self.size]
+        vectors[:self.size] = self.vectors[:self.size]
+        self.ids, self.vectors = ids, vectors
+        self.shared_vectors = False
+
+    def upsert(self, ids, vectors):
+        new_rows = []
+        for photo_id, vector in zip(ids, vectors):
+            position = self.positions.get(photo_id)
+            if position is None:
+                new_rows.append((photo_id, vector))
+            elif not np.array_equal(self.vectors[position], vector): # SYNC_OVERLAP sees rows again
+                self._own_vectors()
+                self.vectors[position] = vector
+                self.updated(position)
+
+        self._grow(self.size + len(new_rows))
+        for photo_id, vector in new_rows:
+            self.ids[self.size] = photo_id
+            self.vectors[self.size] = vector
+            self.positions[photo_id] = self.size
+            self.added(self.size)
+            self.size += 1
+
+    def remove(self, ids):
+        # the last row moves into each hole, positions stay dense
+        for photo_id in ids:
+            position = self.positions.pop(photo_id, None)
+            if position is None:
+                continue
+            self._own_vectors() # the freed row gets reused by the next append
+            last = self.size - 1
+            if position != last:
+                moved_id = int(self.ids[last])
+                self.ids[position] = moved_id
+                self.vectors[position] = self.vectors[last]
+                self.positions[moved_id] = position
+                self.moved(last, position)
+            self.size = last
+
+    def added(self, position):
+        pass
+
+    def updated(self, position):
+        pass
+
+    def moved(self, source, target):
+        pass
+
+    def vector(self, photo_id):
+        position = self.positions.get(photo_id)
+        return None if position is None else self.vectors[position]
+
+    def scores(self, query, positions=None):
+        query = np.asarray(query, dtype=np.float32)
+        if positions is None:
+            rows = self.vectors[:self.size]
+            # numpy has no fast float16 matmul, go through float32 a chunk at a time
+            return np.concatenate([
+                rows[i:i + SEARCH_CHUNK].astype(np.float32) @ query
+                for i in range(0, self.size, SEARCH_CHUNK)
+            ]) if self.size else np.empty(0, dtype=np.float32)
+        return self.vectors[positions].astype(np.float32) @ query
+
+    def candidates(self, query):
+        return None # every row
+
+    def search(self, query, k):
+        positions = self.candidates(query)
+        scores = self.scores(query, positions)
+        if not len(scores):
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ids = self.ids[:self.size] if positions is None else self.ids[positions]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+class IVFIndex(ExactIndex):
+    def __init__(self, dim=EMBEDDING_DIM, lists=256, probe=8):
+        super().__init__(dim)
+        self.lists = lists
+        self.probe = probe
+        self.centroids = None
+        self.centroids_version = None
+        self.assignments = np.empty(0, dtype=np.int32)
+
+    def fork(self):
+        other = super().fork()
+        other.assignments = self.assignments.copy()
+        return other
+
+    def _grow(self, needed):
+        super()._grow(needed)
+        if len(self.assignments) < len(self.ids):
+            assignments = np.full(len(self.ids), -1, dtype=np.int32)
+            assignments[:len(self.assignments)] = self.assignments
+            self.assignments = assignments
+
+    def assign(self, vectors):
+        return np.argmax(vectors.astype(np.float32) @ self.centroids.T, axis=1).astype(np.int32)
+
+    def added(self, position):
+        if self.centroids is not None:
+            self.assignments[position] = self.assign(self.vectors[position:position + 1])[0]
+
+    updated = added
+
+    def moved(self, source, target):
+        self.assignments[target] = self.assignments[source]
+
+    def set_centroids(self, centroids, version):
+        # every row gets its nearest list, once per training
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.centroids_version = version
+        if self.size:
+            rows = self.vectors[:self.size]
+            self.assignments[:self.size] = np.concatenate([
+                self.assign(rows[i:i + SEARCH_CHUNK]) for i in range(0, self.size, SEARCH_CHUNK)
+            ])
+
+    def candidates(self, query):
+        if self.centroids is None or self.size < len(self.centroids) * IVF_MIN_PER_LIST:
+            return None
+        closest = np.argsort(-(self.centroids @ np.asarray(query, dtype=np.float32)))[:self.probe]
+        return np.flatnonzero(np.isin(self.assignments[:self.size], closest))
+
+def train_centroids(sample, lists, iterations=IVF_TRAIN_ITERATIONS, seed=0):
+    # spherical k-means
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), lists, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        sums[empty] = centroids[empty] # keep empty lists where they were
+        norms[empty] = 1.0
+        centroids = sums / norms
+    return centroids
+
+def train_ivf(seed=0):
+    # trains centroids on a sample of the library and publishes them to every process.
+    # runs in the train_vector_index task, returns the library size it was trained on
+    from .models import PhotoEmbedding
+
+    try:
+        lists = settings.VECTOR_INDEX_IVF_LISTS
+        photo_ids = list(PhotoEmbedding.objects.filter(model=EMBEDDING_MODEL).values_list('photo_id', flat=True))
+        if len(photo_ids) < lists * IVF_MIN_PER_LIST:
+            return 0
+
+        rng = np.random.default_rng(seed)
+        sample_ids = rng.choice(photo_ids, min(len(photo_ids), lists * IVF_SAMPLE_PER_LIST), replace=False).tolist()
+        sample = []
+        for start in range(0, len(sample_ids), 2000):
+            rows = PhotoEmbedding.objects.filter(photo_id__in=sample_ids[start:start + 2000], model=EMBEDDING_MODEL)
+            sample.extend(decode_embedding(vector) for vector in rows.values_list('vector', flat=True))
+        centroids = train_centroids(np.array(sample, dtype=np.float32), lists, seed=seed)
+
+        version = time.time_ns()
+        previous = cache.get(IVF_CENTROIDS_KEY)
+        cache.set(f"{IVF_CENTROIDS_KEY}:{version}", centroids.astype(np.float16), None)
+        cache.set(IVF_CENTROIDS_KEY, (version, len(photo_ids)), None)
+        if previous is not None:
+            cache.delete(f"{IVF_CENTROIDS_KEY}:{previous[0]}")
+        return len(photo_ids)
+    finally:
+        cache.delete(IVF_TRAINING_KEY)
+
+def schedule_training():
+    if cache.add(IVF_TRAINING_KEY, 1, IVF_TRAINING_TIMEOUT):
+        from config.celery import PRIORITY_BACKFILL
+        from .tasks import train_vector_index
+
+        train_vector_index.apply_async(priority=PRIORITY_BACKFILL)
+
+def sync_centroids(index):
+    # picks up centroids published by train_ivf, asks for a retrain once the library doubled
+    published = cache.get(IVF_CENTROIDS_KEY)
+    trained_size = 0
+    if published is not None:
+        version, trained_size = published
+        if version != index.centroids_version:
+            centroids = cache.get(f"{IVF_CENTROIDS_KEY}:{version}")
+            if centroids is not None:
+                index.set_centroids(centroids, version)
+    if index.size >= max(index.lists * IVF_MIN_PER_LIST, trained_size * 2):
+        schedule_training()
+
+def build_index():
+    if settings.VECTOR_INDEX_BACKEND == 'ivf':
+        return IVFIndex(lists=settings.VECTOR_INDEX_IVF_LISTS, probe=settings.VECTOR_INDEX_IVF_PROBE)
+    return ExactIndex()
+
+_index = None # the published index, read only
+_synced_until = None
+_last_sync = 0.0
+_lock = threading.Lock() # guards the three above, only held to read or swap them
+_sync_lock = threading.Lock() # one sync at a time per process
+
+def sync_index(index, since):
+    from .models import PhotoEmbedding
+
+    current = PhotoEmbedding.objects.filter(model=EMBEDDING_MODEL)
+    rows = current
+    if since is not None:
+        rows = rows.filter(updated_at__gt=since - SYNC_OVERLAP)
+
+    newest = since
+    ids, vectors = [], []
+    for photo_id, vector, updated_at in rows.values_list('photo_id', 'vector', 'updated_at').iterator(chunk_size=2000):
+        ids.append(photo_id)
+        vectors.append(decode_embedding(vector))
+        if newest is None or updated_at > newest:
+            newest = updated_at
+        if len(ids) >= 2000:
+            index.upsert(ids, vectors)
+            ids, vectors = [], []
+    if ids:
+        index.upsert(ids, vectors)
+
+    # every current row is in the index now, anything extra is gone from the table
+    if current.count() < index.size:
+        live = set(current.values_list('photo_id', flat=True))
+        index.remove([photo_id for photo_id in index.positions if photo_id not in live])
+    return newest
+
+def refresh_index():
+    # builds or syncs a fork outside _lock, then swaps it in. False if another thread is at it
+    global _index, _synced_until, _last_sync
+    if not _sync_lock.acquire(blocking=False):
+        return False
+    try:
+        with _lock:
+            index, synced_until = _index, _synced_until
+        index = build_index() if index is None else index.fork()
+        synced_until = sync_index(index, synced_until)
+        if isinstance(index, IVFIndex):
+            sync_centroids(index)
+        with _lock:
+            _index, _synced_until, _last_sync = index, synced_until, time.monotonic()
+        return True
+    finally:
+        _sync_lock.release()
+
+def _refresh_in_background():
+    try:
+        refresh_index()
+    finally:
+        connection.close() # this thread's own connection
+
+def warm_index():
+    # called by the web server entry points (config/asgi.py, config/wsgi.py), so the
+    # first build is done before the first search instead of inside it
+    if not _sync_lock.locked():
+        threading.Thread(target=_refresh_in_background, name='vector-index-sync', daemon=True).start()
+
+def get_index():
+    # the published index, never waits: a due sync is started in the background and
+    # picked up by a later search. None until the first build is done
+    with _lock:
+        index, last_sync = _index, _last_sync
+    if time.monotonic() - last_sync >= settings.VECTOR_INDEX_SYNC_INTERVAL:
+        warm_index()
+    return index
+
+def store_embedding(photo_id, vector):
+    from .models import PhotoEmbedding
+
+    PhotoEmbedding.objects.update_or_create(
+        photo_id=photo_id,
+        defaults={'vector': encode_embedding(vector), 'model': EMBEDDING_MODEL},
+    )
+
+def similar_photos(photo_id, k):
+    # [(photo_id, score), ...] best first, without the photo itself. None = no embedding yet
+    from .models import PhotoEmbedding
+
+    index = get_index()
+    if index is None:
+        raise IndexNotReady()
+    query = index.vector(photo_id)
+    if query is None:
+        stored = PhotoEmbedding.objects.filter(photo_id=photo_id, model=EMBEDDING_MODEL).values_list('vector', flat=True).first()
+        if stored is None:
+            return None
+        query = decode_embedding(stored)
+    matches = index.search(query, k + 1)
+    return [(other_id, score) for other_id, score in matches if other_id != photo_id][:k]
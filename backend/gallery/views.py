@@ -1,24 +1,43 @@
 import os
+import time
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.http import FileResponse
+from django.views.decorators.http import require_GET
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.urls import reverse
 from rest_framework import viewsets, permissions, parsers, generics, status
 from rest_framework.response import Response
-from .filters import PhotoFilter
-from .models import Photo, Album, Event
-from .serializers import PhotoSerializer, AlbumSerializer, EventSerializer, PublicAlbumSerializer, UserTagSerializer, PublicPhotoShareSerializer
-from .permissions import IsEventCoordinatorOrAdmin, CanUploadPhotoOrCreateAlbum
+from .filters import PhotoFilter, parse_bbox
+from .models import Photo, Album, Event, PhotoDeletionJob
+from .serializers import PhotoSerializer, AlbumSerializer, EventSerializer, UserTagSerializer, PublicPhotoShareSerializer, PhotoCardSerializer
+from .permissions import IsEventCoordinatorOrAdmin, CanUploadPhotoOrCreateAlbum, sees_exact_location, public_coordinate
+from .admission import check_upload_admission, UploadsPaused, REJECT, DEFER
+from django.conf import settings
+from config.cache_utils import cached_response
+from .sharing import shared_album_response, shared_photo_response
+from .conditional import ConditionalGetMixin
+from .vector_index import similar_photos, IndexNotReady, INDEX_RETRY_AFTER
+from .clustering import accept_draft
+from .renditions import watermark_is_current, LOCK_TIMEOUT, WATERMARK_RETRY_AFTER
+from .metadata import extract_metadata, photo_fields
+from .map_clusters import clusters
+from .resize import resized_response
+from .tasks import cluster_event_scenes, delete_photos, watermark_photo
+from config.celery import PRIORITY_INTERACTIVE
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from .ai_utils import generate_tags  
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Count, Q
+from interactions.models import Like
 from rest_framework.decorators import action, permission_classes, api_view
 
 User = get_user_model()
 
 # we use ViewSets as we need CRUD op for these models
 
-class PhotoViewSet(viewsets.ModelViewSet):
+class PhotoViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Photo.objects.all().order_by('-uploaded_at')
     serializer_class = PhotoSerializer
     parser_classes = [
@@ -46,6 +65,13 @@ class PhotoViewSet(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
+
+    # 304 when nothing changed, validated before anything is serialized (gallery/conditional.py)
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, lambda: super(PhotoViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, lambda: super(PhotoViewSet, self).retrieve(request, *args, **kwargs))
     
     @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def download(self, request, pk=None):
@@ -54,13 +80,89 @@ class PhotoViewSet(viewsets.ModelViewSet):
         if not photo.image or not os.path.exists(photo.image.path):
             return Response({"error": "File not found"}, status=404)
 
-        file_handle = open(photo.image.path, 'rb')
+        # downloads get the watermarked copy. a full resolution render is too slow for the
+        # request, the first download queues it on the encode lane and the client comes back
+        if not watermark_is_current(photo):
+            if cache.add(f"watermark_queued:{photo.id}", 1, LOCK_TIMEOUT):
+                watermark_photo.apply_async((photo.id,), {'enqueued_at': time.time()}, priority=PRIORITY_INTERACTIVE)
+            response = Response({"error": "Photo is being prepared, try again shortly"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(WATERMARK_RETRY_AFTER)
+            return response
+
+        file_handle = photo.display_image.open('rb')
         filename = os.path.basename(photo.image.name)
+        if photo.display_image != photo.image:
+            filename = f"{os.path.splitext(filename)[0]}.jpg"
 
         # as_attachment auto adds Content-Disposition: attachment header for download
         response = FileResponse(file_handle, as_attachment=True, filename=filename)
         return response
 
+    # "more like this": nearest neighbours by tagger embedding, limited to what the viewer can see
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def similar(self, request, pk=None):
+        photo = self.get_object()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            limit = 20
+
+        # over-fetch, some neighbours may be filtered out below
+        try:
+            matches = similar_photos(photo.id, limit * 3)
+        except IndexNotReady:
+            response = Response({"error": "Similarity search is starting up, try again shortly"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(INDEX_RETRY_AFTER)
+            return response
+        if matches is None:
+            return Response({"error": "Photo has not been analysed yet"}, status=status.HTTP_409_CONFLICT)
+
+        visible = self.get_queryset().filter(id__in=[photo_id for photo_id, _ in matches]).in_bulk()
+        results = [(visible[photo_id], score) for photo_id, score in matches if photo_id in visible][:limit]
+
+        serializer = PhotoCardSerializer([p for p, _ in results], many=True, context=self.get_serializer_context())
+        return Response([
+            {**card, 'score': round(score, 4)}
+            for card, (_, score) in zip(serializer.data, results)
+        ])
+
+    # photo map: ?bbox=min_lon,min_lat,max_lon,max_lat&zoom=<0-13>[&event=<id>], clusters per grid
+    # cell, cached per tile (gallery/map_clusters.py). too wide a viewport is answered at a lower zoom
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def map(self, request):
+        bbox = parse_bbox(request.query_params.get('bbox', '-180,-90,180,90'))
+        try:
+            zoom = int(request.query_params.get('zoom', 0))
+            event_id = int(request.query_params['event']) if request.query_params.get('event') else None
+        except ValueError:
+            return Response({"error": "zoom and event must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        zoom, cells = clusters(bbox, zoom, event_id)
+        return Response({
+            'zoom': zoom,
+            'clusters': [
+                {
+                    'count': cell['count'],
+                    'latitude': cell['latitude'],
+                    'longitude': cell['longitude'],
+                    'photo': {
+                        'id': cell['photo_id'],
+                        'thumbnail': request.build_absolute_uri(default_storage.url(cell['thumbnail'])) if cell['thumbnail'] else None,
+                        'dominant_color': cell['dominant_color'],
+                    },
+                }
+                for cell in cells
+            ],
+        })
+
+    def create(self, request, *args, **kwargs):
+        # shed load before reading the upload when processing is too far behind
+        decision = check_upload_admission()
+        if decision == REJECT:
+            raise UploadsPaused(wait=settings.UPLOAD_RETRY_AFTER)
+        self.defer_processing = decision == DEFER
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         album = self.request.data.get('album')
         event = self.request.data.get('event')
@@ -76,19 +178,17 @@ class PhotoViewSet(viewsets.ModelViewSet):
                 event_instance = Event.objects.get(pk=event)
             except Event.DoesNotExist:
                 event_instance = None
-        instance = serializer.save(
+        # header only, so date/location/size are there before processing (or while deferred)
+        upload = serializer.validated_data.get('image')
+        metadata = photo_fields(extract_metadata(upload)) if upload else {}
+        # thumbnail, watermark and AI tagging are queued by gallery.signals
+        serializer.save(
             photographer=self.request.user,
-            event=event_instance
+            event=event_instance,
+            processing_deferred=getattr(self, 'defer_processing', False),
+            **metadata
         )
 
-        try:
-            tags = generate_tags(instance.image.path)
-            if tags:
-                instance.auto_tags = tags
-                instance.save()
-        except Exception as e:
-            print(f"Error generating AI tags: {e}")
-
     def perform_update(self, serializer):
         # Only allow owner/photographer to update tagged users
         photo = self.get_object()
@@ -127,7 +227,7 @@ class PhotoViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-class AlbumViewSet(viewsets.ModelViewSet):
+class AlbumViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Album.objects.all().order_by('-created_at')
     serializer_class = AlbumSerializer
 
@@ -140,13 +240,72 @@ class AlbumViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['event', 'owner'] # NOW WE CAN DO /api/gallery/albums/?event=1
     search_fields = ['name', 'description']
+    conditional_relations = ['photos', 'suggested_photos']
+    conditional_namespaces = ['album:{pk}']
+
+    def get_queryset(self):
+        # suggested (draft) albums are only visible to the coordinator reviewing them
+        return Album.objects.exclude(Q(is_draft=True) & ~Q(owner=self.request.user)).order_by('-created_at')
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-class EventViewSet(viewsets.ModelViewSet):
+    # publishes a suggested album, its suggested photos move into it.
+    # discarding one is a plain DELETE, the photos only lose the suggestion
+    @action(detail=True, methods=['post'])
+    def accept(self, request, pk=None):
+        album = self.get_object()
+        if album.owner_id != request.user.id or not album.is_draft:
+            return Response({"error": "Only a draft album's owner can accept it"}, status=status.HTTP_403_FORBIDDEN)
+        accept_draft(album)
+        return Response(AlbumSerializer(album, context=self.get_serializer_context()).data)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, lambda: super(AlbumViewSet, self).list(request, *args, **kwargs))
+
+    # per user, the nested photos carry is_liked
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, lambda: cached_response(
+            request, 'albums:detail', [f"album:{kwargs['pk']}", 'people'],
+            lambda: super(AlbumViewSet, self).retrieve(request, *args, **kwargs),
+            per_user=True,
+        ))
+
+def embedded_photos(events):
+    for event in events:
+        yield from event['photos']
+        for album in event['albums']:
+            yield from album['photos']
+
+def with_like_state(request, response):
+    # likes_count / is_liked of every photo in an event list payload, two queries
+    if response.status_code != 200:
+        return response
+    data = response.data
+    photos = list(embedded_photos(data['results'] if isinstance(data, dict) else data))
+    photo_ids = {photo['id'] for photo in photos}
+    counts = dict(Like.objects.filter(photo_id__in=photo_ids).order_by().values_list('photo_id').annotate(count=Count('id')))
+    liked = set(Like.objects.filter(user=request.user, photo_id__in=photo_ids).values_list('photo_id', flat=True))
+    for photo in photos:
+        photo['likes_count'] = counts.get(photo['id'], 0)
+        photo['is_liked'] = photo['id'] in liked
+    return response
+
+def with_location_privacy(request, response):
+    # the shared event list holds exact gps, rounded here for whoever may not see it
+    if response.status_code != 200:
+        return response
+    data = response.data
+    for photo in embedded_photos(data['results'] if isinstance(data, dict) else data):
+        if not sees_exact_location(request.user, photo['photographer']):
+            photo['latitude'], photo['longitude'] = public_coordinate(photo['latitude']), public_coordinate(photo['longitude'])
+    return response
+
+class EventViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Event.objects.all().order_by('-date')
     serializer_class = EventSerializer
+    conditional_relations = ['photos', 'albums', 'albums__photos']
+    conditional_namespaces = ['event:{pk}']
 
     def get_permissions(self):
         if self.action == 'create':
@@ -156,6 +315,38 @@ class EventViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(coordinator=self.request.user)
 
+    # runs scene clustering now instead of waiting for the next upload burst
+    @action(detail=True, methods=['post'], url_path='suggest-albums')
+    def suggest_albums(self, request, pk=None):
+        event = self.get_object()
+        if event.coordinator_id != request.user.id and not request.user.is_staff:
+            return Response({"error": "Only the event coordinator can do this"}, status=status.HTTP_403_FORBIDDEN)
+        cluster_event_scenes.apply_async((event.id,), priority=PRIORITY_INTERACTIVE)
+        return Response({"detail": "Album suggestions are being generated."}, status=status.HTTP_202_ACCEPTED)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['skip_like_state'] = True # with_like_state fills it in
+            context['skip_location_privacy'] = True # with_location_privacy rounds per viewer
+        return context
+
+    # conditional first (304 without serializing), then the response cache.
+    # one cached list for everyone, invalidated by gallery.signals / users.signals.
+    # likes don't drop it: counts and is_liked are filled in per request
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, lambda: with_location_privacy(request, with_like_state(request, cached_response(
+            request, 'events:list', ['events', 'people'],
+            lambda: super(EventViewSet, self).list(request, *args, **kwargs),
+        ))))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, lambda: cached_response(
+            request, 'events:detail', [f"event:{kwargs['pk']}", 'people'],
+            lambda: super(EventViewSet, self).retrieve(request, *args, **kwargs),
+            per_user=True,
+        ))
+
 class UserSearchView(generics.ListAPIView):
     serializer_class = UserTagSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -178,13 +369,8 @@ class UserSearchView(generics.ListAPIView):
 @permission_classes([permissions.AllowAny])
 def view_shared_album(request,share_token):
         
-    album = get_object_or_404(Album, share_token=share_token)
-
-    if not album.is_public:
-        return Response({"error": "Album is not public"}, status=403)
-    
-    serializer = PublicAlbumSerializer(album, context={'request': request})
-    return Response(serializer.data)
+    # pre-rendered + cached per token, see gallery/sharing.py
+    return shared_album_response(request, share_token)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -200,15 +386,16 @@ def toggle_public_link(request,album_id):
         "full_url": f"http://localhost:8000/share/{album.share_token}" if album.is_public else None
     })
 
-from django.shortcuts import render
-
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def view_shared_photo(request, share_token):
-    photo = get_object_or_404(Photo, share_token=share_token)
-    if not photo.is_public:
-        return render(request, 'shared_photo.html', {'error': 'Photo is not public'}, status=403)
-    return render(request, 'shared_photo.html', {'photo': photo})
+    return shared_photo_response(request, share_token)
+
+# public on purpose: <img> tags can't send a token, the url itself is signed (gallery/resize.py).
+# plain django view, DRF's content negotiation has no business with image Accept headers
+@require_GET
+def resized_image(request, name):
+    return resized_response(request, name)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -222,6 +409,22 @@ def toggle_public_photo_link(request, photo_id):
         "full_url": f"http://localhost:8000/share/photos/{photo.share_token}" if photo.is_public else None
     })
 
+def deletion_job_payload(job, request):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'total': job.total,
+        'deleted': job.deleted,
+        'files_deleted': job.files_deleted,
+        'files_failed': job.files_failed,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+        'status_url': request.build_absolute_uri(reverse('mass_delete_status', args=[job.id])),
+    }
+
+# deleting is a background job (gallery/deletion.py), a whole event is too much for a request.
+# answers 202 right away, progress is polled from status_url
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated, IsEventCoordinatorOrAdmin])
 def mass_delete_photos(request):
@@ -229,6 +432,23 @@ def mass_delete_photos(request):
 
     if not isinstance(ids, list):
         return Response({'detail': 'Invalid data.'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    Photo.objects.filter(id__in=ids).delete()
-    return Response({'detail': 'Deleted successfully.'}, status=status.HTTP_200_OK)
\ No newline at end of file
+    try:
+        ids = {int(photo_id) for photo_id in ids}
+    except (TypeError, ValueError):
+        return Response({'detail': 'Invalid data.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # only the ones that exist, so total is what the job will actually delete
+    photo_ids = list(Photo.objects.filter(id__in=ids).order_by('id').values_list('id', flat=True))
+    job = PhotoDeletionJob.objects.create(requested_by=request.user, photo_ids=photo_ids, total=len(photo_ids))
+    transaction.on_commit(lambda: delete_photos.apply_async((job.id,), priority=PRIORITY_INTERACTIVE))
+    return Response(deletion_job_payload(job, request), status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsEventCoordinatorOrAdmin])
+def mass_delete_status(request, job_id):
+    # a coordinator only sees the jobs they started
+    jobs = PhotoDeletionJob.objects.all()
+    if not (request.user.is_staff or request.user.role == 'Admin'):
+        jobs = jobs.filter(requested_by=request.user)
+    job = get_object_or_404(jobs, id=job_id)
+    return Response(deletion_job_payload(job, request))
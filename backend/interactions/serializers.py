@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from interactions.models import Comment, Like
+from gallery.resize import resize_url
 
 class CommentSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.full_name')
+    user_avatar = serializers.SerializerMethodField()
     # for replies , we recursively call using this method field
     replies = serializers.SerializerMethodField()
     # likes on a comment
@@ -30,6 +32,9 @@ class CommentSerializer(serializers.ModelSerializer):
         if request and request.user.is_authenticated:
             return obj.likes.filter(id=request.user.id).exists()
         return False
+
+    def get_user_avatar(self, obj):
+        return resize_url(obj.user.profile_picture, 64, 64, fit='cover', request=self.context.get('request'))
     
 class LikeSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.full_name')
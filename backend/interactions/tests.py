@@ -1,3 +1,34 @@
+import datetime
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from gallery.models import Event, Photo
+from .models import Comment
 
-# Create your tests here.
+User = get_user_model()
+
+
+class CommentListTests(TestCase):
+    def setUp(self):
+        self.photographer = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.photographer)
+        self.photo = Photo.objects.create(event=event, image='event_photos/a.jpg', photographer=self.photographer, is_processed=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.photographer)
+
+    def test_reply_authors_are_not_fetched_one_by_one(self):
+        comment = Comment.objects.create(user=self.photographer, photo=self.photo, content='first')
+        for i in range(3):
+            fan = User.objects.create_user(email=f'fan{i}@example.com', password='x', role='Member', full_name=f'Fan {i}')
+            Comment.objects.create(user=fan, photo=self.photo, parent=comment, content='reply')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/interactions/photos/{self.photo.id}/comments/')
+        replies = response.data['results'][0]['replies']
+        self.assertEqual(sorted(reply['user'] for reply in replies), ['Fan 0', 'Fan 1', 'Fan 2'])
+
+        user_table = User._meta.db_table
+        lookups = [q['sql'] for q in queries if f'FROM "{user_table}" WHERE' in q['sql']]
+        self.assertEqual(lookups, [])
@@ -8,6 +8,7 @@ from django.shortcuts import get_object_or_404
 from gallery.models import Photo
 from notifications.models import Notification
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Prefetch
 
 class CommentListCreateView(generics.ListCreateAPIView):
     serializer_class = CommentSerializer
@@ -15,7 +16,13 @@ class CommentListCreateView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         photo_id = self.kwargs['photo_id']
-        return Comment.objects.filter(photo_id=photo_id, parent=None).order_by('-created_at')
+        # replies come along in one query, with their authors for the avatar
+        return (
+            Comment.objects.filter(photo_id=photo_id, parent=None)
+            .select_related('user')
+            .prefetch_related(Prefetch('replies', queryset=Comment.objects.select_related('user')))
+            .order_by('-created_at')
+        )
     
     def perform_create(self, serializer):
         photo = get_object_or_404(Photo, id=self.kwargs['photo_id'])
@@ -1,41 +1,131 @@
 # similar to django view but for websockets!
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 
 from urllib.parse import parse_qs
-import jwt
 from django.conf import settings
 from users.models import CustomUser
 from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .utils import get_missed_notifications
+
+# missed notifications are replayed in batches of this size on reconnect
+REPLAY_BATCH_SIZE = 25
+
+# small per-process cache of {user_id: (is_active, expires_at)} so a
+# connect never needs the db once we've seen the user recently
+USER_STATE_TTL = 300
+USER_STATE_MAX = 10000
+_user_state_cache = {}
+
+def get_user_id_from_token(token):
+    # signature, expiry and token type are all checked from the claims alone
+    try:
+        access = AccessToken(token)
+    except TokenError as e:
+        print(f"WebSocket JWT auth error: {e}")
+        return None
+    return access.get(jwt_settings.USER_ID_CLAIM)
+
+def remember_user_state(user_id, is_active):
+    if len(_user_state_cache) >= USER_STATE_MAX:
+        # dicts keep insertion order so this drops the oldest entry
+        _user_state_cache.pop(next(iter(_user_state_cache)))
+    _user_state_cache[user_id] = (is_active, time.monotonic() + USER_STATE_TTL)
+
+def cached_user_state(user_id):
+    entry = _user_state_cache.get(user_id)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+def load_user_state(user_id):
+    is_active = CustomUser.objects.filter(id=user_id).values_list('is_active', flat=True).first()
+    remember_user_state(user_id, bool(is_active))
+    return bool(is_active)
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        # Debug: try to get user from JWT token in query string
         query_string = self.scope['query_string'].decode()
-        token = parse_qs(query_string).get('token', [None])[0]
-        self.user = None
-        if token:
-            try:
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                user_id = payload.get('user_id') or payload.get('user') or payload.get('user_pk') or payload.get('userId')
-                if user_id:
-                    self.user = await sync_to_async(CustomUser.objects.get)(id=user_id)
-            except Exception as e:
-                print(f"WebSocket JWT auth error: {e}")
-                
-        if not self.user or self.user.is_anonymous:
+        # id of the newest notification the client already has (sent on reconnect)
+        last_seen = parse_qs(query_string).get('last_seen', [None])[0]
+
+        self.user_id = await self.authenticate()
+        if not self.user_id:
             await self.close()
-        else:
-            # we create a user specific grp
-            self.group_name = f'notifications_{self.user.id}'
-            # channel layer is set to redis (settings.py)
-            await self.channel_layer.group_add(
-                self.group_name,
-                self.channel_name #unique connection id
-            )
-            await self.accept()
+            return
+
+        # we create a user specific grp
+        await self.join(f'notifications_{self.user_id}')
+
+        # joined the group before replaying so nothing falls in between,
+        # clients dedupe by id in case something arrives twice
+        if last_seen and last_seen.isdigit():
+            await self.replay_missed(int(last_seen))
+
+    async def authenticate(self):
+        query_string = self.scope['query_string'].decode()
+        token = parse_qs(query_string).get('token', [None])[0]
+
+        user_id = get_user_id_from_token(token) if token else None
+        if not user_id:
+            return None
+        is_active = cached_user_state(user_id)
+        if is_active is None:
+            is_active = await sync_to_async(load_user_state)(user_id)
+        return user_id if is_active else None
+
+    async def join(self, group_name):
+        self.group_name = group_name
+        # channel layer is set to redis (settings.py)
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name #unique connection id
+        )
+        await self.accept()
+
+        self.last_activity = time.monotonic()
+        self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+
+    # pings the client and evicts sockets that stopped answering, so dead
+    # mobile connections dont pile up in the process and the redis groups
+    async def heartbeat(self):
+        interval = settings.WEBSOCKET_HEARTBEAT_INTERVAL
+        idle_timeout = settings.WEBSOCKET_IDLE_TIMEOUT
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                if time.monotonic() - self.last_activity > idle_timeout:
+                    await self.close(code=4000)
+                    return
+                await self.send(text_data=json.dumps({'type': 'ping'}))
+        except asyncio.CancelledError:
+            pass
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # clients answer pings with {"type": "pong"}, any frame counts as activity
+        self.last_activity = time.monotonic()
+
+    async def replay_missed(self, last_seen):
+        missed, truncated = await sync_to_async(get_missed_notifications)(self.user_id, last_seen)
+
+        batches = [missed[i:i + REPLAY_BATCH_SIZE] for i in range(0, len(missed), REPLAY_BATCH_SIZE)] or [[]]
+        for i, batch in enumerate(batches):
+            await self.send(text_data=json.dumps({
+                'type': 'replay',
+                'notifications': batch,
+                'final': i == len(batches) - 1,
+                # more was missed than we replay, client should refetch the inbox
+                'truncated': truncated,
+            }))
     
     async def disconnect(self, close_code):
+        if hasattr(self, 'heartbeat_task'):
+            self.heartbeat_task.cancel()
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(
                 self.group_name,
@@ -54,4 +144,9 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         """
         await self.send(text_data=json.dumps(message))
 
-
+    # sent straight to the uploader when their photo finishes processing
+    async def photo_processed(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'photo_processed',
+            'photo': event['photo']
+        }))
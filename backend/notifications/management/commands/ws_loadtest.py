@@ -0,0 +1,117 @@
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from notifications.routing import websocket_urlpatterns
+from notifications.consumers import remember_user_state
+from config.perf_utils import summarize
+
+# python manage.py ws_loadtest --connections 5000 --users 1000 --json ws_report.json
+# runs entirely in-process against the in-memory channel layer, no redis/db needed
+
+class Command(BaseCommand):
+    help = "Opens many concurrent notification sockets and reports connect latency, fan-out latency and memory per connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=0, help="distinct users, sockets are spread across them (default: one per socket)")
+        parser.add_argument('--batch', type=int, default=250, help="sockets opened concurrently per batch")
+        parser.add_argument('--rounds', type=int, default=3, help="fan-out rounds")
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--json', dest='json_path', default='', help="also write the report to this file")
+
+    def handle(self, *args, **options):
+        layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 1000}}}
+        with override_settings(CHANNEL_LAYERS=layers, WEBSOCKET_HEARTBEAT_INTERVAL=3600):
+            report = asyncio.run(self.run(options))
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    async def run(self, options):
+        connections = options['connections']
+        users = options['users'] or connections
+        timeout = options['timeout']
+        application = URLRouter(websocket_urlpatterns)
+
+        # identity comes from the token claims, user state is primed so no db is touched
+        tokens = {}
+        for user_id in range(1, users + 1):
+            token = AccessToken()
+            token[jwt_settings.USER_ID_CLAIM] = user_id
+            tokens[user_id] = str(token)
+            remember_user_state(user_id, True)
+
+        gc.collect()
+        tracemalloc.start()
+        mem_before = tracemalloc.get_traced_memory()[0]
+
+        sockets = []
+        connect_times = []
+        failed = 0
+
+        async def open_socket(user_id):
+            communicator = WebsocketCommunicator(application, f"/ws/notifications/?token={tokens[user_id]}")
+            started = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=timeout)
+            return communicator, user_id, connected, time.perf_counter() - started
+
+        started = time.perf_counter()
+        for offset in range(0, connections, options['batch']):
+            batch = range(offset, min(offset + options['batch'], connections))
+            results = await asyncio.gather(*[open_socket(i % users + 1) for i in batch])
+            for communicator, user_id, connected, elapsed in results:
+                if connected:
+                    sockets.append((communicator, user_id))
+                    connect_times.append(elapsed)
+                else:
+                    failed += 1
+        connect_wall = time.perf_counter() - started
+
+        gc.collect()
+        mem_after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # fan-out: one group_send per user group, timed until every socket has it
+        channel_layer = get_channel_layer()
+        fanout_times = []
+        round_walls = []
+        for round_no in range(options['rounds']):
+            round_started = time.perf_counter()
+
+            async def receive(communicator):
+                while True:
+                    message = await communicator.receive_json_from(timeout=timeout)
+                    if message.get('type') != 'ping':
+                        return time.perf_counter() - round_started
+
+            for user_id in {user_id for _, user_id in sockets}:
+                await channel_layer.group_send(f"notifications_{user_id}", {
+                    'type': 'send_notification',
+                    'message': {'id': round_no, 'verb': 'load test'},
+                })
+            fanout_times.extend(await asyncio.gather(*[receive(c) for c, _ in sockets]))
+            round_walls.append(time.perf_counter() - round_started)
+
+        await asyncio.gather(*[c.disconnect() for c, _ in sockets])
+
+        open_count = len(sockets)
+        return {
+            'connections': open_count,
+            'failed': failed,
+            'users': users,
+            'connect': {**summarize(connect_times), 'wall_s': round(connect_wall, 3)},
+            'fanout': {**summarize(fanout_times), 'rounds': options['rounds'], 'round_wall_ms': [round(w * 1000, 3) for w in round_walls]},
+            # includes the test communicators, so read it as an upper bound
+            'memory_per_connection_kb': round((mem_after - mem_before) / max(open_count, 1) / 1024, 2),
+        }
@@ -31,13 +31,10 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # inbox and unread queries filter on recipient + is_read and page by created_at
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', '-created_at'], name='notif_inbox_idx'),
+        ]
 
     def __str__(self):
         return f"{self.actor} {self.verb} {self.content_object}"
-
-
-
-
-
-
-
@@ -2,6 +2,7 @@ from .models import Notification
 from rest_framework import serializers
 from users.serializers import CustomUserSerializer
 from gallery.models import Photo
+from gallery.resize import resize_url
 from interactions.models import Comment, Like
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -45,6 +46,12 @@ class NotificationSerializer(serializers.ModelSerializer):
             
         return None
     
+    def preview_url(self, photo):
+        # small square for the bell dropdown instead of the full size image
+        if not photo or not photo.image:
+            return None
+        return resize_url(photo.display_image, 160, 160, fit='cover', request=self.context.get('request'))
+
     def get_target(self, obj):
         # Photo target
         if isinstance(obj.content_object, Photo):
@@ -52,7 +59,7 @@ class NotificationSerializer(serializers.ModelSerializer):
                 'type': 'photo',
                 'id': obj.content_object.id,
                 'title': obj.content_object.description or f"Photo {obj.content_object.id}",
-                'image': obj.content_object.image.url if obj.content_object.image else None
+                'image': self.preview_url(obj.content_object)
             }
         # Comment target - include photo image for thumbnail
         if isinstance(obj.content_object, Comment):
@@ -62,7 +69,7 @@ class NotificationSerializer(serializers.ModelSerializer):
                 'id': obj.content_object.id,
                 'content': obj.content_object.content,
                 'photo_id': photo.id if photo else None,
-                'image': photo.image.url if photo and photo.image else None,
+                'image': self.preview_url(photo),
                 'user': str(obj.content_object.user)
             }
         # Fallback for unknown types
@@ -1,21 +1,23 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from asgiref.sync import async_to_sync # sync django calls async channels
-from channels.layers import get_channel_layer # to access redis layer
+from config.channel_utils import group_send # reuses one loop + redis pool per process
 from django.contrib.contenttypes.models import ContentType
 from .serializers import NotificationSerializer
 from .models import Notification
+from .utils import incr_unread_count, push_recent_notification
 from gallery.models import Photo
 from interactions.models import Like, Comment
 
 def send_socket_message(notification,recipient):
-    channel_layer = get_channel_layer()
     group_name = f"notifications_{recipient.id}"
 
     serializer = NotificationSerializer(notification)
     data = serializer.data
 
-    async_to_sync(channel_layer.group_send)(
+    # kept so a reconnecting client can replay what it missed
+    push_recent_notification(recipient.id, data)
+
+    group_send(
         group_name,
         {
             'type': 'send_notification', # maps to the method in consumers.py
@@ -23,6 +25,17 @@ def send_socket_message(notification,recipient):
         }
     )
 
+# keeps the cached unread badge in step without recounting
+@receiver(post_save, sender=Notification)
+def bump_unread_count(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        incr_unread_count(instance.recipient_id)
+
+@receiver(post_delete, sender=Notification)
+def drop_unread_count(sender, instance, **kwargs):
+    if not instance.is_read:
+        incr_unread_count(instance.recipient_id, -1)
+
 @receiver(post_save, sender=Like)
 def notify_on_like(sender, instance, created, **kwargs):
     if not created:
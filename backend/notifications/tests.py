@@ -1,3 +1,196 @@
-from django.test import TestCase
+import asyncio
+import datetime
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from gallery.models import Event, Photo
+from . import consumers
+from .models import Notification
+from .utils import REPLAY_LIMIT, get_missed_notifications, push_recent_notification, recent_buffer_key
 
-# Create your tests here.
+User = get_user_model()
+
+
+class NotificationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+        self.actor = User.objects.create_user(email='fan@example.com', password='x', role='Member')
+        event = Event.objects.create(name='Launch', date=datetime.date(2026, 1, 1), location='Hall', coordinator=self.user)
+        self.photo = Photo.objects.create(event=event, image='event_photos/a.jpg', photographer=self.user, is_processed=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, **fields):
+        return Notification.objects.create(
+            recipient=self.user, actor=self.actor, verb='liked your photo',
+            content_type=ContentType.objects.get_for_model(Photo), object_id=self.photo.id, **fields,
+        )
+
+    def unread_count(self):
+        return self.client.get('/api/notifications/unread-count/').data['unread_count']
+
+
+class InboxTests(NotificationTestCase):
+    def test_cursor_pages_walk_the_whole_inbox(self):
+        created = [self.notify() for _ in range(5)]
+
+        seen = []
+        url = '/api/notifications/?page_size=2'
+        while url:
+            page = self.client.get(url).data
+            self.assertLessEqual(len(page['results']), 2)
+            self.assertNotIn('count', page) # no COUNT(*) over the inbox
+            seen.extend(item['id'] for item in page['results'])
+            url = page['next']
+        self.assertEqual(seen, [n.id for n in reversed(created)])
+
+    def test_unread_filter(self):
+        self.notify(is_read=True)
+        unread = self.notify()
+        results = self.client.get('/api/notifications/?unread=true').data['results']
+        self.assertEqual([item['id'] for item in results], [unread.id])
+
+
+class UnreadCountTests(NotificationTestCase):
+    def test_new_notification_bumps_the_count(self):
+        self.assertEqual(self.unread_count(), 0)
+        self.notify()
+        self.notify()
+        self.assertEqual(self.unread_count(), 2)
+
+    def test_mark_read(self):
+        notification = self.notify()
+        self.notify()
+        self.assertEqual(self.unread_count(), 2)
+
+        for _ in range(2): # repeating it doesn't count twice
+            response = self.client.post(f'/api/notifications/{notification.id}/read/')
+            self.assertEqual(response.data['unread_count'], 1)
+        self.assertTrue(Notification.objects.get(id=notification.id).is_read)
+
+    def test_mark_read_of_someone_elses_notification(self):
+        other = Notification.objects.create(
+            recipient=self.actor, actor=self.user, verb='replied to your comment',
+            content_type=ContentType.objects.get_for_model(Photo), object_id=self.photo.id,
+        )
+        self.assertEqual(self.client.post(f'/api/notifications/{other.id}/read/').status_code, 404)
+
+    def test_mark_all_read(self):
+        for _ in range(3):
+            self.notify()
+        response = self.client.post('/api/notifications/mark-all-read/')
+        self.assertEqual((response.data['marked_read'], response.data['unread_count']), (3, 0))
+        self.assertEqual(self.unread_count(), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    def test_reseeded_from_the_db_after_the_cache_is_cleared(self):
+        self.notify()
+        self.notify(is_read=True)
+        self.assertEqual(self.unread_count(), 1)
+
+        cache.clear()
+        self.notify() # a missing counter isn't bumped, the next read seeds it
+        self.assertEqual(self.unread_count(), 2)
+        self.notify()
+        self.assertEqual(self.unread_count(), 3)
+
+
+class ReplayTests(NotificationTestCase):
+    def payload(self, notification):
+        return {'id': notification.id, 'verb': notification.verb}
+
+    def test_served_from_the_buffer_when_it_covers_last_seen(self):
+        notifications = [self.notify() for _ in range(3)]
+        for notification in notifications:
+            push_recent_notification(self.user.id, self.payload(notification))
+
+        with self.assertNumQueries(0):
+            missed, truncated = get_missed_notifications(self.user.id, notifications[0].id)
+        self.assertEqual([item['id'] for item in missed], [n.id for n in notifications[1:]])
+        self.assertFalse(truncated)
+
+    def test_falls_back_to_the_db_below_the_buffer_floor(self):
+        notifications = [self.notify() for _ in range(3)]
+        push_recent_notification(self.user.id, self.payload(notifications[-1])) # buffer starts here
+
+        missed, truncated = get_missed_notifications(self.user.id, 0)
+        self.assertEqual([item['id'] for item in missed], [n.id for n in notifications])
+        self.assertFalse(truncated)
+
+    def test_truncated_at_the_replay_limit(self):
+        Notification.objects.bulk_create([
+            Notification(
+                recipient=self.user, actor=self.actor, verb='liked your photo',
+                content_type=ContentType.objects.get_for_model(Photo), object_id=self.photo.id,
+            )
+            for _ in range(REPLAY_LIMIT + 1)
+        ])
+        missed, truncated = get_missed_notifications(self.user.id, 0)
+        self.assertEqual(len(missed), REPLAY_LIMIT)
+        self.assertTrue(truncated)
+        self.assertIsNone(cache.get(recent_buffer_key(self.user.id))) # a partial result is no buffer
+
+    def test_push_never_waits_for_the_lock(self):
+        first, second = self.notify(), self.notify()
+        push_recent_notification(self.user.id, self.payload(first))
+
+        key = recent_buffer_key(self.user.id)
+        cache.add(f"{key}:lock", 1) # another push is updating it
+        push_recent_notification(self.user.id, self.payload(second))
+        self.assertIsNone(cache.get(key))
+
+        missed, _ = get_missed_notifications(self.user.id, first.id)
+        self.assertEqual([item['id'] for item in missed], [second.id])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WEBSOCKET_HEARTBEAT_INTERVAL=0.05,
+    WEBSOCKET_IDLE_TIMEOUT=0.12,
+)
+class NotificationSocketTests(TestCase):
+    def setUp(self):
+        consumers._user_state_cache.clear()
+        self.user = User.objects.create_user(email='photographer@example.com', password='x', role='Photographer')
+
+    def communicator(self, token):
+        return WebsocketCommunicator(consumers.NotificationConsumer.as_asgi(), f'/ws/notifications/?token={token}')
+
+    async def test_valid_token_connects(self):
+        communicator = self.communicator(AccessToken.for_user(self.user))
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({'type': 'pong'})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'ping'})
+        await communicator.disconnect()
+
+    async def test_invalid_tokens_are_refused(self):
+        expired = AccessToken.for_user(self.user)
+        expired.set_exp(lifetime=-datetime.timedelta(seconds=1))
+        for token in ('', 'not-a-jwt', f'{AccessToken.for_user(self.user)}x', expired):
+            with self.subTest(token=str(token)[:12]):
+                connected, _ = await self.communicator(token).connect()
+                self.assertFalse(connected)
+
+    async def test_inactive_user_is_refused(self):
+        token = AccessToken.for_user(self.user)
+        await User.objects.filter(id=self.user.id).aupdate(is_active=False)
+        connected, _ = await self.communicator(token).connect()
+        self.assertFalse(connected)
+
+    async def test_closed_with_4000_without_pongs(self):
+        communicator = self.communicator(AccessToken.for_user(self.user))
+        await communicator.connect()
+
+        async def closed():
+            while True:
+                output = await communicator.receive_output(1)
+                if output['type'] == 'websocket.close':
+                    return output
+        self.assertEqual((await asyncio.wait_for(closed(), 2))['code'], 4000)
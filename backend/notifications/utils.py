@@ -0,0 +1,114 @@
+from django.core.cache import cache
+from .models import Notification
+from .serializers import NotificationSerializer
+
+# unread badge counter lives in cache so polling it never hits COUNT(*)
+# it is seeded from the db once and then adjusted incrementally
+UNREAD_COUNT_TIMEOUT = 60 * 60  # re-seed at least once an hour to heal any drift
+
+
+def unread_count_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def get_unread_count(user_id):
+    key = unread_count_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        # seeded from the primary, a lagging replica would be cached for the whole timeout
+        count = Notification.objects.using('default').filter(recipient_id=user_id, is_read=False).count()
+        # add() so we dont clobber a value another process seeded in the meantime
+        if not cache.add(key, count, UNREAD_COUNT_TIMEOUT):
+            count = cache.get(key, count)
+    return max(count, 0)
+
+
+def incr_unread_count(user_id, delta=1):
+    # if the key is missing we leave it alone, next read seeds it from the db
+    try:
+        if delta >= 0:
+            cache.incr(unread_count_key(user_id), delta)
+        else:
+            cache.decr(unread_count_key(user_id), -delta)
+    except ValueError:
+        pass
+
+
+def reset_unread_count(user_id):
+    cache.set(unread_count_key(user_id), 0, UNREAD_COUNT_TIMEOUT)
+
+
+# bounded per-user buffer of the most recent socket payloads, used to replay
+# whatever a client missed while reconnecting without touching postgres.
+# buffer = {'floor': id, 'items': [...]} and holds every notification with id > floor
+RECENT_BUFFER_SIZE = 50
+RECENT_BUFFER_TIMEOUT = 60 * 60 * 24
+REPLAY_LIMIT = 200
+BUFFER_LOCK_TIMEOUT = 2  # an update is one get and one set, a holder this slow is gone
+
+
+def recent_buffer_key(user_id):
+    return f"notifications:recent:{user_id}"
+
+
+def _trim_buffer(buffer):
+    overflow = len(buffer['items']) - RECENT_BUFFER_SIZE
+    if overflow > 0:
+        buffer['floor'] = buffer['items'][overflow - 1]['id']
+        buffer['items'] = buffer['items'][overflow:]
+    return buffer
+
+
+def push_recent_notification(user_id, payload):
+    # read-modify-write under a per-user lock: two pushes racing would otherwise lose
+    # one, and the buffer would claim ids above its floor it never saw. this runs in the
+    # request that created the notification, so it never waits for the lock: a push that
+    # finds it taken drops the buffer (the holder too, via the stale mark) and the next
+    # replay reads the db
+    key = recent_buffer_key(user_id)
+    lock = f"{key}:lock"
+    stale = f"{key}:stale"
+    if not cache.add(lock, 1, BUFFER_LOCK_TIMEOUT):
+        cache.set(stale, 1, BUFFER_LOCK_TIMEOUT)
+        cache.delete(key)
+        return
+    try:
+        buffer = cache.get(key)
+        if buffer is None:
+            # nothing older is known, so the buffer starts right below this one
+            buffer = {'floor': payload['id'] - 1, 'items': []}
+        buffer['items'].append(dict(payload))
+        buffer['items'].sort(key=lambda item: item['id'])
+        cache.set(key, _trim_buffer(buffer), RECENT_BUFFER_TIMEOUT)
+        if cache.get(stale):
+            cache.delete(key) # a push gave up on the lock while we held it
+    finally:
+        cache.delete(lock)
+
+
+def get_missed_notifications(user_id, last_seen, limit=REPLAY_LIMIT):
+    """
+    Returns (payloads, truncated) for notifications newer than last_seen,
+    oldest first. Served from the recent buffer when it covers last_seen,
+    otherwise from the db (which then seeds the buffer for the next reconnect).
+    """
+    key = recent_buffer_key(user_id)
+    buffer = cache.get(key)
+    if buffer is not None and last_seen >= buffer['floor']:
+        missed = [item for item in buffer['items'] if item['id'] > last_seen]
+        return missed[:limit], len(missed) > limit
+
+    rows = list(
+        Notification.objects.filter(recipient_id=user_id, id__gt=last_seen)
+        .select_related('actor', 'content_type')
+        .prefetch_related('content_object')
+        .order_by('id')[:limit + 1]
+    )
+    truncated = len(rows) > limit
+    payloads = [dict(item) for item in NotificationSerializer(rows[:limit], many=True).data]
+
+    if not truncated:
+        # we now hold everything after last_seen, which is exactly a valid buffer
+        cache.add(key, _trim_buffer({'floor': last_seen, 'items': list(payloads)}), RECENT_BUFFER_TIMEOUT)
+
+    return payloads, truncated
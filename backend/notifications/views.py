@@ -1,3 +1,62 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import Notification
+from .serializers import NotificationSerializer
+from .utils import get_unread_count, incr_unread_count, reset_unread_count
 
-# Create your views here.
+# cursor pagination walks the (recipient, is_read, created_at) index
+# instead of doing OFFSET scans as the inbox grows
+class NotificationCursorPagination(CursorPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+
+class NotificationListView(generics.ListAPIView):
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationCursorPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(recipient=self.request.user)
+
+        # /api/notifications/?unread=true only returns unread ones
+        if self.request.query_params.get('unread', '').lower() in ('1', 'true'):
+            queryset = queryset.filter(is_read=False)
+
+        return queryset.select_related('actor', 'content_type').prefetch_related('content_object')
+
+class UnreadCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread_count": get_unread_count(request.user.id)}, status=status.HTTP_200_OK)
+
+class MarkAllReadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        # single UPDATE, no rows are loaded into python
+        updated = Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        reset_unread_count(request.user.id)
+        return Response({"marked_read": updated, "unread_count": 0}, status=status.HTTP_200_OK)
+
+class MarkReadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, notification_id):
+        get_object_or_404(Notification, id=notification_id, recipient=request.user)
+
+        # filtering on is_read=False makes a repeated call a no-op for the counter
+        updated = Notification.objects.filter(id=notification_id, is_read=False).update(is_read=True)
+        if updated:
+            incr_unread_count(request.user.id, -1)
+
+        return Response({
+            "id": notification_id,
+            "is_read": True,
+            "unread_count": get_unread_count(request.user.id)
+        }, status=status.HTTP_200_OK)
@@ -1,6 +1,7 @@
-
 from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = 'users'
 
+    def ready(self):
+        import users.signals
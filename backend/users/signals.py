@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from config.cache_utils import bump
+
+User = get_user_model()
+
+# fields that show up in cached responses (profile view, photo payloads)
+CACHED_FIELDS = {'email', 'full_name', 'profile_picture', 'bio', 'role', 'is_verified'}
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, created=False, update_fields=None, **kwargs):
+    # a brand new user isn't in any cached payload yet,
+    # and last_login / otp saves don't change anything we cache
+    if created:
+        return
+    if update_fields and not CACHED_FIELDS.intersection(update_fields):
+        return
+    bump(f'user:{instance.id}', 'people')
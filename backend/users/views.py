@@ -14,6 +14,7 @@ from .permissions import IsOwnerOrReadOnly
 from .utils import send_otp_email
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.conf import settings
+from config.cache_utils import cached_response
 from django.shortcuts import redirect
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -53,6 +54,13 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     lookup_field = 'id' # default is 'pk' but the url uses 'id'
 
+    # same payload for every viewer, invalidated by users.signals
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(
+            request, 'users:profile', [f"user:{kwargs['id']}"],
+            lambda: super(UserProfileView, self).retrieve(request, *args, **kwargs),
+        )
+
 class CurrentUserView(generics.RetrieveUpdateAPIView):
     serializer_class = CustomUserSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -35,34 +35,65 @@ export const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children }
     const [unreadCount, setUnreadCount] = useState(0);
 
     const socketRef = useRef<WebSocket | null>(null);
+    // newest notification id we have, sent as last_seen so a reconnect replays what was missed
+    const lastSeenRef = useRef<number | null>(null);
+    const seenIdsRef = useRef<Set<number>>(new Set());
 
 
     useEffect(() => {
-        const authData = localStorage.getItem('authTokens');
-        if(!authData) return;
-
-        const { access } = JSON.parse(authData);
-
         if(socketRef.current) return; // if already connected
 
-        const wsUrl = `ws://127.0.0.1:8000/ws/notifications/?token=${access}`;
-        const ws = new WebSocket(wsUrl);
-        socketRef.current = ws;
-
-        ws.onopen = () => {
-            console.log("🟢 Connected to Real-time Notifications");
-        };
-
-        ws.onmessage = (event) => {
-            const data = JSON.parse(event.data);
-            handleNewNotification(data);
+        let stopped = false;
+        let retryTimer: ReturnType<typeof setTimeout> | null = null;
+        let retryDelay = 1000;
+
+        const connect = () => {
+            const authData = localStorage.getItem('authTokens');
+            if(!authData) return;
+
+            const { access } = JSON.parse(authData);
+
+            const lastSeen = lastSeenRef.current !== null ? `&last_seen=${lastSeenRef.current}` : '';
+            const wsUrl = `ws://127.0.0.1:8000/ws/notifications/?token=${access}${lastSeen}`;
+            const ws = new WebSocket(wsUrl);
+            socketRef.current = ws;
+
+            ws.onopen = () => {
+                retryDelay = 1000;
+                console.log("🟢 Connected to Real-time Notifications");
+            };
+
+            ws.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                // server heartbeat, answering keeps the socket from being evicted as idle
+                if (data.type === 'ping') {
+                    ws.send(JSON.stringify({ type: 'pong' }));
+                    return;
+                }
+                // what arrived while we were disconnected, added without a toast each
+                if (data.type === 'replay') {
+                    (data.notifications || []).forEach((item: NotificationData) => handleNewNotification(item, true));
+                    return;
+                }
+                // other typed frames (photo_processed) are not notification toasts
+                if (data.type) return;
+                handleNewNotification(data);
+            };
+
+            ws.onclose = () => {
+                socketRef.current = null;
+                if (stopped) return;
+                // reconnect with backoff, last_seen makes the server replay the gap
+                retryTimer = setTimeout(connect, retryDelay);
+                retryDelay = Math.min(retryDelay * 2, 30000);
+            };
         };
 
-        ws.onclose = () => {
-            socketRef.current = null;
-        };
+        connect();
 
         return () => {
+            stopped = true;
+            if (retryTimer) clearTimeout(retryTimer);
             if (socketRef.current) {
             socketRef.current.close();
             socketRef.current = null;
@@ -70,9 +101,16 @@ export const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children }
         };
     }, []);
 
-    const handleNewNotification = (data: NotificationData) => {
+    const handleNewNotification = (data: NotificationData, silent = false) => {
+        if (data.id !== undefined) {
+            // a replay can overlap with frames that arrived live
+            if (seenIdsRef.current.has(data.id)) return;
+            seenIdsRef.current.add(data.id);
+            lastSeenRef.current = Math.max(lastSeenRef.current ?? 0, data.id);
+        }
         setNotifications((prev) => [data, ...prev]);
         setUnreadCount((prev) => prev + 1);
+        if (silent) return;
 
         const actorName = data.actor?.full_name || "Someone";
         const verb = data.verb || "performed an action";
@@ -3,6 +3,7 @@ import { useParams, Link } from 'react-router-dom';
 import { Camera, Aperture, Clock, Gauge, Tag } from 'lucide-react';
 import InteractionBar from '../components/InteractionBar';
 import TaggingComp from '../components/Tagging';
+import axios from 'axios';
 import api from '../api/axios';
 import toast from 'react-hot-toast';
 import {
@@ -41,12 +42,25 @@ const PhotoDetail = () => {
     const [shareUrl, setShareUrl] = useState<string | null>(null);
     const [isPublic, setIsPublic] = useState(false);
 
+    // the watermarked copy is rendered on the first download, wait as long as the server asks
+    const fetchDownload = async () => {
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await api.get(`/api/gallery/photos/${id}/download/`, {
+                    responseType: 'blob' // treats file as binary large object(blob)
+                });
+            } catch (err) {
+                if (!axios.isAxiosError(err) || err.response?.status !== 503 || attempt >= 5) throw err;
+                const wait = Number(err.response.headers['retry-after']) || 5;
+                await new Promise(resolve => setTimeout(resolve, wait * 1000));
+            }
+        }
+    };
+
     const handleDownload = async () => {
         setIsDownloading(true);
         try {
-            const response = await api.get(`/api/gallery/photos/${id}/download/`, {
-                responseType: 'blob' // treats file as binary large object(blob)
-            });
+            const response = await fetchDownload();
             
             const blob = new Blob([response.data]); 
             const url = window.URL.createObjectURL(blob);